@@ -0,0 +1,98 @@
+#!/bin/python
+# -- coding: utf-8 --
+"""
+wall time of parsing one capture with DubboPacketParser against ParallelDubboPacketParser, which reads and decodes
+the capture once and splits the connections across its workers. the cpu time of all processes shows the work added
+by the split, the time to only read the segments is the part that stays in the reading process. the speedup needs
+as many free cpus as workers.
+
+python -m benchmark.dubbo_parallel_bench --connections 64 --calls 200 --workers 2,4
+"""
+import argparse
+import os
+import resource
+import tempfile
+import time
+
+from hessian2.hessian2_output import Hessian2Output
+from parser.dubbo_packet_parser import DubboPacketParser
+from parser.dubbo_parallel_parser import ParallelDubboPacketParser
+from parser.pcap_reader import open_pcap
+from parser.testcase.packets import build_frame, request_body, response_body, write_pcap, Connection
+
+PORT = 20880
+MSS = 1400
+
+
+def _result(call: int, items: int) -> bytes:
+    output = Hessian2Output()
+    output.write_object([
+        {"id": call * items + i, "name": f"item-{i}", "price": i * 1.25, "tags": ["a", "b", str(i)]}
+        for i in range(items)
+    ])
+    return output.to_bytes()
+
+
+def write_capture(file: str, connections: int, calls: int, items: int, noise: int):
+    params = Hessian2Output()
+    params.write_object("query")
+    body = request_body("org.demo.CatalogService", "search", "Ljava/lang/String;", params.to_bytes())
+    packets = []
+    for conn in range(connections):
+        connection = Connection("10.0.0.1", 40000 + conn, "10.0.0.2", PORT)
+        other = Connection("10.0.0.1", 50000 + conn, "10.0.0.3", 8080)
+        for call in range(calls):
+            ts = call + conn * 0.001
+            # traffic on other ports, only read and dropped
+            packets.extend((ts + 0.0001, other.request(b"x" * MSS)) for _ in range(noise))
+            packets.append((ts, connection.request(build_frame(call, body))))
+            reply = build_frame(call, response_body(_result(call, items)), 0x02, 20)
+            for offset in range(0, len(reply), MSS):
+                packets.append((ts + 0.0005, connection.response(reply[offset:offset + MSS])))
+    packets.sort(key=lambda packet: packet[0])
+    write_pcap(file, packets)
+
+
+def _cpu() -> float:
+    usage = [resource.getrusage(who) for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN)]
+    return sum(u.ru_utime + u.ru_stime for u in usage)
+
+
+def _timed(parse) -> tuple[float, float]:
+    """
+    wall and cpu seconds of `parse`, the cpu of the worker processes included once they are joined.
+    """
+    start, cpu = time.perf_counter(), _cpu()
+    parse()
+    return time.perf_counter() - start, _cpu() - cpu
+
+
+def _read(file: str):
+    for _ in open_pcap(file, {PORT}):
+        pass
+
+
+def run(connections: int, calls: int, items: int, noise: int, workers: list[int]):
+    with tempfile.TemporaryDirectory() as directory:
+        file = os.path.join(directory, "dubbo.pcap")
+        write_capture(file, connections, calls, items, noise)
+        print(f"capture {os.path.getsize(file) / 1024 / 1024:.1f} MB, {connections} connections x {calls} calls, "
+              f"{os.cpu_count()} cpus")
+        print(f"  read only     wall {_timed(lambda: _read(file))[0]:.3f}s")
+        single, single_cpu = _timed(DubboPacketParser(file, {PORT}, None).parse)
+        print(f"  1 process     wall {single:.3f}s  cpu {single_cpu:.3f}s")
+        for count in workers:
+            elapsed, cpu = _timed(ParallelDubboPacketParser(file, {PORT}, None, count).parse)
+            print(f"  {count:<2} workers    wall {elapsed:.3f}s  cpu {cpu:.3f}s  speedup {single / elapsed:.2f}x  "
+                  f"cpu overhead {cpu / single_cpu - 1:+.0%}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--connections", type=int, default=64)
+    parser.add_argument("--calls", type=int, default=200)
+    parser.add_argument("--items", type=int, default=20, help="objects in each result")
+    parser.add_argument("--noise", type=int, default=0, help="segments of other traffic per call")
+    parser.add_argument("--workers", type=str, default="2,4")
+    args = parser.parse_args()
+    run(args.connections, args.calls, args.items, args.noise, [int(s) for s in args.workers.split(",")])
@@ -0,0 +1,55 @@
+#!/bin/python
+# -- coding: utf-8 --
+"""
+memory and allocation benchmark for the per-call records built by DubboChannel.
+
+python -m benchmark.dubbo_records_bench --calls 200000
+"""
+import argparse
+import gc
+import time
+import tracemalloc
+
+from parser.dubbo_common import DubboChannel
+from parser.testcase.packets import build_frame
+
+
+def _feed(calls: int, frames_per_packet: int) -> list:
+    request_packet = b"".join(build_frame(i, b"r" * 64) for i in range(frames_per_packet))
+    response_packet = b"".join(build_frame(i, b"s" * 32, 0x02, 20) for i in range(frames_per_packet))
+    channel = DubboChannel(0x0a000001, 40000, 0x0a000002, 20880)
+    pending = []
+    for i in range(0, calls, frames_per_packet):
+        ts = i * 0.001
+        pending.extend(channel.append_and_parse_requests(request_packet, ts))
+        pending.extend(channel.append_and_parse_responses(response_packet, ts + 0.0005))
+    return pending
+
+
+def run(calls: int, frames_per_packet: int):
+    gc.collect()
+    collections = sum(s["collections"] for s in gc.get_stats())
+    start = time.perf_counter()
+    pending = _feed(calls, frames_per_packet)
+    elapsed = time.perf_counter() - start
+    collections = sum(s["collections"] for s in gc.get_stats()) - collections
+    del pending
+    gc.collect()
+    tracemalloc.start()
+    start_memory = tracemalloc.get_traced_memory()[0]
+    pending = _feed(calls, frames_per_packet)
+    memory = tracemalloc.get_traced_memory()[0] - start_memory
+    tracemalloc.stop()
+    print(f"calls={calls} frames/packet={frames_per_packet}")
+    print(f"  time        {elapsed:.3f}s ({calls / elapsed:,.0f} calls/s)")
+    print(f"  retained    {memory / calls:.1f} bytes per call (request + response records)")
+    print(f"  gc runs     {collections}")
+    return pending
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=200000)
+    parser.add_argument("--frames", type=int, default=8, help="frames per tcp segment")
+    args = parser.parse_args()
+    run(args.calls, args.frames)
@@ -0,0 +1,189 @@
+#!/bin/python
+# -- coding: utf-8 --
+"""
+decode throughput benchmark for Hessian2Input over the payload shapes of hessian2/testcase and randomised objects
+written by Hessian2Output, read_object against skip_object and read_object with numeric_arrays, and read_object plus
+json.dumps against the Hessian2JsonTranscoder.
+
+python -m benchmark.hessian2_decode_bench --size 1024 --rounds 5
+"""
+import argparse
+import datetime
+import json
+import random
+import struct
+import time
+
+from hessian2.hessian2_input import Hessian2Input
+from hessian2.hessian2_json import Hessian2JsonTranscoder, json_default
+from hessian2.hessian2_output import Hessian2Output
+
+
+def _string(value: str) -> bytes:
+    encoded = value.encode("utf-8")
+    if len(value) < 32:
+        return bytes([len(value)]) + encoded
+    if len(value) < 1024:
+        return bytes([0x30 + (len(value) >> 8), len(value) & 0xff]) + encoded
+    return b"S" + struct.pack(">H", len(value)) + encoded
+
+
+def _int(value: int) -> bytes:
+    if -0x10 <= value <= 0x2f:
+        return bytes([0x90 + value])
+    if -0x800 <= value <= 0x7ff:
+        return bytes([0xc8 + (value >> 8), value & 0xff])
+    return b"I" + struct.pack(">i", value)
+
+
+def _long(value: int) -> bytes:
+    return b"L" + struct.pack(">q", value)
+
+
+def _double(value: float) -> bytes:
+    return b"D" + struct.pack(">d", value)
+
+
+def _date(millis: int) -> bytes:
+    return b"\x4a" + struct.pack(">q", millis)
+
+
+def _field_value(row: int, field: int) -> bytes:
+    match field % 5:
+        case 0:
+            return _string(f"value-{row}-{field}")
+        case 1:
+            return _int(row * 31 + field)
+        case 2:
+            return _long(row * 1000003 + field)
+        case 3:
+            return _double(row / 7 + field)
+        case _:
+            return _date(1700000000000 + row * 1000)
+
+
+def object_list(rows: int, fields: int) -> bytes:
+    """
+    a typed fixed length list of objects sharing one class definition, like the TestcaseV*ListParser payloads.
+    """
+    out = bytearray(b"C" + _string("org.apache.dubbo.parser.Bean") + _int(fields))
+    for field in range(fields):
+        out += _string(f"field{field}")
+    out += b"V" + _string("java.util.List") + _int(rows)
+    for row in range(rows):
+        out += bytes([0x60])
+        for field in range(fields):
+            out += _field_value(row, field)
+    return bytes(out)
+
+
+def string_map(entries: int) -> bytes:
+    """
+    an untyped map of string keys to strings and ints, like the TestcaseV10MapParser payloads.
+    """
+    out = bytearray(b"H")
+    for entry in range(entries):
+        out += _string(f"key-{entry}")
+        out += _string(f"value-{entry}" * 3) if entry % 2 == 0 else _int(entry)
+    out += b"Z"
+    return bytes(out)
+
+
+def int_list(values: int) -> bytes:
+    out = bytearray(b"\x58" + _int(values))
+    for value in range(values):
+        out += _int(value - values // 2)
+    return bytes(out)
+
+
+def double_array(values: int) -> bytes:
+    """
+    a double[], the way the java encoder writes primitive arrays.
+    """
+    out = bytearray(b"V" + _string("[double") + _int(values))
+    for value in range(values):
+        out += _double(value / 7)
+    return bytes(out)
+
+
+def binary(length: int) -> bytes:
+    """
+    a byte[] split into 32k chunks the way the java encoder writes large arrays.
+    """
+    data = bytes(range(256)) * (length // 256 + 1)
+    out = bytearray()
+    offset = 0
+    while length - offset > 0x8000:
+        out += b"A\x80\x00" + data[offset:offset + 0x8000]
+        offset = offset + 0x8000
+    out += b"B" + struct.pack(">H", length - offset) + data[offset:length]
+    return bytes(out)
+
+
+def random_objects(rows: int, seed: int = 0) -> bytes:
+    """
+    a list of objects with randomised values of every kind and nested lists and maps, written by Hessian2Output.
+    """
+    rng = random.Random(seed)
+    output = Hessian2Output()
+    output.add_ref(None)
+    output.write_list_begin(rows, "java.util.List")
+    for row in range(rows):
+        output.write_instance("org.apache.dubbo.parser.Order", {
+            "id": rng.randint(0, 1 << 40),
+            "status": rng.choice([None, True, False]),
+            "name": "".join(rng.choice("abcdefgh中文é") for _ in range(rng.randint(0, 40))),
+            "amount": rng.randint(-100000, 100000) / 100,
+            "ratio": rng.random(),
+            "created": datetime.datetime.fromtimestamp(1700000000 + rng.randint(0, 1 << 24)),
+            "tags": [f"tag-{rng.randint(0, 50)}" for _ in range(rng.randint(0, 6))],
+            "attributes": {f"k{i}": rng.randint(-5000, 5000) for i in range(rng.randint(0, 4))},
+            "payload": rng.randbytes(rng.randint(0, 64)),
+        })
+    return output.to_bytes()
+
+
+def payloads(size: int) -> dict[str, bytes]:
+    return {
+        "objects(1 field)": object_list(size, 1),
+        "objects(9 fields)": object_list(size, 9),
+        "map": string_map(size),
+        "ints": int_list(size * 4),
+        "doubles": double_array(size * 4),
+        "binary": binary(size * 512),
+        "random objects": random_objects(size),
+    }
+
+
+def _best(rounds: int, decode) -> float:
+    best = None
+    for _ in range(rounds):
+        start = time.perf_counter()
+        decode()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def run(size: int, rounds: int):
+    for name, payload in payloads(size).items():
+        read = _best(rounds, lambda: Hessian2Input(payload).read_object())
+        arrays = _best(rounds, lambda: Hessian2Input(payload, numeric_arrays="array").read_object())
+        skip = _best(rounds, lambda: Hessian2Input(payload).skip_object())
+        dumps = _best(rounds, lambda: json.dumps(
+            Hessian2Input(payload, ref_markers=True).read_object(), ensure_ascii=False, default=json_default
+        ))
+        transcode = _best(rounds, lambda: Hessian2JsonTranscoder(payload).read_json())
+        print(
+            f"{name:<20} {len(payload):>9} bytes  read {read * 1000:8.2f} ms {len(payload) / read / 1e6:8.2f} MB/s"
+            f"  arrays {arrays * 1000:8.2f} ms  skip {skip * 1000:8.2f} ms {len(payload) / skip / 1e6:8.2f} MB/s"
+            f"  read+dumps {dumps * 1000:8.2f} ms  json {transcode * 1000:8.2f} ms"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", type=int, default=1024, help="rows, entries or values per payload")
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+    run(args.size, args.rounds)
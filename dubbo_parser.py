@@ -1,18 +1,65 @@
 import argparse
 from loguru import logger
 from elasticsearch7 import Elasticsearch
-from parser.dubbo_packet_parser import DubboPacketParser
+from hessian2.common import ValuePolicy
+from hessian2.hessian2_json import DecodeBudget
+from parser.dubbo_common import DubboChannel
+from parser.dubbo_packet_parser import DubboPacketParser, discover_ports
+from parser.dubbo_parallel_parser import ParallelDubboPacketParser
+from parser.tcp_reassembler import TcpReassembler
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
-    parser.add_argument("--file", type=str, required=True, help="pcap file")
-    parser.add_argument("--port", type=int, required=True, help="dubbo server port")
+    parser.add_argument("--file", type=str, required=False, help="pcap file")
+    parser.add_argument("--follow", action="store_true", help="keep reading the pcap file while it grows")
+    parser.add_argument("--watch_dir", "--watch-dir", type=str, required=False,
+                        help="directory of rotated pcap files to follow")
+    parser.add_argument("--watch_pattern", "--watch-pattern", type=str, required=False,
+                        help="rotated pcap file pattern", default="*.pcap")
+    parser.add_argument("--port", type=str, required=False, default="",
+                        help="dubbo server ports separated by comma, discovered from the capture while parsing "
+                             "when omitted")
     parser.add_argument("--elastic_host", type=str, required=False, help="elasticsearch host", default="")
     parser.add_argument("--elastic_user", type=str, required=False, help="elasticsearch user", default="")
     parser.add_argument("--elastic_password", type=str, required=False, help="elasticsearch password", default="")
+    parser.add_argument("--workers", type=int, required=False, help="parser worker processes", default=1)
+    parser.add_argument("--reorder_budget", type=int, required=False, default=DubboChannel.DEFAULT_REORDER_BUDGET,
+                        help="bytes held back per connection direction while waiting for lost or reordered segments")
+    parser.add_argument("--hole_timeout", type=float, required=False, default=TcpReassembler.DEFAULT_HOLE_TIMEOUT,
+                        help="capture seconds a lost tcp segment is waited for before its connection skips past it")
+    parser.add_argument("--max_body_len", type=int, required=False, default=DubboChannel.DEFAULT_MAX_BODY_LEN,
+                        help="largest frame body trusted, headers claiming more are skipped as garbage")
+    parser.add_argument("--idle_timeout", type=float, required=False, default=DubboPacketParser.DEFAULT_IDLE_TIMEOUT,
+                        help="capture seconds after which an idle connection is dropped")
+    parser.add_argument("--max_buffered_bytes", type=int, required=False,
+                        default=DubboPacketParser.DEFAULT_MAX_BUFFERED_BYTES,
+                        help="bytes buffered across all connections before the least recently active are dropped")
+    parser.add_argument("--request_timeout", type=float, required=False,
+                        default=DubboPacketParser.DEFAULT_REQUEST_TIMEOUT,
+                        help="capture seconds after which an unanswered request is stored as timed out")
+    parser.add_argument("--headers_only", action="store_true",
+                        help="skip parameters and results, only store the call header, attachments and latency")
+    parser.add_argument("--stream_threshold", type=int, required=False, default=None,
+                        help="frame bodies of at least this many bytes are decoded while their segments arrive")
+    parser.add_argument("--max_decode_bytes", type=int, required=False, default=None,
+                        help="body bytes decoded per parameter list, attachments, result or exception")
+    parser.add_argument("--max_elements", type=int, required=False, default=None,
+                        help="values kept per list and entries per map")
+    parser.add_argument("--max_depth", type=int, required=False, default=None,
+                        help="nesting depth of the lists, maps and objects kept")
+    parser.add_argument("--max_string_length", type=int, required=False, default=None,
+                        help="characters kept per string")
+    parser.add_argument("--dates", choices=["datetime", "epoch_ms"], required=False, default="datetime",
+                        help="store dates as local iso 8601 text or as epoch milliseconds")
+    parser.add_argument("--binaries", choices=["base64", "digest", "drop"], required=False, default="base64",
+                        help="store binaries as base64 text, as their length and sha256 or as null")
     parser.add_argument("--logfile", type=str, required=False, help="log file", default="/data/dubbo-parser-result.log")
     logger.remove(0)
     args = parser.parse_args()
+    if not args.file and not args.watch_dir:
+        parser.error("--file or --watch-dir is required")
+    if (args.follow or args.watch_dir) and args.workers > 1:
+        parser.error("--workers can not be used with --follow or --watch_dir")
     logger.add(args.logfile, rotation="1 hours", encoding="utf-8", backtrace=True,
                format="{time} | {level} | {message}")
     elastic_client = None
@@ -24,9 +71,37 @@ if __name__ == "__main__":
             )
         else:
             elastic_client = Elasticsearch(hosts=[s.strip() for s in args.elastic_host.split(",")])
+    ports = {int(s.strip()) for s in args.port.split(",") if s.strip()}
+    discover = len(ports) == 0
+    if discover and args.file and not args.follow:
+        # only a seed, ports first seen after the sample are still detected while parsing.
+        ports = discover_ports(args.file)
+        logger.info(f"discovered dubbo server ports {sorted(ports)}")
+    options = {
+        "discover": discover,
+        "reorder_budget": args.reorder_budget,
+        "hole_timeout": args.hole_timeout,
+        "max_body_len": args.max_body_len,
+        "idle_timeout": args.idle_timeout,
+        "max_buffered_bytes": args.max_buffered_bytes,
+        "request_timeout": args.request_timeout,
+        "headers_only": args.headers_only,
+        "stream_threshold": args.stream_threshold,
+    }
+    budget = DecodeBudget(args.max_decode_bytes, args.max_elements, args.max_depth, args.max_string_length)
+    if budget != DecodeBudget():
+        options["decode_budget"] = budget
+    if args.dates != "datetime" or args.binaries != "base64":
+        options["value_policy"] = ValuePolicy(args.dates, args.binaries)
     try:
-        parser = DubboPacketParser(args.file, args.port, elastic_client)
-        parser.parse()
+        if args.workers > 1:
+            parser = ParallelDubboPacketParser(args.file, ports, elastic_client, args.workers, **options)
+        else:
+            parser = DubboPacketParser(args.file, ports, elastic_client, **options)
+        if args.follow or args.watch_dir:
+            parser.follow(args.watch_dir, args.watch_pattern)
+        else:
+            parser.parse()
     finally:
         parser.flush()
         if elastic_client:
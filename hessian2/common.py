@@ -3,13 +3,36 @@
 import abc
 import typing
 from abc import abstractmethod
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 
 
 @dataclass
 class ObjectDefinition:
     type: str
-    fields: list[str]
+    fields: tuple[str, ...]
+    # reads the field values of one instance, shared by every definition with the same signature
+    deserializer: typing.Any = field(default=None, compare=False, repr=False)
+
+
+@dataclass(frozen=True, slots=True)
+class ValuePolicy:
+    """
+    how a decoder builds dates, binaries and strings.
+
+    `dates` is "datetime" for local `datetime.datetime` values or "epoch_ms" for the int milliseconds on the wire.
+    `binaries` is "bytes", "base64" for the base64 text, "digest" for `{"length": n, "sha256": hex}` or "drop" for
+    None, digests and dropped binaries are never copied out of the input. strings longer than `max_string_length`
+    decode to their first characters.
+    """
+    dates: str = "datetime"
+    binaries: str = "bytes"
+    max_string_length: int = None
+
+    def __post_init__(self):
+        if self.dates not in ("datetime", "epoch_ms"):
+            raise Exception(f"unknown dates policy {self.dates}")
+        if self.binaries not in ("bytes", "base64", "digest", "drop"):
+            raise Exception(f"unknown binaries policy {self.binaries}")
 
 
 class AbstractHessian2Input(abc.ABC):
@@ -29,3 +52,7 @@ class AbstractHessian2Input(abc.ABC):
     @abstractmethod
     def read_object(self):
         pass
+
+    @abstractmethod
+    def read_key(self):
+        pass
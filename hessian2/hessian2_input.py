@@ -1,13 +1,17 @@
 #!/bin/python
 # -- coding: utf-8 --
+import array
+import base64
+import codecs
 import datetime
+import hashlib
+import re
 import struct
+import sys
 import typing
-from ctypes import c_int32, c_int64, c_double
-from io import StringIO
 
-from hessian2.common import ObjectDefinition, AbstractHessian2Input
-from hessian2.serializers import ObjectDeserializer, ListDeserializer, MapDeserializer
+from hessian2.common import ObjectDefinition, AbstractHessian2Input, ValuePolicy
+from hessian2.serializers import ListDeserializer, MapDeserializer, object_definition
 
 BC_INT_ZERO = 0x90
 BC_INT_BYTE_ZERO = 0xc8
@@ -31,13 +35,41 @@ BC_LIST_FIXED = 'V'
 BC_LIST_FIXED_UNTYPED = 0x58
 BC_REF = 0x51
 
+_INT8 = struct.Struct(">b")
+_INT16 = struct.Struct(">h")
+_UINT16 = struct.Struct(">H")
+_INT32 = struct.Struct(">i")
+_INT64 = struct.Struct(">q")
+_DOUBLE = struct.Struct(">d")
+
+_SURROGATE = re.compile("[\ud800-\udfff]")
+
+_UTF8_CONTINUATION = bytes(range(0x80, 0xc0))
+_UTF8_NOT_4_BYTE_LEAD = bytes(b for b in range(256) if not 0xf0 <= b <= 0xf7)
+
+# bytes taken by the utf-8 sequence starting with each lead byte, stray continuation bytes fail to decode as 1.
+_UTF8_WIDTH = bytes(1 if b < 0xc0 else 2 if b < 0xe0 else 3 if b < 0xf0 else 4 for b in range(256))
+
 
 class Hessian2Input(AbstractHessian2Input):
     """
     hessian decoder
+
+    lists, maps and objects are registered as they start, so back references resolve to the shared instance, even
+    one that is still being read. with `ref_markers` a back reference decodes to `{"$ref": n}` instead, n counting
+    the lists, maps and objects of the input in the order they start, which keeps shared and cyclic graphs as
+    small as they are on the wire once dumped as json.
+
+    with `numeric_arrays` set to "array", fixed length lists of numbers, the primitive java arrays and lists whose
+    values are all ints, longs or all doubles, decode into an `array.array` of int32, int64 or double in one loop,
+    "numpy" wraps that array in a numpy array without copying.
+
+    a `value_policy` changes what dates, binaries and strings decode to, see `ValuePolicy`. type names, field names,
+    map keys and `read_string` are never cut.
     """
 
-    def __init__(self, buffer: bytes):
+    def __init__(self, buffer: bytes, ref_markers: bool = False, numeric_arrays: str = None,
+                 value_policy: ValuePolicy = None):
         self._buffer = buffer
         self._offset = 0
         self._length = len(self._buffer)
@@ -46,152 +78,498 @@ class Hessian2Input(AbstractHessian2Input):
         self._types = list[str]()
         self._refs = list[typing.Any]()
         self._class_def_list = list[ObjectDefinition]()
+        self._ref_markers = ref_markers
+        if numeric_arrays not in (None, "array", "numpy"):
+            raise Exception(f"unknown numeric_arrays {numeric_arrays}")
+        self._numeric_arrays = numeric_arrays
+        if numeric_arrays == "numpy":
+            import numpy
+            self._numpy = numpy
+        value_policy = ValuePolicy() if value_policy is None else value_policy
+        self._dates_as_millis = value_policy.dates == "epoch_ms"
+        # None keeps the bytes
+        self._binaries = None if value_policy.binaries == "bytes" else value_policy.binaries
+        self._max_string_length = value_policy.max_string_length
 
     def read_object(self) -> typing.Any:
-        tag = self.read_byte()
-        match tag:
-            case tag if tag == ord('N'):
+        if self._offset >= self._length:
+            raise Exception("readObject: unexpected end of file")
+        tag = self._buffer[self._offset]
+        self._offset = self._offset + 1
+        return _OBJECT_READERS[tag](self, tag)
+
+    def _object_null(self, tag: int):
+        return None
+
+    def _object_true(self, tag: int):
+        return True
+
+    def _object_false(self, tag: int):
+        return False
+
+    def _object_int_direct(self, tag: int):
+        return tag - BC_INT_ZERO
+
+    def _object_int_byte(self, tag: int):
+        return ((tag - BC_INT_BYTE_ZERO) << 8) + self._read_byte()
+
+    def _object_int_short(self, tag: int):
+        return ((tag - BC_INT_SHORT_ZERO) << 16) + self._unpack(_UINT16)
+
+    def _object_int(self, tag: int):
+        return self.parse_int()
+
+    def _object_long_direct(self, tag: int):
+        return tag - BC_LONG_ZERO
+
+    def _object_long_byte(self, tag: int):
+        return ((tag - BC_LONG_BYTE_ZERO) << 8) + self._read_byte()
+
+    def _object_long_short(self, tag: int):
+        return ((tag - BC_LONG_SHORT_ZERO) << 16) + self._unpack(_UINT16)
+
+    def _object_long(self, tag: int):
+        return self.parse_long()
+
+    def _object_double_zero(self, tag: int):
+        return 0.0
+
+    def _object_double_one(self, tag: int):
+        return 1.0
+
+    def _object_double_byte(self, tag: int):
+        return float(self._unpack(_INT8))
+
+    def _object_double_short(self, tag: int):
+        return float(self._unpack(_INT16))
+
+    def _object_double_mill(self, tag: int):
+        return 0.001 * self.parse_int()
+
+    def _object_double(self, tag: int):
+        return self.parse_double()
+
+    def _object_date(self, tag: int):
+        millis = self.parse_long()
+        return millis if self._dates_as_millis else datetime.datetime.fromtimestamp(millis / 1000)
+
+    def _object_date_minute(self, tag: int):
+        minutes = self.parse_int()
+        return minutes * 60000 if self._dates_as_millis else datetime.datetime.fromtimestamp(minutes * 60)
+
+    def _object_string_chunk(self, tag: int):
+        self._is_last_chunk = (tag == ord('S'))
+        self._chunk_length = self._unpack(_UINT16)
+        return self.parse_string() if self._max_string_length is None else self._string_prefix()
+
+    def _object_string_short(self, tag: int):
+        self._is_last_chunk = True
+        self._chunk_length = tag - 0x00
+        return self.parse_string() if self._max_string_length is None else self._string_prefix()
+
+    def _object_string_medium(self, tag: int):
+        self._is_last_chunk = True
+        self._chunk_length = ((tag - 0x30) << 8) + self._read_byte()
+        return self.parse_string() if self._max_string_length is None else self._string_prefix()
+
+    def _string_prefix(self) -> str:
+        text, _ = self.parse_string_prefix(self._max_string_length)
+        return text
+
+    def _object_binary_chunk(self, tag: int):
+        self._is_last_chunk = (tag == ord('B'))
+        self._chunk_length = self._unpack(_UINT16)
+        return self.parse_binary() if self._binaries is None else self._binary_by_policy()
+
+    def _object_binary_short(self, tag: int):
+        self._is_last_chunk = True
+        self._chunk_length = tag - 0x20
+        return self.parse_binary() if self._binaries is None else self._binary_by_policy()
+
+    def _object_binary_medium(self, tag: int):
+        self._is_last_chunk = True
+        self._chunk_length = ((tag - 0x34) << 8) + self._read_byte()
+        return self.parse_binary() if self._binaries is None else self._binary_by_policy()
+
+    def _binary_by_policy(self):
+        match self._binaries:
+            case "drop":
+                self.skip_binary()
                 return None
-            case tag if tag == ord('T'):
-                return True
-            case tag if tag == ord('F'):
-                return False
-            case tag if 0x80 <= tag <= 0xbf:
-                return int(tag - BC_INT_ZERO)
-            case tag if 0xc0 <= tag <= 0xcf:
-                return int(((tag - BC_INT_BYTE_ZERO) << 8) + self._read_byte())
-            case tag if 0xd0 <= tag <= 0xd7:
-                return int(((tag - BC_INT_SHORT_ZERO) << 16) + (self._read_byte() << 8) + self._read_byte())
-            case tag if tag == ord('I'):
-                return int(self.parse_int())
-            case tag if 0xd8 <= tag <= 0xef:
-                return int(tag - BC_LONG_ZERO)
-            case tag if 0xf0 <= tag <= 0xff:
-                return int(((tag - BC_LONG_BYTE_ZERO) << 8) + self._read_byte())
-            case tag if 0x38 <= tag <= 0x3f:
-                return int(((tag - BC_LONG_SHORT_ZERO) << 16) + (self._read_byte() << 8) + self._read_byte())
-            case tag if tag == BC_LONG_INT:
-                return int(self.parse_int())
-            case tag if tag == ord('L'):
-                return int(self.parse_long())
-            # double parser
-            case tag if tag == BC_DOUBLE_ZERO:
-                return c_double(0).value
-            case tag if tag == BC_DOUBLE_ONE:
-                return c_double(1).value
-            case tag if tag == BC_DOUBLE_BYTE:
-                return c_double(self._read_byte()).value
-            case tag if tag == BC_DOUBLE_SHORT:
-                return c_double((self._read_byte() << 8) + self._read_byte()).value
-            case tag if tag == BC_DOUBLE_MILL:
-                mills = self.parse_int()
-                return c_double(0.001 * mills).value
-            case tag if tag == ord('D'):
-                return c_double(self.parse_double()).value
-            case tag if tag == BC_DATE:
-                val = self.parse_long()
-                return datetime.datetime.fromtimestamp(val / 1000)
-            #
-            case tag if tag == BC_DATE_MINUTE:
-                return datetime.datetime.fromtimestamp(self.parse_int() * 60000)
-            case tag if tag == ord(BC_STRING_CHUNK) or tag == ord('S'):
-                self._is_last_chunk = (tag == ord('S'))
-                self._chunk_length = (self._read_byte() << 8) + self._read_byte()
-                return self.parse_string()
-            case tag if 0x00 <= tag <= 0x1f:
-                self._is_last_chunk = True
-                self._chunk_length = int(tag - 0x00)
-                return self.parse_string()
-            case tag if 0x30 <= tag <= 0x33:
-                self._is_last_chunk = True
-                self._chunk_length = ((tag - 0x30) << 8) + self._read_byte()
-                return self.parse_string()
-            case tag if tag == ord(BC_BINARY_CHUNK) or tag == ord('B'):
-                self._is_last_chunk = (tag == ord('B'))
-                self._chunk_length = (self._read_byte() << 8) + self._read_byte()
-                buffer = bytearray()
-                while True:
-                    b = self.parse_byte()
-                    if b is not None:
-                        buffer.append(b.to_bytes(1, "big")[0:1])
-                    else:
-                        break
-                return buffer[0:]
-            case tag if 0x20 <= tag <= 0x2f:
-                self._is_last_chunk = True
-                lens = tag - 0x20
-                self._chunk_length = 0
-                buffer = bytearray()
-                while lens >= 0:
-                    b = self._read_byte()
-                    buffer.append(b.to_bytes(1, 'big')[0:1])
-                    lens = lens - 1
-                return buffer[0:]
-            case tag if 0x34 <= tag <= 0x37:
-                self._is_last_chunk = True
-                lens = ((tag - 0x34) << 8) + self._read_byte()
-                self._chunk_length = 0
-                buffer = bytearray()
-                while lens >= 0:
-                    b = self._read_byte()
-                    buffer.append(b.to_bytes(1, 'big')[0:1])
-                    lens = lens - 1
-                return buffer[0:]
-            case tag if tag == BC_LIST_VARIABLE:
-                self.read_type()
-                return ListDeserializer(-1).read_length_list(self)
-            case tag if tag == BC_LIST_VARIABLE_UNTYPED:
-                return ListDeserializer(-1).read_length_list(self)
-            case tag if tag == ord(BC_LIST_FIXED):
-                self.read_type()
-                lens = self.read_int()
-                return ListDeserializer(lens).read_length_list(self)
-            case tag if tag == BC_LIST_FIXED_UNTYPED:
-                lens = self.read_int()
-                return ListDeserializer(lens).read_length_list(self)
-            case tag if 0x70 <= tag <= 0x77:
-                self.read_type()
-                lens = tag - 0x70
-                return ListDeserializer(lens).read_length_list(self)
-            case tag if 0x78 <= tag <= 0x7f:
-                lens = tag - 0x78
-                return ListDeserializer(lens).read_length_list(self)
-            case tag if tag == ord('H'):
-                return MapDeserializer().read_map(self)
-            case tag if tag == ord('M'):
-                self.read_type()
-                map_result = MapDeserializer().read_map(self)
-                self.add_ref(map_result)
-                return map_result
-            case tag if tag == ord('C'):
-                self.read_object_definition()
-                obj = self.read_object()
-                return obj
-            case tag if 0x60 <= tag <= 0x6f:
-                ref = tag - 0x60
-                if ref >= len(self._class_def_list):
-                    raise Exception(f"No classes defined at reference {ref}")
-                class_def = self._class_def_list[ref]
-                value = ObjectDeserializer(class_def.fields).read_object(self)
-                self.add_ref(value)
-                return value
-            case tag if tag == ord('O'):
-                ref = self.read_int()
-                class_def = self._class_def_list[ref]
-                value = ObjectDeserializer(class_def.fields).read_object(self)
-                self.add_ref(value)
-                return value
-            case tag if tag == BC_REF:
-                # TODO
-                ref = self.read_int()
+            case "digest":
+                # each chunk is hashed where it lies.
+                digest = hashlib.sha256()
+                length = 0
+                with memoryview(self._buffer) as view:
+                    while True:
+                        start = self._offset
+                        end = start + self._chunk_length
+                        if end > self._length:
+                            raise Exception(f"exceed _buffer length, _offset={start}, length={self._length}")
+                        digest.update(view[start:end])
+                        length = length + end - start
+                        self._offset = end
+                        self._chunk_length = 0
+                        if self._is_last_chunk:
+                            break
+                        self.parse_byte_chunk_length()
+                return {"length": length, "sha256": digest.hexdigest()}
+            case _:
+                return self._binary_of(self.parse_binary())
+
+    def _binary_of(self, data: bytes):
+        """
+        the value the policy decodes the whole binary `data` to.
+        """
+        match self._binaries:
+            case "drop":
                 return None
-                # do not support ref
-                # return self._refs[ref]
+            case "digest":
+                return {"length": len(data), "sha256": hashlib.sha256(data).hexdigest()}
+            case "base64":
+                return base64.b64encode(data).decode("ascii")
             case _:
-                if tag is None:
-                    raise Exception("readObject: unexpected end of file")
+                return data
+
+    def _string_text(self, tag: int):
+        self.read_string_header(tag)
+        return self.parse_string()
+
+    def read_string_header(self, tag: int):
+        """
+        read the header of the first string chunk after its tag.
+        """
+        if tag == ord(BC_STRING_CHUNK) or tag == ord('S'):
+            self._is_last_chunk = (tag == ord('S'))
+            self._chunk_length = self._unpack(_UINT16)
+        elif tag < 0x20:
+            self._is_last_chunk = True
+            self._chunk_length = tag - 0x00
+        else:
+            self._is_last_chunk = True
+            self._chunk_length = ((tag - 0x30) << 8) + self._read_byte()
+
+    def _object_list_variable(self, tag: int):
+        self.read_type()
+        return ListDeserializer(-1).read_length_list(self)
+
+    def _object_list_variable_untyped(self, tag: int):
+        return ListDeserializer(-1).read_length_list(self)
+
+    def _object_list_fixed(self, tag: int):
+        tp = self.read_type()
+        return self._read_fixed_list(self.read_int(), tp)
+
+    def _object_list_fixed_untyped(self, tag: int):
+        return self._read_fixed_list(self.read_int(), None)
+
+    def _object_list_short(self, tag: int):
+        tp = self.read_type()
+        return self._read_fixed_list(tag - 0x70, tp)
+
+    def _object_list_short_untyped(self, tag: int):
+        return self._read_fixed_list(tag - 0x78, None)
+
+    def _read_fixed_list(self, length: int, tp: str | None):
+        typecode = None if self._numeric_arrays is None else self._array_typecode(length, tp)
+        if typecode is None:
+            return ListDeserializer(length).read_length_list(self)
+        index = len(self._refs)
+        self.add_ref(None)
+        values = self.read_number_run(length, typecode)
+        if len(values) < length:
+            # a value of another kind, the list is read as usual from there, references to it included.
+            result = values.tolist()
+            self._refs[index] = result
+            for _ in range(len(values), length):
+                result.append(self.read_object())
+        elif self._numeric_arrays == "numpy":
+            result = self._numpy.frombuffer(values, dtype=typecode)
+        else:
+            result = values
+        self._refs[index] = result
+        return result
+
+    def _array_typecode(self, length: int, tp: str | None) -> str | None:
+        """
+        the array typecode of a fixed length list of `length` values, from its java type or else its first value.
+        """
+        if length <= 0:
+            return None
+        typecode = _ARRAY_TYPECODES.get(tp)
+        if typecode is None and self._offset < self._length:
+            typecode = _RUN_TYPECODES[self._buffer[self._offset]]
+        return typecode
+
+    def read_number_run(self, length: int, typecode: str) -> array.array:
+        """
+        read up to `length` values into an array of `typecode`, "i" and "q" taking ints, "q" longs too, and "d"
+        doubles. stops before the first value of another kind, or one cut short by the end of the buffer.
+        """
+        values = array.array(typecode)
+        # single values are collected in a list, which appends faster, and moved to the array before each run.
+        singles = []
+        append = singles.append
+        buffer = self._buffer
+        end = self._length
+        offset = self._offset
+        widths = _RUN_WIDTHS[typecode]
+        runs = _NUMBER_RUNS
+        count = 0
+        # runs of one encoding are looked for from this value on, further apart after every short one.
+        next_run = 0
+        run_gap = _MIN_NUMBER_RUN
+        while count < length:
+            if offset >= end:
+                break
+            tag = buffer[offset]
+            width = widths[tag]
+            if width is None or offset + width >= end:
+                break
+            if count >= next_run and runs[tag] is not None:
+                pattern, run_width, decode = runs[tag]
+                match = pattern.match(buffer, offset, min(end, offset + run_width * (length - count)))
+                size = (match.end() - offset) // run_width
+                if size >= _MIN_NUMBER_RUN:
+                    if len(singles) > 0:
+                        values.extend(singles)
+                        singles.clear()
+                    decoded = decode(bytes(buffer[offset:offset + size * run_width]), size)
+                    values.extend(decoded if decoded.typecode == typecode else iter(decoded))
+                    offset = offset + size * run_width
+                    count = count + size
+                    run_gap = _MIN_NUMBER_RUN
+                    continue
+                next_run = count + run_gap
+                run_gap = min(run_gap * 2, 1024)
+            count = count + 1
+            if 0x80 <= tag < 0xc0:
+                append(tag - BC_INT_ZERO)
+            elif 0xc0 <= tag < 0xd0:
+                append(((tag - BC_INT_BYTE_ZERO) << 8) + buffer[offset + 1])
+            elif 0xd0 <= tag < 0xd8:
+                append(((tag - BC_INT_SHORT_ZERO) << 16) + (buffer[offset + 1] << 8) + buffer[offset + 2])
+            elif tag == 0x49 or tag == BC_LONG_INT:
+                append(_INT32.unpack_from(buffer, offset + 1)[0])
+            elif 0xd8 <= tag < 0xf0:
+                append(tag - BC_LONG_ZERO)
+            elif 0xf0 <= tag:
+                append(((tag - BC_LONG_BYTE_ZERO) << 8) + buffer[offset + 1])
+            elif 0x38 <= tag < 0x40:
+                append(((tag - BC_LONG_SHORT_ZERO) << 16) + (buffer[offset + 1] << 8) + buffer[offset + 2])
+            elif tag == 0x4c:
+                append(_INT64.unpack_from(buffer, offset + 1)[0])
+            elif tag == 0x44:
+                append(_DOUBLE.unpack_from(buffer, offset + 1)[0])
+            elif tag == BC_DOUBLE_ZERO:
+                append(0.0)
+            elif tag == BC_DOUBLE_ONE:
+                append(1.0)
+            elif tag == BC_DOUBLE_BYTE:
+                append(float(_INT8.unpack_from(buffer, offset + 1)[0]))
+            elif tag == BC_DOUBLE_SHORT:
+                append(float(_INT16.unpack_from(buffer, offset + 1)[0]))
+            else:
+                append(0.001 * _INT32.unpack_from(buffer, offset + 1)[0])
+            offset = offset + 1 + width
+        self._offset = offset
+        values.extend(singles)
+        return values
+
+    def _object_map_untyped(self, tag: int):
+        return MapDeserializer().read_map(self)
+
+    def _object_map(self, tag: int):
+        self.read_type()
+        return MapDeserializer().read_map(self)
+
+    def _object_class_definition(self, tag: int):
+        self.read_object_definition()
+        return self.read_object()
+
+    def _object_instance_short(self, tag: int):
+        return self._read_instance(tag - 0x60)
+
+    def _object_instance(self, tag: int):
+        return self._read_instance(self.read_int())
+
+    def _read_instance(self, ref: int):
+        if ref >= len(self._class_def_list):
+            raise Exception(f"No classes defined at reference {ref}")
+        return self._class_def_list[ref].deserializer.read_object(self)
+
+    def _object_ref(self, tag: int):
+        return self._shared(self.read_int())
+
+    def _shared(self, index: int):
+        if not 0 <= index < len(self._refs):
+            raise Exception(f"no object defined at reference {index}")
+        return {"$ref": index} if self._ref_markers else self._refs[index]
+
+    def _object_unknown(self, tag: int):
+        raise Exception(f"readObject: unknown code {tag}")
+
+    def skip_object(self):
+        """
+        advance past the next value without building it.
+
+        class definitions, types and references are registered exactly as `read_object` would, so values read after
+        a skipped one still resolve their class, type and reference numbers.
+        """
+        if self._offset >= self._length:
+            raise Exception("skipObject: unexpected end of file")
+        tag = self._buffer[self._offset]
+        self._offset = self._offset + 1
+        width = _FIXED_WIDTHS[tag]
+        if width < 0:
+            _SKIPPERS[tag](self, tag)
+            return
+        end = self._offset + width
+        if end > self._length:
+            raise Exception(f"exceed _buffer length, _offset={self._offset}, length={self._length}")
+        self._offset = end
+
+    def _skip_string_chunk(self, tag: int):
+        self._is_last_chunk = (tag == ord('S'))
+        self._chunk_length = self._unpack(_UINT16)
+        self.skip_string()
+
+    def _skip_string_short(self, tag: int):
+        self._is_last_chunk = True
+        self._chunk_length = tag - 0x00
+        self.skip_string()
+
+    def _skip_string_medium(self, tag: int):
+        self._is_last_chunk = True
+        self._chunk_length = ((tag - 0x30) << 8) + self._read_byte()
+        self.skip_string()
+
+    def _skip_binary_chunk(self, tag: int):
+        self._is_last_chunk = (tag == ord('B'))
+        self._chunk_length = self._unpack(_UINT16)
+        self.skip_binary()
+
+    def _skip_binary_short(self, tag: int):
+        self._is_last_chunk = True
+        self._chunk_length = tag - 0x20
+        self.skip_binary()
+
+    def _skip_binary_medium(self, tag: int):
+        self._is_last_chunk = True
+        self._chunk_length = ((tag - 0x34) << 8) + self._read_byte()
+        self.skip_binary()
+
+    def _skip_list_variable(self, tag: int):
+        self.read_type()
+        self.add_ref(None)
+        self._skip_until_end()
+
+    def _skip_list_variable_untyped(self, tag: int):
+        self.add_ref(None)
+        self._skip_until_end()
+
+    def _skip_list_fixed(self, tag: int):
+        self.read_type()
+        self.add_ref(None)
+        self._skip_values(self.read_int())
+
+    def _skip_list_fixed_untyped(self, tag: int):
+        length = self.read_int()
+        self.add_ref(None)
+        self._skip_values(length)
+
+    def _skip_list_short(self, tag: int):
+        self.read_type()
+        self.add_ref(None)
+        self._skip_values(tag - 0x70)
+
+    def _skip_list_short_untyped(self, tag: int):
+        self.add_ref(None)
+        self._skip_values(tag - 0x78)
+
+    def _skip_map(self, tag: int):
+        self.read_type()
+        self.add_ref(None)
+        self._skip_until_end()
+
+    def _skip_class_definition(self, tag: int):
+        self.read_object_definition()
+        self.skip_object()
+
+    def _skip_instance_short(self, tag: int):
+        self._skip_fields(tag - 0x60)
+
+    def _skip_instance(self, tag: int):
+        self._skip_fields(self.read_int())
+
+    def _skip_fields(self, ref: int):
+        if ref >= len(self._class_def_list):
+            raise Exception(f"No classes defined at reference {ref}")
+        self.add_ref(None)
+        self._skip_values(len(self._class_def_list[ref].fields))
+
+    def _skip_ref(self, tag: int):
+        self.read_int()
+
+    def _skip_values(self, count: int):
+        for _ in range(0, count):
+            self.skip_object()
+
+    def _skip_until_end(self):
+        # map entries are skipped as a flat run of keys and values.
+        while not self.is_end():
+            self.skip_object()
+        self.read_end()
+
+    def skip_string(self) -> int:
+        """
+        skip the string chunks following the first chunk header by counting utf-8 lead bytes, nothing is decoded.
+        returns the number of utf-16 units skipped.
+        """
+        skipped = 0
+        while True:
+            if self._chunk_length <= 0:
+                if not self.parse_chunk_length():
+                    return skipped
+            remaining = self._chunk_length
+            skipped = skipped + remaining
+            self._chunk_length = 0
+            while remaining > 0:
+                # as in parse_string the next `remaining` bytes never hold more than `remaining` units.
+                offset = self._offset
+                span = self._buffer[offset:offset + remaining]
+                if len(span) == 0:
+                    raise Exception(f"exceed _buffer length, _offset={offset}, length={self._length}")
+                if not isinstance(span, bytes):
+                    span = bytes(span)
+                end = offset + len(span)
+                if span.isascii():
+                    remaining = remaining - len(span)
                 else:
-                    raise Exception(f"readObject: unknown code {tag}")
+                    remaining = remaining - len(span.translate(None, _UTF8_CONTINUATION)) \
+                        - len(span.translate(None, _UTF8_NOT_4_BYTE_LEAD))
+                    # step over the rest of a character cut by the end of the span.
+                    lead = len(span) - 1
+                    while lead > 0 and len(span) - lead < 4 and (span[lead] & 0xc0) == 0x80:
+                        lead = lead - 1
+                    end = max(end, offset + lead + _UTF8_WIDTH[span[lead]])
+                self._offset = end
+            if self._offset > self._length:
+                raise Exception(f"exceed _buffer length, _offset={self._offset}, length={self._length}")
+
+    def skip_binary(self):
+        """
+        skip the binary chunks following the first chunk header.
+        """
+        while True:
+            end = self._offset + self._chunk_length
+            if end > self._length:
+                raise Exception(f"exceed _buffer length, _offset={self._offset}, length={self._length}")
+            self._offset = end
+            self._chunk_length = 0
+            if self._is_last_chunk:
+                return
+            self.parse_byte_chunk_length()
 
     def read_object_definition(self):
         tp = self.read_string()
@@ -199,50 +577,32 @@ class Hessian2Input(AbstractHessian2Input):
         field_names = []
         for i in range(0, lens):
             field_names.append(self.read_string())
-        class_def = ObjectDefinition(type=tp, fields=field_names)
-        self._class_def_list.append(class_def)
+        self._class_def_list.append(object_definition(tp, field_names))
 
     def read_int(self):
         tag = self._read_byte()
-        match tag:
-            case tag if tag == ord('N'):
-                return 0
-            case tag if tag == ord('F'):
-                return 0
-            case tag if tag == ord('T'):
-                return 1
-            case tag if 0x80 <= tag <= 0xbf:
-                return int(tag - BC_INT_ZERO)
-            case tag if 0xc0 <= tag <= 0xcf:
-                return ((tag - BC_INT_BYTE_ZERO) << 8) + self._read_byte()
-            case tag if 0xd0 <= tag <= 0xd7:
-                return ((tag - BC_INT_SHORT_ZERO) << 16) + 256 * self._read_byte() + self._read_byte()
-            case tag if tag == ord('I') or tag == BC_LONG_INT:
-                return (self._read_byte() << 24) + (self._read_byte() << 16) + (self._read_byte() << 8) \
-                    + self._read_byte()
-            case tag if 0xd8 <= tag <= 0xef:
-                return tag - BC_LONG_ZERO
-            case tag if 0xf0 <= tag <= 0xff:
-                return ((tag - BC_LONG_BYTE_ZERO) << 8) + self._read_byte()
-            case tag if 0x38 <= tag <= 0x3f:
-                return ((tag - BC_LONG_SHORT_ZERO) << 16) + 256 * self._read_byte() + self._read_byte()
-            case tag if tag == ord('L'):
-                return self.parse_long()
-            case tag if tag == BC_DOUBLE_ZERO:
-                return 0
-            case tag if tag == BC_DOUBLE_ONE:
-                return 1
-            case tag if tag == BC_DOUBLE_BYTE:
-                return self._read_byte()
-            case tag if tag == BC_DOUBLE_SHORT:
-                return self._read_byte() << 8 + self._read_byte()
-            case tag if tag == BC_DOUBLE_MILL:
-                mills = self.parse_int()
-                return int(0.001 * mills)
-            case tag if tag == ord('D'):
-                return int(self.parse_double())
-            case _:
-                raise Exception(f"expect integer")
+        return _INT_READERS[tag](self, tag)
+
+    def _int_zero(self, tag: int):
+        return 0
+
+    def _int_one(self, tag: int):
+        return 1
+
+    def _int_double_byte(self, tag: int):
+        return self._unpack(_INT8)
+
+    def _int_double_short(self, tag: int):
+        return self._unpack(_INT16)
+
+    def _int_double_mill(self, tag: int):
+        return int(0.001 * self.parse_int())
+
+    def _int_double(self, tag: int):
+        return int(self.parse_double())
+
+    def _int_unknown(self, tag: int):
+        raise Exception(f"expect integer")
 
     def read_type(self):
         code = self._read_byte()
@@ -259,174 +619,163 @@ class Hessian2Input(AbstractHessian2Input):
                     raise Exception(f"type ref {ref} is greater than the number of valid types({len(self._types)})")
                 return self._types[ref]
 
-    def parse_byte(self):
-        while self._chunk_length <= 0:
+    def parse_binary(self) -> bytes:
+        """
+        read the binary chunks following the first chunk header, which has already been consumed.
+
+        chunks are copied out of the buffer with slices, a single chunk value is copied exactly once.
+        """
+        chunks = []
+        while True:
+            start = self._offset
+            end = start + self._chunk_length
+            if end > self._length:
+                raise Exception(f"exceed _buffer length, _offset={start}, length={self._length}")
+            self._offset = end
+            self._chunk_length = 0
+            if self._is_last_chunk and len(chunks) == 0:
+                return bytes(self._buffer[start:end])
+            # join takes memoryview slices as they are, each byte is copied once.
+            chunks.append(self._buffer[start:end])
             if self._is_last_chunk:
-                return -1
-            code = self._read_byte()
-            match code:
-                case code if code == ord(BC_BINARY_CHUNK):
-                    self._is_last_chunk = False
-                    self._chunk_length = (self._read_byte() << 8) + self._read_byte()
-                case code if code == ord('B'):
-                    self._is_last_chunk = True
-                    self._chunk_length = (self._read_byte() << 8) + self._read_byte()
-                case code if 0x20 <= code <= 0x2f:
-                    self._is_last_chunk = True
-                    self._chunk_length = code - 0x20
-                case code if 0x34 <= code <= 0x37:
-                    self._is_last_chunk = True
-                    self._chunk_length = (code - 0x34) * 256 + self._read_byte()
-                case _:
-                    raise Exception(f"expect byte[], got {code}")
-        self._chunk_length = self._chunk_length - 1
-        return self.read_byte()
+                return b"".join(chunks)
+            self.parse_byte_chunk_length()
+
+    def parse_byte_chunk_length(self):
+        code = self._read_byte()
+        match code:
+            case code if code == ord(BC_BINARY_CHUNK):
+                self._is_last_chunk = False
+                self._chunk_length = self._unpack(_UINT16)
+            case code if code == ord('B'):
+                self._is_last_chunk = True
+                self._chunk_length = self._unpack(_UINT16)
+            case code if 0x20 <= code <= 0x2f:
+                self._is_last_chunk = True
+                self._chunk_length = code - 0x20
+            case code if 0x34 <= code <= 0x37:
+                self._is_last_chunk = True
+                self._chunk_length = (code - 0x34) * 256 + self._read_byte()
+            case _:
+                raise Exception(f"expect byte[], got {code}")
 
     def parse_string(self):
-        str_out = StringIO()
+        """
+        read the string chunks following the first chunk header, which has already been consumed.
+
+        chunk lengths count utf-16 units, each chunk is decoded with as few `utf_8_decode` calls as it takes to
+        cover that many units and the pieces are joined once.
+        """
+        pieces = []
+        surrogates = False
         while True:
             if self._chunk_length <= 0:
                 if not self.parse_chunk_length():
                     break
-            length = self._chunk_length
+            remaining = self._chunk_length
             self._chunk_length = 0
-            while length > 0:
-                str_out.write(chr(self.parse_utf8_char()))
-                length = length - 1
-        return str_out.getvalue()
+            while remaining > 0:
+                # every unit takes at least one byte, so the next `remaining` bytes never overshoot the chunk.
+                offset = self._offset
+                try:
+                    text, consumed = codecs.utf_8_decode(
+                        self._buffer[offset:offset + remaining], "surrogatepass", False
+                    )
+                    if consumed == 0:
+                        # the next character is wider than the units left, decode exactly that one sequence.
+                        width = _UTF8_WIDTH[self._buffer[offset]] if offset < self._length else 1
+                        if offset + width > self._length:
+                            raise Exception(f"exceed _buffer length, _offset={offset}, length={self._length}")
+                        text, consumed = codecs.utf_8_decode(
+                            self._buffer[offset:offset + width], "surrogatepass", True
+                        )
+                except UnicodeDecodeError as e:
+                    raise Exception(f"bad utf-8 encoding at {offset + e.start}")
+                self._offset = self._offset + consumed
+                if consumed == len(text):
+                    remaining = remaining - consumed
+                else:
+                    remaining = remaining - _utf16_units(text)
+                    surrogates = surrogates or _SURROGATE.search(text) is not None
+                pieces.append(text)
+        return _join_string(pieces, surrogates)
+
+    def parse_string_prefix(self, limit: int) -> tuple[str, int]:
+        """
+        read the first `limit` utf-16 units of the string chunks following the first chunk header and skip the rest,
+        returns the prefix and the number of units skipped.
+        """
+        pieces = []
+        left = limit
+        while left > 0 and (self._chunk_length > 0 or self.parse_chunk_length()):
+            # read up to `left` units of the current chunk as if it were the last one.
+            taken = min(left, self._chunk_length)
+            rest = self._chunk_length - taken
+            is_last_chunk = self._is_last_chunk
+            self._chunk_length = taken
+            self._is_last_chunk = True
+            piece = self.parse_string()
+            units = len(piece) if piece.isascii() else _utf16_units(piece)
+            if units > taken:
+                # a 4 byte character wider than the units left goes back to the skipped part.
+                self._offset = self._offset - 4
+                piece = piece[:-1]
+                units = units - 2
+                left = 0
+            else:
+                left = left - units
+            pieces.append(piece)
+            self._chunk_length = rest + taken - units
+            self._is_last_chunk = is_last_chunk
+        text = "" if len(pieces) == 0 else _join_string(pieces, any(_SURROGATE.search(piece) for piece in pieces))
+        return _cut_pair(text, self.skip_string())
 
     def read_utf(self) -> str:
         return self.read_string()
 
+    def read_key(self) -> typing.Any:
+        """
+        read a map key, string keys are read whole so a cap on strings can not make two keys the same.
+        """
+        if self._offset < self._length and self._buffer[self._offset] in _STRING_TAGS:
+            return self.read_string()
+        return self.read_object()
+
     def read_string(self):
-        tag = self.read_byte()
-        if tag is None:
+        if self._offset >= self._length:
             return None
-        match tag:
-            case tag if tag == ord('N'):
-                return None
-            case tag if tag == ord('T'):
-                return "true"
-            case tag if tag == ord('F'):
-                return "false"
-            case tag if 0x80 <= tag <= 0xbf:
-                return str(tag - 0x90)
-            case tag if 0xc0 <= tag <= 0xcf:
-                result = ((tag - BC_INT_BYTE_ZERO) << 8) + self._read_byte()
-                return str(result)
-            case tag if 0xd0 < tag <= 0xd7:
-                result = ((tag - BC_INT_SHORT_ZERO) << 16) + (self._read_byte() << 8) + self._read_byte()
-                return str(result)
-            case tag if tag == ord('I') or tag == BC_LONG_INT:
-                return str(self.parse_int())
-            case tag if 0xd8 <= tag <= 0xdf or 0xe0 <= tag <= 0xef:
-                result = tag - BC_LONG_ZERO
-                return str(result)
-            case tag if 0xf0 <= tag <= 0xff:
-                result = ((tag - BC_LONG_BYTE_ZERO) << 8) + self._read_byte()
-                return str(result)
-            case tag if 0x38 <= tag <= 0x3f:
-                result = ((tag - BC_LONG_SHORT_ZERO) << 16) + (self._read_byte() << 8) + self._read_byte()
-                return str(result)
-            case tag if tag == ord('L'):
-                return str(self.parse_long())
-            case tag if tag == BC_DOUBLE_ZERO:
-                return "0.0"
-            case tag if tag == BC_DOUBLE_ONE:
-                return "1.0"
-            case tag if tag == BC_DOUBLE_BYTE:
-                return str(self._read_byte())
-            case tag if tag == BC_DOUBLE_SHORT:
-                result = (self._read_byte() << 8) + self._read_byte()
-                return str(result)
-            case tag if tag == BC_DOUBLE_MILL:
-                mills = self.parse_int()
-                return str(0.001 * mills)
-            case tag if tag == ord('D'):
-                return str(self.parse_double())
-            case tag if tag == ord('S') or tag == ord(BC_STRING_CHUNK):
-                self._is_last_chunk = (tag == ord('S'))
-                self._chunk_length = self._read_byte() << 8 + self._read_byte()
-                str_output = StringIO()
-                loop = True
-                while loop:
-                    ch = self.parse_char()
-                    if ch < 0:
-                        loop = False
-                    else:
-                        str_output.write(chr(ch))
-                return str_output.getvalue()
-            case tag if 0x00 <= tag <= 0x1f:
-                self._is_last_chunk = True
-                self._chunk_length = tag - 0x00
-                str_output = StringIO()
-                loop = True
-                while loop:
-                    ch = self.parse_char()
-                    if ch < 0:
-                        loop = False
-                    else:
-                        str_output.write(chr(ch))
-                return str_output.getvalue()
-            case tag if 0x30 <= tag <= 0x33:
-                self._is_last_chunk = True
-                self._chunk_length = ((tag - 0x30) << 8) + self._read_byte()
-                loop = True
-                str_output = StringIO()
-                while loop:
-                    ch = self.parse_char()
-                    if ch < 0:
-                        loop = False
-                    else:
-                        str_output.write(chr(ch))
-                return str_output.getvalue()
-            case _:
-                raise Exception(f"expect {tag}")
-
-    def parse_double(self):
-        i64 = self.parse_long()
-        return struct.unpack('d', struct.pack('Q', i64))[0]
-
-    def parse_int(self):
-        b32 = self._read_byte()
-        b24 = self._read_byte()
-        b16 = self._read_byte()
-        b8 = self._read_byte()
-        return c_int32((b32 << 24) + (b24 << 16) + (b16 << 8) + b8).value
-
-    def parse_long(self):
-        b64 = self._read_byte()
-        b56 = self._read_byte()
-        b48 = self._read_byte()
-        b40 = self._read_byte()
-        b32 = self._read_byte()
-        b24 = self._read_byte()
-        b16 = self._read_byte()
-        b8 = self._read_byte()
-        return c_int64(
-            (b64 << 56) + (b56 << 48) + (b48 << 40) + (b40 << 32) + (b32 << 24) + (b24 << 16) + (b16 << 8) + b8
-        ).value
-
-    def parse_char(self):
-        while self._chunk_length <= 0:
-            if not self.parse_chunk_length():
-                return -1
-        self._chunk_length = self._chunk_length - 1
-        return self.parse_utf8_char()
-
-    def parse_utf8_char(self):
-        ch = self._read_byte()
-        if ch < 0x80:
-            return ch
-        elif (ch & 0xe0) == 0xc0:
-            ch1 = self._read_byte()
-            return ((ch & 0x1f) << 6) + (ch1 & 0x3f)
-        elif (ch & 0xf0) == 0xe0:
-            ch1 = self._read_byte()
-            ch2 = self._read_byte()
-            return ((ch & 0x0f) << 12) + ((ch1 & 0x3f) << 6) + (ch2 & 0x3f)
-        else:
-            raise Exception(f"bad utf-8 encoding at {ch}")
+        tag = self._buffer[self._offset]
+        self._offset = self._offset + 1
+        return _STRING_READERS[tag](self, tag)
+
+    def _string_true(self, tag: int):
+        return "true"
+
+    def _string_false(self, tag: int):
+        return "false"
+
+    def _string_of_number(self, tag: int):
+        return str(_OBJECT_READERS[tag](self, tag))
+
+    def _string_unknown(self, tag: int):
+        raise Exception(f"expect {tag}")
+
+    def parse_double(self) -> float:
+        return self._unpack(_DOUBLE)
+
+    def parse_int(self) -> int:
+        return self._unpack(_INT32)
+
+    def parse_long(self) -> int:
+        return self._unpack(_INT64)
+
+    def _unpack(self, fmt: struct.Struct):
+        offset = self._offset
+        end = offset + fmt.size
+        if end > self._length:
+            raise Exception(f"exceed _buffer length, _offset={offset}, length={self._length}")
+        self._offset = end
+        return fmt.unpack_from(self._buffer, offset)[0]
 
     def _read_byte(self):
         if self._offset < self._length:
@@ -489,3 +838,685 @@ class Hessian2Input(AbstractHessian2Input):
 
     def add_ref(self, obj: typing.Any):
         self._refs.append(obj)
+
+
+def _utf16_units(text: str) -> int:
+    return len(text.encode("utf-16-le", "surrogatepass")) >> 1
+
+
+def _cut_pair(text: str, dropped: int) -> tuple[str, int]:
+    # a prefix ending between the two surrogates of a character outside the bmp drops the first one as well.
+    if dropped > 0 and len(text) > 0 and 0xd800 <= ord(text[-1]) <= 0xdbff:
+        return text[:-1], dropped + 1
+    return text, dropped
+
+
+def _join_string(pieces: list[str], surrogates: bool) -> str:
+    result = pieces[0] if len(pieces) == 1 else "".join(pieces)
+    if surrogates:
+        # java writes supplementary characters as two 3 byte surrogates, pair them up once the string is whole.
+        result = result.encode("utf-16-le", "surrogatepass").decode("utf-16-le", "surrogatepass")
+    return result
+
+
+def _readers(default: typing.Callable, *groups: tuple[typing.Iterable[int], typing.Callable]) -> list:
+    """
+    build a 256 entry table of handlers indexed by tag byte, later groups win over earlier ones.
+    """
+    table = [default] * 256
+    for codes, handler in groups:
+        for code in codes:
+            table[code] = handler
+    return table
+
+
+_INT_GROUPS = (
+    ([ord('N')], Hessian2Input._object_null),
+    ([ord('T')], Hessian2Input._object_true),
+    ([ord('F')], Hessian2Input._object_false),
+    (range(0x80, 0xc0), Hessian2Input._object_int_direct),
+    (range(0xc0, 0xd0), Hessian2Input._object_int_byte),
+    (range(0xd0, 0xd8), Hessian2Input._object_int_short),
+    ([ord('I'), BC_LONG_INT], Hessian2Input._object_int),
+    (range(0xd8, 0xf0), Hessian2Input._object_long_direct),
+    (range(0xf0, 0x100), Hessian2Input._object_long_byte),
+    (range(0x38, 0x40), Hessian2Input._object_long_short),
+    ([ord('L')], Hessian2Input._object_long),
+)
+
+_DOUBLE_GROUPS = (
+    ([BC_DOUBLE_ZERO], Hessian2Input._object_double_zero),
+    ([BC_DOUBLE_ONE], Hessian2Input._object_double_one),
+    ([BC_DOUBLE_BYTE], Hessian2Input._object_double_byte),
+    ([BC_DOUBLE_SHORT], Hessian2Input._object_double_short),
+    ([BC_DOUBLE_MILL], Hessian2Input._object_double_mill),
+    ([ord('D')], Hessian2Input._object_double),
+)
+
+_STRING_TAGS = frozenset([ord(BC_STRING_CHUNK), ord('S'), *range(0x00, 0x20), *range(0x30, 0x34)])
+
+_STRING_GROUPS = (
+    ([ord(BC_STRING_CHUNK), ord('S')], Hessian2Input._object_string_chunk),
+    (range(0x00, 0x20), Hessian2Input._object_string_short),
+    (range(0x30, 0x34), Hessian2Input._object_string_medium),
+)
+
+_OBJECT_READERS = _readers(
+    Hessian2Input._object_unknown,
+    *_INT_GROUPS,
+    *_DOUBLE_GROUPS,
+    *_STRING_GROUPS,
+    ([BC_DATE], Hessian2Input._object_date),
+    ([BC_DATE_MINUTE], Hessian2Input._object_date_minute),
+    ([ord(BC_BINARY_CHUNK), ord('B')], Hessian2Input._object_binary_chunk),
+    (range(0x20, 0x30), Hessian2Input._object_binary_short),
+    (range(0x34, 0x38), Hessian2Input._object_binary_medium),
+    ([BC_LIST_VARIABLE], Hessian2Input._object_list_variable),
+    ([BC_LIST_VARIABLE_UNTYPED], Hessian2Input._object_list_variable_untyped),
+    ([ord(BC_LIST_FIXED)], Hessian2Input._object_list_fixed),
+    ([BC_LIST_FIXED_UNTYPED], Hessian2Input._object_list_fixed_untyped),
+    (range(0x70, 0x78), Hessian2Input._object_list_short),
+    (range(0x78, 0x80), Hessian2Input._object_list_short_untyped),
+    ([ord('H')], Hessian2Input._object_map_untyped),
+    ([ord('M')], Hessian2Input._object_map),
+    ([ord('C')], Hessian2Input._object_class_definition),
+    (range(0x60, 0x70), Hessian2Input._object_instance_short),
+    ([ord('O')], Hessian2Input._object_instance),
+    ([BC_REF], Hessian2Input._object_ref),
+)
+
+_INT_READERS = _readers(
+    Hessian2Input._int_unknown,
+    *_INT_GROUPS,
+    ([ord('N'), ord('F'), BC_DOUBLE_ZERO], Hessian2Input._int_zero),
+    ([ord('T'), BC_DOUBLE_ONE], Hessian2Input._int_one),
+    ([BC_DOUBLE_BYTE], Hessian2Input._int_double_byte),
+    ([BC_DOUBLE_SHORT], Hessian2Input._int_double_short),
+    ([BC_DOUBLE_MILL], Hessian2Input._int_double_mill),
+    ([ord('D')], Hessian2Input._int_double),
+)
+
+_STRING_READERS = _readers(
+    Hessian2Input._string_unknown,
+    ([ord('N')], Hessian2Input._object_null),
+    ([ord('T')], Hessian2Input._string_true),
+    ([ord('F')], Hessian2Input._string_false),
+    *((codes, Hessian2Input._string_of_number) for codes, _ in _INT_GROUPS[3:] + _DOUBLE_GROUPS),
+    # whole strings whatever the value policy
+    (_STRING_TAGS, Hessian2Input._string_text),
+)
+
+# payload bytes after the tag of the values `skip_object` steps over without a handler, -1 for the others.
+_FIXED_WIDTHS = [-1] * 256
+for _codes, _width in (
+        ([ord('N'), ord('T'), ord('F'), BC_DOUBLE_ZERO, BC_DOUBLE_ONE], 0),
+        (range(0x80, 0xc0), 0),
+        (range(0xc0, 0xd0), 1),
+        (range(0xd0, 0xd8), 2),
+        ([ord('I'), BC_LONG_INT, BC_DOUBLE_MILL, BC_DATE_MINUTE], 4),
+        (range(0xd8, 0xf0), 0),
+        (range(0xf0, 0x100), 1),
+        (range(0x38, 0x40), 2),
+        ([ord('L'), ord('D'), BC_DATE], 8),
+        ([BC_DOUBLE_BYTE], 1),
+        ([BC_DOUBLE_SHORT], 2),
+):
+    for _code in _codes:
+        _FIXED_WIDTHS[_code] = _width
+
+# array typecodes of the java primitive arrays decoded by `read_number_run`, float values are sent as doubles.
+_ARRAY_TYPECODES = {"[int": "i", "[short": "i", "[long": "q", "[double": "d", "[float": "d"}
+
+_INT_TAGS = frozenset([*range(0x80, 0xd8), ord('I')])
+_RUN_TAGS = {
+    "i": _INT_TAGS,
+    "q": _INT_TAGS | frozenset([*range(0xd8, 0x100), *range(0x38, 0x40), BC_LONG_INT, ord('L')]),
+    "d": frozenset([BC_DOUBLE_ZERO, BC_DOUBLE_ONE, BC_DOUBLE_BYTE, BC_DOUBLE_SHORT, BC_DOUBLE_MILL, ord('D')]),
+}
+# per typecode, the payload bytes after each tag it takes, None for the others
+_RUN_WIDTHS = {
+    typecode: [_FIXED_WIDTHS[code] if code in tags else None for code in range(256)]
+    for typecode, tags in _RUN_TAGS.items()
+}
+# the typecode of a list of values like the one starting with each tag
+_RUN_TYPECODES = [None] * 256
+for _typecode in ("d", "q"):
+    for _code in _RUN_TAGS[_typecode]:
+        _RUN_TYPECODES[_code] = _typecode
+
+
+def _tag_bytes(bias: int) -> bytes:
+    # translation of a tag byte to the low byte of (tag - bias)
+    return bytes((code - bias) & 0xff for code in range(256))
+
+
+def _big_endian(values: array.array) -> array.array:
+    if sys.byteorder == "little":
+        values.byteswap()
+    return values
+
+
+def _byte_run(bias: int) -> typing.Callable:
+    table = _tag_bytes(bias)
+
+    def decode(data: bytes, size: int) -> array.array:
+        values = array.array("b")
+        values.frombytes(data.translate(table))
+        return values
+    return decode
+
+
+def _short_run(bias: int) -> typing.Callable:
+    table = _tag_bytes(bias)
+
+    def decode(data: bytes, size: int) -> array.array:
+        # the tag holds the high byte and the next byte the low byte of a 16 bit value.
+        pairs = bytearray(data)
+        pairs[0::2] = data[0::2].translate(table)
+        values = array.array("h")
+        values.frombytes(pairs)
+        return _big_endian(values)
+    return decode
+
+
+def _fixed_run(typecode: str) -> typing.Callable:
+    def decode(data: bytes, size: int) -> array.array:
+        # drop the tag in front of each big endian value.
+        width = len(data) // size - 1
+        packed = bytearray(size * width)
+        for i in range(0, width):
+            packed[i::width] = data[i + 1::width + 1]
+        values = array.array(typecode)
+        values.frombytes(packed)
+        return _big_endian(values)
+    return decode
+
+
+# values shorter than this are not decoded as a run
+_MIN_NUMBER_RUN = 8
+# per tag, the pattern of a run of values encoded like it, the width of one value and the decoder of a run
+_NUMBER_RUNS = [None] * 256
+for _codes, _pattern, _width, _decode in (
+        (range(0x80, 0xc0), rb"[\x80-\xbf]+", 1, _byte_run(BC_INT_ZERO)),
+        (range(0xd8, 0xf0), rb"[\xd8-\xef]+", 1, _byte_run(BC_LONG_ZERO)),
+        (range(0xc0, 0xd0), rb"(?:[\xc0-\xcf].)+", 2, _short_run(BC_INT_BYTE_ZERO)),
+        (range(0xf0, 0x100), rb"(?:[\xf0-\xff].)+", 2, _short_run(BC_LONG_BYTE_ZERO)),
+        ([ord('I')], rb"(?:I.{4})+", 5, _fixed_run("i")),
+        ([ord('L')], rb"(?:L.{8})+", 9, _fixed_run("q")),
+        ([ord('D')], rb"(?:D.{8})+", 9, _fixed_run("d")),
+):
+    for _code in _codes:
+        _NUMBER_RUNS[_code] = (re.compile(_pattern, re.DOTALL), _width, _decode)
+
+_SKIPPERS = _readers(
+    Hessian2Input._object_unknown,
+    ([ord(BC_STRING_CHUNK), ord('S')], Hessian2Input._skip_string_chunk),
+    (range(0x00, 0x20), Hessian2Input._skip_string_short),
+    (range(0x30, 0x34), Hessian2Input._skip_string_medium),
+    ([ord(BC_BINARY_CHUNK), ord('B')], Hessian2Input._skip_binary_chunk),
+    (range(0x20, 0x30), Hessian2Input._skip_binary_short),
+    (range(0x34, 0x38), Hessian2Input._skip_binary_medium),
+    ([BC_LIST_VARIABLE], Hessian2Input._skip_list_variable),
+    ([BC_LIST_VARIABLE_UNTYPED, ord('H')], Hessian2Input._skip_list_variable_untyped),
+    ([ord(BC_LIST_FIXED)], Hessian2Input._skip_list_fixed),
+    ([BC_LIST_FIXED_UNTYPED], Hessian2Input._skip_list_fixed_untyped),
+    (range(0x70, 0x78), Hessian2Input._skip_list_short),
+    (range(0x78, 0x80), Hessian2Input._skip_list_short_untyped),
+    ([ord('M')], Hessian2Input._skip_map),
+    ([ord('C')], Hessian2Input._skip_class_definition),
+    (range(0x60, 0x70), Hessian2Input._skip_instance_short),
+    ([ord('O')], Hessian2Input._skip_instance),
+    ([BC_REF], Hessian2Input._skip_ref),
+)
+
+
+class Hessian2StreamInput(Hessian2Input):
+    """
+    incremental hessian decoder, fed with the pieces of a body as they arrive.
+
+    decoding runs as a generator that suspends whenever the next value needs bytes that have not been fed yet and
+    resumes at the same point on the next `feed`. bytes are dropped as soon as they are decoded, so only the
+    undecoded tail of the input and the values under construction are kept. fixed width scalars reuse the
+    `Hessian2Input` handlers once their bytes are present.
+    """
+
+    def __init__(self, ref_markers: bool = False, value_policy: ValuePolicy = None):
+        super().__init__(bytearray(), ref_markers, value_policy=value_policy)
+        self._values = []
+        self._in_value = False
+        self._decoding = self._decode_values()
+        next(self._decoding)
+
+    def feed(self, data) -> list:
+        """
+        append `data` and return the top level values it completes.
+        """
+        if self._decoding is None:
+            raise Exception("stream decoder failed on earlier input")
+        if self._offset > 0:
+            del self._buffer[:self._offset]
+            self._offset = 0
+        self._buffer += data
+        self._length = len(self._buffer)
+        try:
+            self._decoding.send(None)
+        except BaseException:
+            self._decoding = None
+            raise
+        values, self._values = self._values, []
+        return values
+
+    @property
+    def pending(self) -> bool:
+        """
+        True while a value has been started but not completed.
+        """
+        return self._in_value or self._offset < self._length
+
+    def close(self):
+        if self.pending:
+            raise Exception(f"unexpected end of file, {self._length - self._offset} undecoded bytes")
+
+    def _decode_values(self):
+        while True:
+            yield from self._need(1)
+            self._in_value = True
+            value = yield from self._object()
+            self._values.append(value)
+            self._in_value = False
+
+    def _need(self, size: int):
+        while self._length - self._offset < size:
+            yield
+
+    def _next_tag(self):
+        yield from self._need(1)
+        tag = self._buffer[self._offset]
+        self._offset = self._offset + 1
+        return tag
+
+    def _object(self):
+        tag = yield from self._next_tag()
+        width = _FIXED_WIDTHS[tag]
+        if width < 0:
+            return (yield from _STREAM_READERS[tag](self, tag))
+        yield from self._need(width)
+        return _OBJECT_READERS[tag](self, tag)
+
+    def _int(self):
+        tag = yield from self._next_tag()
+        yield from self._need(max(_FIXED_WIDTHS[tag], 0))
+        return _INT_READERS[tag](self, tag)
+
+    def _string_value(self):
+        tag = yield from self._next_tag()
+        if tag in _STRING_TAGS:
+            return (yield from self._string(tag))
+        yield from self._need(max(_FIXED_WIDTHS[tag], 0))
+        return _STRING_READERS[tag](self, tag)
+
+    def _type(self):
+        yield from self._need(1)
+        if self._buffer[self._offset] in _STRING_TAGS:
+            tp = yield from self._string_value()
+            self._types.append(tp)
+            return tp
+        ref = yield from self._int()
+        if len(self._types) <= ref:
+            raise Exception(f"type ref {ref} is greater than the number of valid types({len(self._types)})")
+        return self._types[ref]
+
+    def _string_chunk_header(self, tag: int):
+        if tag == ord(BC_STRING_CHUNK) or tag == ord('S'):
+            yield from self._need(2)
+            return tag == ord('S'), self._unpack(_UINT16)
+        if 0x00 <= tag <= 0x1f:
+            return True, tag - 0x00
+        if 0x30 <= tag <= 0x33:
+            yield from self._need(1)
+            return True, ((tag - 0x30) << 8) + self._read_byte()
+        raise Exception(f"expect string code {tag}")
+
+    def _string(self, tag: int):
+        text, _ = yield from self._string_prefix(tag, None)
+        return text
+
+    def _string_prefix(self, tag: int, limit: int | None):
+        """
+        decode a string keeping its first `limit` utf-16 units, all of them when `limit` is None, returns the text and
+        the number of units dropped. the dropped part is decoded piece by piece and not kept.
+        """
+        pieces = []
+        surrogates = False
+        left = sys.maxsize if limit is None else limit
+        dropped = 0
+        is_last, remaining = yield from self._string_chunk_header(tag)
+        while True:
+            while remaining > 0:
+                yield from self._need(1)
+                offset = self._offset
+                # while the prefix is short no more than the units it still takes are decoded.
+                window = remaining if left == 0 else min(remaining, left)
+                try:
+                    text, consumed = codecs.utf_8_decode(
+                        self._buffer[offset:offset + window], "surrogatepass", False
+                    )
+                    if consumed == 0:
+                        # the character is cut by the end of the input, or wider than the units left in the window.
+                        width = _UTF8_WIDTH[self._buffer[offset]]
+                        yield from self._need(width)
+                        offset = self._offset
+                        text, consumed = codecs.utf_8_decode(
+                            self._buffer[offset:offset + width], "surrogatepass", True
+                        )
+                except UnicodeDecodeError as e:
+                    raise Exception(f"bad utf-8 encoding at {offset + e.start}")
+                self._offset = offset + consumed
+                units = consumed if consumed == len(text) else _utf16_units(text)
+                remaining = remaining - units
+                if units > left:
+                    dropped = dropped + units
+                    left = 0
+                    continue
+                left = left - units
+                if consumed != len(text):
+                    surrogates = surrogates or _SURROGATE.search(text) is not None
+                pieces.append(text)
+            if is_last:
+                return _cut_pair(_join_string(pieces, surrogates) if len(pieces) > 0 else "", dropped)
+            tag = yield from self._next_tag()
+            is_last, remaining = yield from self._string_chunk_header(tag)
+
+    def _binary_chunk_header(self, tag: int):
+        if tag == ord(BC_BINARY_CHUNK) or tag == ord('B'):
+            yield from self._need(2)
+            return tag == ord('B'), self._unpack(_UINT16)
+        if 0x20 <= tag <= 0x2f:
+            return True, tag - 0x20
+        if 0x34 <= tag <= 0x37:
+            yield from self._need(1)
+            return True, ((tag - 0x34) << 8) + self._read_byte()
+        raise Exception(f"expect byte[], got {tag}")
+
+    def _binary(self, tag: int):
+        pieces = []
+        is_last, remaining = yield from self._binary_chunk_header(tag)
+        while True:
+            while remaining > 0:
+                yield from self._need(1)
+                size = min(remaining, self._length - self._offset)
+                pieces.append(self._buffer[self._offset:self._offset + size])
+                self._offset = self._offset + size
+                remaining = remaining - size
+            if is_last:
+                return b"".join(pieces)
+            tag = yield from self._next_tag()
+            is_last, remaining = yield from self._binary_chunk_header(tag)
+
+    def _stream_string(self, tag: int):
+        text, _ = yield from self._string_prefix(tag, self._max_string_length)
+        return text
+
+    def _stream_binary(self, tag: int):
+        data = yield from self._binary(tag)
+        return data if self._binaries is None else self._binary_of(data)
+
+    def _values_until_end(self):
+        result = []
+        self.add_ref(result)
+        while True:
+            yield from self._need(1)
+            if self._buffer[self._offset] == ord('Z'):
+                self._offset = self._offset + 1
+                return result
+            result.append((yield from self._object()))
+
+    def _values_of(self, length: int):
+        result = []
+        self.add_ref(result)
+        for _ in range(0, length):
+            result.append((yield from self._object()))
+        return result
+
+    def _stream_list_variable(self, tag: int):
+        yield from self._type()
+        return (yield from self._values_until_end())
+
+    def _stream_list_variable_untyped(self, tag: int):
+        return (yield from self._values_until_end())
+
+    def _stream_list_fixed(self, tag: int):
+        yield from self._type()
+        length = yield from self._int()
+        return (yield from self._values_of(length))
+
+    def _stream_list_fixed_untyped(self, tag: int):
+        length = yield from self._int()
+        return (yield from self._values_of(length))
+
+    def _stream_list_short(self, tag: int):
+        yield from self._type()
+        return (yield from self._values_of(tag - 0x70))
+
+    def _stream_list_short_untyped(self, tag: int):
+        return (yield from self._values_of(tag - 0x78))
+
+    def _stream_map_untyped(self, tag: int):
+        result = {}
+        self.add_ref(result)
+        while True:
+            yield from self._need(1)
+            if self._buffer[self._offset] == ord('Z'):
+                self._offset = self._offset + 1
+                return result
+            key = yield from self._key()
+            result[key] = yield from self._object()
+
+    def _key(self):
+        # string keys are read whole, as `read_key` reads them.
+        yield from self._need(1)
+        if self._buffer[self._offset] in _STRING_TAGS:
+            return (yield from self._string_value())
+        return (yield from Hessian2StreamInput._object(self))
+
+    def _stream_map(self, tag: int):
+        yield from self._type()
+        return (yield from self._stream_map_untyped(tag))
+
+    def _class_definition(self):
+        tp = yield from self._string_value()
+        length = yield from self._int()
+        field_names = []
+        for _ in range(0, length):
+            field_names.append((yield from self._string_value()))
+        self._class_def_list.append(object_definition(tp, field_names))
+
+    def _stream_class_definition(self, tag: int):
+        yield from self._class_definition()
+        return (yield from self._object())
+
+    def _stream_instance_short(self, tag: int):
+        return (yield from self._stream_fields(tag - 0x60))
+
+    def _stream_instance(self, tag: int):
+        ref = yield from self._int()
+        return (yield from self._stream_fields(ref))
+
+    def _stream_fields(self, ref: int):
+        if ref >= len(self._class_def_list):
+            raise Exception(f"No classes defined at reference {ref}")
+        result = {}
+        self.add_ref(result)
+        for field_name in self._class_def_list[ref].fields:
+            result[field_name] = yield from self._object()
+        return result
+
+    def _stream_ref(self, tag: int):
+        index = yield from self._int()
+        return self._shared(index)
+
+    def _stream_unknown(self, tag: int):
+        raise Exception(f"readObject: unknown code {tag}")
+        yield
+
+    def _skip(self):
+        """
+        consume the next value without building it, registering its class definitions, types and references as
+        `_object` would. strings and binaries are dropped piece by piece as they arrive.
+        """
+        tag = yield from self._next_tag()
+        width = _FIXED_WIDTHS[tag]
+        if width < 0:
+            yield from _STREAM_SKIPPERS[tag](self, tag)
+            return
+        yield from self._need(width)
+        self._offset = self._offset + width
+
+    def _skip_values_of(self, length: int):
+        for _ in range(0, length):
+            yield from self._skip()
+
+    def _skip_values_until_end(self) -> int:
+        # map entries are skipped as a flat run of keys and values, returns the number of values skipped.
+        skipped = 0
+        while True:
+            yield from self._need(1)
+            if self._buffer[self._offset] == ord('Z'):
+                self._offset = self._offset + 1
+                return skipped
+            yield from self._skip()
+            skipped = skipped + 1
+
+    def _stream_skip_string(self, tag: int):
+        yield from self._string_prefix(tag, 0)
+
+    def _stream_skip_binary(self, tag: int):
+        is_last, remaining = yield from self._binary_chunk_header(tag)
+        while True:
+            while remaining > 0:
+                yield from self._need(1)
+                size = min(remaining, self._length - self._offset)
+                self._offset = self._offset + size
+                remaining = remaining - size
+            if is_last:
+                return
+            tag = yield from self._next_tag()
+            is_last, remaining = yield from self._binary_chunk_header(tag)
+
+    def _stream_skip_list_variable(self, tag: int):
+        yield from self._type()
+        self.add_ref(None)
+        yield from self._skip_values_until_end()
+
+    def _stream_skip_list_variable_untyped(self, tag: int):
+        self.add_ref(None)
+        yield from self._skip_values_until_end()
+
+    def _stream_skip_list_fixed(self, tag: int):
+        yield from self._type()
+        length = yield from self._int()
+        self.add_ref(None)
+        yield from self._skip_values_of(length)
+
+    def _stream_skip_list_fixed_untyped(self, tag: int):
+        length = yield from self._int()
+        self.add_ref(None)
+        yield from self._skip_values_of(length)
+
+    def _stream_skip_list_short(self, tag: int):
+        yield from self._type()
+        self.add_ref(None)
+        yield from self._skip_values_of(tag - 0x70)
+
+    def _stream_skip_list_short_untyped(self, tag: int):
+        self.add_ref(None)
+        yield from self._skip_values_of(tag - 0x78)
+
+    def _stream_skip_map(self, tag: int):
+        yield from self._type()
+        self.add_ref(None)
+        yield from self._skip_values_until_end()
+
+    def _stream_skip_class_definition(self, tag: int):
+        yield from self._class_definition()
+        yield from self._skip()
+
+    def _stream_skip_instance_short(self, tag: int):
+        yield from self._stream_skip_fields(tag - 0x60)
+
+    def _stream_skip_instance(self, tag: int):
+        ref = yield from self._int()
+        yield from self._stream_skip_fields(ref)
+
+    def _stream_skip_fields(self, ref: int):
+        if ref >= len(self._class_def_list):
+            raise Exception(f"No classes defined at reference {ref}")
+        self.add_ref(None)
+        yield from self._skip_values_of(len(self._class_def_list[ref].fields))
+
+    def _stream_skip_ref(self, tag: int):
+        yield from self._int()
+
+
+_STREAM_GROUPS = (
+    (_STRING_TAGS, Hessian2StreamInput._stream_string),
+    ([ord(BC_BINARY_CHUNK), ord('B'), *range(0x20, 0x30), *range(0x34, 0x38)], Hessian2StreamInput._stream_binary),
+    ([BC_LIST_VARIABLE], Hessian2StreamInput._stream_list_variable),
+    ([BC_LIST_VARIABLE_UNTYPED], Hessian2StreamInput._stream_list_variable_untyped),
+    ([ord(BC_LIST_FIXED)], Hessian2StreamInput._stream_list_fixed),
+    ([BC_LIST_FIXED_UNTYPED], Hessian2StreamInput._stream_list_fixed_untyped),
+    (range(0x70, 0x78), Hessian2StreamInput._stream_list_short),
+    (range(0x78, 0x80), Hessian2StreamInput._stream_list_short_untyped),
+    ([ord('H')], Hessian2StreamInput._stream_map_untyped),
+    ([ord('M')], Hessian2StreamInput._stream_map),
+    ([ord('C')], Hessian2StreamInput._stream_class_definition),
+    (range(0x60, 0x70), Hessian2StreamInput._stream_instance_short),
+    ([ord('O')], Hessian2StreamInput._stream_instance),
+    ([BC_REF], Hessian2StreamInput._stream_ref),
+)
+_STREAM_READERS = _readers(Hessian2StreamInput._stream_unknown, *_STREAM_GROUPS)
+
+_STREAM_SKIPPERS = _readers(
+    Hessian2StreamInput._stream_unknown,
+    (_STRING_TAGS, Hessian2StreamInput._stream_skip_string),
+    ([ord(BC_BINARY_CHUNK), ord('B'), *range(0x20, 0x30), *range(0x34, 0x38)],
+     Hessian2StreamInput._stream_skip_binary),
+    ([BC_LIST_VARIABLE], Hessian2StreamInput._stream_skip_list_variable),
+    ([BC_LIST_VARIABLE_UNTYPED, ord('H')], Hessian2StreamInput._stream_skip_list_variable_untyped),
+    ([ord(BC_LIST_FIXED)], Hessian2StreamInput._stream_skip_list_fixed),
+    ([BC_LIST_FIXED_UNTYPED], Hessian2StreamInput._stream_skip_list_fixed_untyped),
+    (range(0x70, 0x78), Hessian2StreamInput._stream_skip_list_short),
+    (range(0x78, 0x80), Hessian2StreamInput._stream_skip_list_short_untyped),
+    ([ord('M')], Hessian2StreamInput._stream_skip_map),
+    ([ord('C')], Hessian2StreamInput._stream_skip_class_definition),
+    (range(0x60, 0x70), Hessian2StreamInput._stream_skip_instance_short),
+    ([ord('O')], Hessian2StreamInput._stream_skip_instance),
+    ([BC_REF], Hessian2StreamInput._stream_skip_ref),
+)
+
+
+class DecodedValues:
+    """
+    the top level values of a body decoded by `Hessian2StreamInput`, read back in order through the calls the
+    dubbo parser makes on a `Hessian2Input`.
+    """
+
+    def __init__(self, values: list):
+        self._values = values
+        self._index = 0
+
+    def read_object(self) -> typing.Any:
+        if self._index >= len(self._values):
+            raise Exception("readObject: unexpected end of file")
+        value = self._values[self._index]
+        self._index = self._index + 1
+        return value
+
+    def read_utf(self) -> str:
+        return self.read_object()
+
+    def read_int(self) -> int:
+        return self.read_object()
+
+    def skip_object(self):
+        self.read_object()
@@ -0,0 +1,537 @@
+#!/bin/python
+# -- coding: utf-8 --
+import base64
+import datetime
+import json
+import math
+import sys
+import typing
+from dataclasses import dataclass
+from json.encoder import encode_basestring, encode_basestring_ascii
+
+from hessian2.common import ValuePolicy
+from hessian2.hessian2_input import (BC_BINARY_CHUNK, BC_DATE, BC_DATE_MINUTE, BC_DOUBLE_ONE, BC_DOUBLE_ZERO,
+                                     BC_INT_BYTE_ZERO, BC_INT_ZERO, BC_LIST_FIXED, BC_LIST_FIXED_UNTYPED,
+                                     BC_LIST_VARIABLE, BC_LIST_VARIABLE_UNTYPED, BC_LONG_ZERO, BC_REF, DecodedValues,
+                                     Hessian2Input, Hessian2StreamInput, _DOUBLE_GROUPS, _FIXED_WIDTHS, _INT_GROUPS,
+                                     _OBJECT_READERS, _STREAM_GROUPS, _STRING_GROUPS, _STRING_TAGS, _readers)
+
+
+@dataclass(slots=True)
+class DecodeBudget:
+    """
+    limits on the json written by one `read_json` or `read_json_values` call, None for no limit.
+
+    what does not fit is skipped and marked. a value starting after `max_bytes` of the call's input is written as
+    `{"$truncated": "bytes"}`, except the one byte constants whose text is shorter than the marker, and a container
+    nested deeper than `max_depth` as `{"$truncated": "depth"}`. a list keeping `max_elements` values ends with
+    `{"$truncated": n}` and a map gets a `"$truncated": n` entry for the n values or entries dropped. a string longer
+    than `max_string_length` becomes `{"$truncated": n, "prefix": ...}` with its first characters.
+    """
+    max_bytes: int = None
+    max_elements: int = None
+    max_depth: int = None
+    max_string_length: int = None
+
+
+def json_default(value: typing.Any) -> str:
+    """
+    the json form of the decoded values json has no type for, dates as iso 8601 text, binaries as base64 and
+    numeric arrays as lists.
+    """
+    if hasattr(value, "tolist"):
+        return value.tolist()
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    if isinstance(value, (bytes, bytearray)):
+        return base64.b64encode(value).decode("ascii")
+    raise TypeError(f"Object of type {value.__class__.__name__} is not JSON serializable")
+
+
+def _float_text(value: float) -> str:
+    # the same text as json.dumps
+    if math.isfinite(value):
+        return float.__repr__(value)
+    if math.isnan(value):
+        return "NaN"
+    return "Infinity" if value > 0 else "-Infinity"
+
+
+class Hessian2JsonTranscoder(Hessian2Input):
+    """
+    hessian decoder writing json text instead of python values, the text is the same as `json.dumps` of the values
+    `Hessian2Input(buffer, ref_markers=True, value_policy=value_policy)` decodes, with dates and binaries as in
+    `json_default`.
+
+    lists, maps and objects are written as their values are read, without building the containers. the text is
+    appended piece by piece to `out`, a list the caller may keep and reuse across bodies. a `budget` bounds the
+    work and output of each call.
+    """
+
+    def __init__(self, buffer: bytes, out: list[str] = None, ensure_ascii: bool = False, budget: DecodeBudget = None,
+                 value_policy: ValuePolicy = None):
+        super().__init__(buffer, ref_markers=True, value_policy=value_policy)
+        self._out = list[str]() if out is None else out
+        self._encode_string = encode_basestring_ascii if ensure_ascii else encode_basestring
+        # per class definition index, the text before each field value, `{"a": ` then `, "b": `
+        self._field_prefixes = list[tuple[str, ...]]()
+        self._budget = DecodeBudget() if budget is None else budget
+        self._max_elements = sys.maxsize if self._budget.max_elements is None else self._budget.max_elements
+        self._max_depth = sys.maxsize if self._budget.max_depth is None else self._budget.max_depth
+        # the policy's cap is the default, a budget marks what it cuts
+        if self._budget.max_string_length is None:
+            self._string_budget = None
+        elif self._max_string_length is None:
+            self._string_budget = self._budget.max_string_length
+        else:
+            self._string_budget = min(self._budget.max_string_length, self._max_string_length)
+        # input offset past which values of the current call are truncated, and the containers being written
+        self._byte_limit = sys.maxsize
+        self._depth = 0
+
+    def read_json(self) -> str:
+        """
+        the json text of the next value.
+        """
+        out = self._out
+        out.clear()
+        self._start_call()
+        self.write_object(out)
+        return "".join(out)
+
+    def read_json_values(self, count: int) -> str:
+        """
+        the json array of the next `count` values.
+        """
+        out = self._out
+        out.clear()
+        self._start_call()
+        out.append("[")
+        for i in range(0, count):
+            if i > 0:
+                out.append(", ")
+            self.write_object(out)
+        out.append("]")
+        return "".join(out)
+
+    def _start_call(self):
+        max_bytes = self._budget.max_bytes
+        self._byte_limit = sys.maxsize if max_bytes is None else self._offset + max_bytes
+        self._depth = 0
+
+    def write_object(self, out: list[str]):
+        if self._offset >= self._length:
+            raise Exception("readObject: unexpected end of file")
+        tag = self._buffer[self._offset]
+        self._offset = self._offset + 1
+        text = _TAG_TEXTS[tag]
+        if text is not None:
+            out.append(text)
+        elif self._offset > self._byte_limit:
+            self._write_skipped(out, '{"$truncated": "bytes"}')
+        elif self._depth >= self._max_depth and _CONTAINER_TAGS[tag]:
+            self._write_skipped(out, '{"$truncated": "depth"}')
+        else:
+            _JSON_WRITERS[tag](self, tag, out)
+
+    def _write_skipped(self, out: list[str], marker: str):
+        # the tag has been read already.
+        self._offset = self._offset - 1
+        self.skip_object()
+        out.append(marker)
+
+    def _skip_rest(self, length: int) -> int:
+        for _ in range(0, length):
+            self.skip_object()
+        return length
+
+    def _skip_until_end_counting(self) -> int:
+        skipped = 0
+        while not self.is_end():
+            self.skip_object()
+            skipped = skipped + 1
+        return skipped
+
+    def _json_int(self, tag: int, out: list[str]):
+        out.append(int.__repr__(_OBJECT_READERS[tag](self, tag)))
+
+    def _json_int_byte(self, tag: int, out: list[str]):
+        # the most common form of ids and counts, read inline
+        if self._offset >= self._length:
+            raise Exception(f"exceed _buffer length, _offset={self._offset}, length={self._length}")
+        out.append(_INT_BYTE_TEXTS[((tag - 0xc0) << 8) + self._buffer[self._offset]])
+        self._offset = self._offset + 1
+
+    def _json_double(self, tag: int, out: list[str]):
+        out.append(_float_text(_OBJECT_READERS[tag](self, tag)))
+
+    def _json_string(self, tag: int, out: list[str]):
+        if self._string_budget is None:
+            out.append(self._encode_string(_OBJECT_READERS[tag](self, tag)))
+            return
+        self.read_string_header(tag)
+        text, dropped = self.parse_string_prefix(self._string_budget)
+        if dropped == 0:
+            out.append(self._encode_string(text))
+        else:
+            out.append(f'{{"$truncated": {dropped}, "prefix": {self._encode_string(text)}}}')
+
+    def _json_date(self, tag: int, out: list[str]):
+        value = _OBJECT_READERS[tag](self, tag)
+        out.append(int.__repr__(value) if self._dates_as_millis else self._encode_string(value.isoformat()))
+
+    def _json_binary(self, tag: int, out: list[str]):
+        value = _OBJECT_READERS[tag](self, tag)
+        if isinstance(value, bytes):
+            out.append('"' + base64.b64encode(value).decode("ascii") + '"')
+        else:
+            out.append(json.dumps(value))
+
+    def _json_list_variable(self, tag: int, out: list[str]):
+        self.read_type()
+        self._write_until_end(out)
+
+    def _json_list_variable_untyped(self, tag: int, out: list[str]):
+        self._write_until_end(out)
+
+    def _json_list_fixed(self, tag: int, out: list[str]):
+        tp = self.read_type()
+        self._write_values(self.read_int(), tp, out)
+
+    def _json_list_fixed_untyped(self, tag: int, out: list[str]):
+        self._write_values(self.read_int(), None, out)
+
+    def _json_list_short(self, tag: int, out: list[str]):
+        tp = self.read_type()
+        self._write_values(tag - 0x70, tp, out)
+
+    def _json_list_short_untyped(self, tag: int, out: list[str]):
+        self._write_values(tag - 0x78, None, out)
+
+    def _write_values(self, length: int, tp: str | None, out: list[str]):
+        self.add_ref(None)
+        if length <= 0:
+            out.append("[]")
+            return
+        self._depth = self._depth + 1
+        out.append("[")
+        kept = min(length, self._max_elements)
+        written = 0
+        typecode = None if kept <= 0 else self._array_typecode(kept, tp)
+        if typecode is not None:
+            # numbers are read in one loop and written with a single join, the text is the same.
+            values = self.read_number_run(kept, typecode)
+            written = len(values)
+            if typecode != "d":
+                out.append(", ".join(map(int.__repr__, values)))
+            elif all(map(math.isfinite, values)):
+                out.append(", ".join(map(float.__repr__, values)))
+            else:
+                out.append(", ".join(map(_float_text, values)))
+        write_object = self.write_object
+        while written < kept and self._offset <= self._byte_limit:
+            if written > 0:
+                out.append(", ")
+            write_object(out)
+            written = written + 1
+        if written < length:
+            self._write_dropped(self._skip_rest(length - written), written, out)
+        out.append("]")
+        self._depth = self._depth - 1
+
+    def _write_until_end(self, out: list[str]):
+        self.add_ref(None)
+        self._depth = self._depth + 1
+        out.append("[")
+        written = 0
+        while not self.is_end():
+            if written >= self._max_elements or self._offset > self._byte_limit:
+                self._write_dropped(self._skip_until_end_counting(), written, out)
+                break
+            if written > 0:
+                out.append(", ")
+            self.write_object(out)
+            written = written + 1
+        self.read_end()
+        out.append("]")
+        self._depth = self._depth - 1
+
+    def _write_dropped(self, dropped: int, written: int, out: list[str]):
+        if written > 0:
+            out.append(", ")
+        out.append(f'{{"$truncated": {dropped}}}')
+
+    def _json_map(self, tag: int, out: list[str]):
+        self.read_type()
+        self._json_map_untyped(tag, out)
+
+    def _json_map_untyped(self, tag: int, out: list[str]):
+        self.add_ref(None)
+        self._depth = self._depth + 1
+        out.append("{")
+        written = 0
+        while not self.is_end():
+            if written >= self._max_elements or self._offset > self._byte_limit:
+                if written > 0:
+                    out.append(", ")
+                # keys and values are skipped as a flat run.
+                out.append(f'"$truncated": {self._skip_until_end_counting() // 2}')
+                break
+            if written > 0:
+                out.append(", ")
+            written = written + 1
+            if self._buffer[self._offset] in _STRING_TAGS:
+                # whole, a cap on strings would make distinct keys the same.
+                out.append(self._encode_string(self.read_string()))
+            else:
+                # json keys are strings, other keys are written as the string of their json text.
+                start = len(out)
+                self.write_object(out)
+                key = "".join(out[start:])
+                del out[start:]
+                out.append(self._encode_string(key[1:-1] if key[0] == '"' else key))
+            out.append(": ")
+            self.write_object(out)
+        self.read_end()
+        out.append("}")
+        self._depth = self._depth - 1
+
+    def _json_class_definition(self, tag: int, out: list[str]):
+        self.read_object_definition()
+        self.write_object(out)
+
+    def _json_instance_short(self, tag: int, out: list[str]):
+        self._write_fields(tag - 0x60, out)
+
+    def _json_instance(self, tag: int, out: list[str]):
+        self._write_fields(self.read_int(), out)
+
+    def _write_fields(self, ref: int, out: list[str]):
+        if ref >= len(self._class_def_list):
+            raise Exception(f"No classes defined at reference {ref}")
+        prefixes = self._field_prefixes
+        while len(prefixes) < len(self._class_def_list):
+            prefixes.append(self._prefixes_of(self._class_def_list[len(prefixes)].fields))
+        self.add_ref(None)
+        field_prefixes = prefixes[ref]
+        if len(field_prefixes) == 0:
+            out.append("{}")
+            return
+        self._depth = self._depth + 1
+        for prefix in field_prefixes:
+            out.append(prefix)
+            self.write_object(out)
+        out.append("}")
+        self._depth = self._depth - 1
+
+    def _prefixes_of(self, fields: tuple[str, ...]) -> tuple[str, ...]:
+        keys = [self._encode_string(name if type(name) is str else json.dumps(name)) for name in fields]
+        return tuple(("{" if i == 0 else ", ") + key + ": " for i, key in enumerate(keys))
+
+    def _json_ref(self, tag: int, out: list[str]):
+        index = self.read_int()
+        self._shared(index)
+        out.append(f'{{"$ref": {index}}}')
+
+    def _json_unknown(self, tag: int, out: list[str]):
+        raise Exception(f"readObject: unknown code {tag}")
+
+
+# the text of the values held in the tag byte alone, None for the others.
+_TAG_TEXTS = [None] * 256
+_TAG_TEXTS[ord('N')] = "null"
+_TAG_TEXTS[ord('T')] = "true"
+_TAG_TEXTS[ord('F')] = "false"
+_TAG_TEXTS[BC_DOUBLE_ZERO] = "0.0"
+_TAG_TEXTS[BC_DOUBLE_ONE] = "1.0"
+for _tag in range(0x80, 0xc0):
+    _TAG_TEXTS[_tag] = str(_tag - BC_INT_ZERO)
+for _tag in range(0xd8, 0xf0):
+    _TAG_TEXTS[_tag] = str(_tag - BC_LONG_ZERO)
+# tags starting a list, map or object, the values `max_depth` applies to
+_CONTAINER_TAGS = [False] * 256
+for _tag in (BC_LIST_VARIABLE, BC_LIST_VARIABLE_UNTYPED, ord(BC_LIST_FIXED), BC_LIST_FIXED_UNTYPED, *range(0x70, 0x80),
+             ord('H'), ord('M'), ord('C'), *range(0x60, 0x70), ord('O')):
+    _CONTAINER_TAGS[_tag] = True
+# the text of each two byte int, indexed by the low four bits of the tag and the second byte
+_INT_BYTE_TEXTS = [str(((tag - BC_INT_BYTE_ZERO) << 8) + b) for tag in range(0xc0, 0xd0) for b in range(256)]
+
+_JSON_WRITERS = _readers(
+    Hessian2JsonTranscoder._json_unknown,
+    *((codes, Hessian2JsonTranscoder._json_int) for codes, _ in _INT_GROUPS[3:]),
+    (range(0xc0, 0xd0), Hessian2JsonTranscoder._json_int_byte),
+    *((codes, Hessian2JsonTranscoder._json_double) for codes, _ in _DOUBLE_GROUPS),
+    *((codes, Hessian2JsonTranscoder._json_string) for codes, _ in _STRING_GROUPS),
+    ([BC_DATE, BC_DATE_MINUTE], Hessian2JsonTranscoder._json_date),
+    ([ord(BC_BINARY_CHUNK), ord('B'), *range(0x20, 0x30), *range(0x34, 0x38)], Hessian2JsonTranscoder._json_binary),
+    ([BC_LIST_VARIABLE], Hessian2JsonTranscoder._json_list_variable),
+    ([BC_LIST_VARIABLE_UNTYPED], Hessian2JsonTranscoder._json_list_variable_untyped),
+    ([ord(BC_LIST_FIXED)], Hessian2JsonTranscoder._json_list_fixed),
+    ([BC_LIST_FIXED_UNTYPED], Hessian2JsonTranscoder._json_list_fixed_untyped),
+    (range(0x70, 0x78), Hessian2JsonTranscoder._json_list_short),
+    (range(0x78, 0x80), Hessian2JsonTranscoder._json_list_short_untyped),
+    ([ord('H')], Hessian2JsonTranscoder._json_map_untyped),
+    ([ord('M')], Hessian2JsonTranscoder._json_map),
+    ([ord('C')], Hessian2JsonTranscoder._json_class_definition),
+    (range(0x60, 0x70), Hessian2JsonTranscoder._json_instance_short),
+    ([ord('O')], Hessian2JsonTranscoder._json_instance),
+    ([BC_REF], Hessian2JsonTranscoder._json_ref),
+)
+
+
+class Hessian2JsonStreamInput(Hessian2StreamInput):
+    """
+    `Hessian2StreamInput` cutting the values it decodes down to a `budget` as they arrive, marked as
+    `Hessian2JsonTranscoder` marks them, so a large streamed body only ever holds what is kept.
+
+    the first `unbounded` top level values, the header strings a reader takes with `read_utf`, are decoded whole.
+    each later value gets its own `max_bytes`, where the transcoder counts them per call.
+    """
+
+    def __init__(self, ref_markers: bool = False, value_policy: ValuePolicy = None, budget: DecodeBudget = None,
+                 unbounded: int = 0):
+        super().__init__(ref_markers, value_policy)
+        budget = DecodeBudget() if budget is None else budget
+        self._max_bytes = budget.max_bytes
+        self._max_elements = sys.maxsize if budget.max_elements is None else budget.max_elements
+        self._max_depth = sys.maxsize if budget.max_depth is None else budget.max_depth
+        if budget.max_string_length is None:
+            self._string_budget = None
+        elif self._max_string_length is None:
+            self._string_budget = budget.max_string_length
+        else:
+            self._string_budget = min(budget.max_string_length, self._max_string_length)
+        self._unbounded = unbounded
+        # input bytes dropped from the front of the buffer, and the input position past which values are truncated
+        self._consumed = 0
+        self._byte_limit = sys.maxsize
+        self._depth = 0
+
+    def feed(self, data) -> list:
+        self._consumed = self._consumed + self._offset
+        return super().feed(data)
+
+    def _decode_values(self):
+        count = 0
+        while True:
+            yield from self._need(1)
+            self._in_value = True
+            if count < self._unbounded:
+                value = yield from Hessian2StreamInput._object(self)
+            else:
+                if self._max_bytes is not None:
+                    self._byte_limit = self._consumed + self._offset + self._max_bytes
+                self._depth = 0
+                value = yield from self._object()
+            count = count + 1
+            self._values.append(value)
+            self._in_value = False
+
+    def _past_limit(self) -> bool:
+        return self._consumed + self._offset > self._byte_limit
+
+    def _object(self):
+        tag = yield from self._next_tag()
+        width = _FIXED_WIDTHS[tag]
+        if width != 0 and self._past_limit():
+            return (yield from self._skipped('bytes'))
+        if self._depth >= self._max_depth and _CONTAINER_TAGS[tag]:
+            return (yield from self._skipped('depth'))
+        if width < 0:
+            return (yield from _BOUNDED_STREAM_READERS[tag](self, tag))
+        yield from self._need(width)
+        return _OBJECT_READERS[tag](self, tag)
+
+    def _skipped(self, reason: str):
+        # the tag has been read already, it is still in the buffer as nothing was fed since.
+        self._offset = self._offset - 1
+        yield from self._skip()
+        return {"$truncated": reason}
+
+    def _bounded_string(self, tag: int):
+        if self._string_budget is None:
+            return (yield from self._stream_string(tag))
+        text, dropped = yield from self._string_prefix(tag, self._string_budget)
+        return text if dropped == 0 else {"$truncated": dropped, "prefix": text}
+
+    def _values_of(self, length: int):
+        result = []
+        self.add_ref(result)
+        self._depth = self._depth + 1
+        kept = min(length, self._max_elements)
+        while len(result) < kept and not self._past_limit():
+            result.append((yield from self._object()))
+        if len(result) < length:
+            dropped = length - len(result)
+            yield from self._skip_values_of(dropped)
+            result.append({"$truncated": dropped})
+        self._depth = self._depth - 1
+        return result
+
+    def _values_until_end(self):
+        result = []
+        self.add_ref(result)
+        self._depth = self._depth + 1
+        while True:
+            yield from self._need(1)
+            if self._buffer[self._offset] == ord('Z'):
+                self._offset = self._offset + 1
+                break
+            if len(result) >= self._max_elements or self._past_limit():
+                result.append({"$truncated": (yield from self._skip_values_until_end())})
+                break
+            result.append((yield from self._object()))
+        self._depth = self._depth - 1
+        return result
+
+    def _stream_map_untyped(self, tag: int):
+        result = {}
+        self.add_ref(result)
+        self._depth = self._depth + 1
+        written = 0
+        while True:
+            yield from self._need(1)
+            if self._buffer[self._offset] == ord('Z'):
+                self._offset = self._offset + 1
+                break
+            if written >= self._max_elements or self._past_limit():
+                result["$truncated"] = (yield from self._skip_values_until_end()) // 2
+                break
+            # keys are decoded whole, as the transcoder reads them.
+            key = yield from self._key()
+            result[key] = yield from self._object()
+            written = written + 1
+        self._depth = self._depth - 1
+        return result
+
+    def _stream_fields(self, ref: int):
+        self._depth = self._depth + 1
+        result = yield from super()._stream_fields(ref)
+        self._depth = self._depth - 1
+        return result
+
+
+_BOUNDED_STREAM_READERS = _readers(
+    Hessian2StreamInput._stream_unknown,
+    *_STREAM_GROUPS,
+    (_STRING_TAGS, Hessian2JsonStreamInput._bounded_string),
+    ([ord('H')], Hessian2JsonStreamInput._stream_map_untyped),
+)
+
+
+class DecodedJsonValues(DecodedValues):
+    """
+    `DecodedValues` with the json reads of `Hessian2JsonTranscoder`, for bodies decoded by `Hessian2StreamInput`.
+    a `Hessian2JsonStreamInput` has applied the budget already.
+    """
+
+    def __init__(self, values: list, ensure_ascii: bool = False):
+        super().__init__(values)
+        self._ensure_ascii = ensure_ascii
+
+    def read_json(self) -> str:
+        return json.dumps(self.read_object(), ensure_ascii=self._ensure_ascii, default=json_default)
+
+    def read_json_values(self, count: int) -> str:
+        values = [self.read_object() for _ in range(0, count)]
+        return json.dumps(values, ensure_ascii=self._ensure_ascii, default=json_default)
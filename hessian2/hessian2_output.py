@@ -0,0 +1,357 @@
+#!/bin/python
+# -- coding: utf-8 --
+import array
+import datetime
+import math
+import re
+import struct
+import typing
+
+from hessian2.hessian2_input import (BC_BINARY_CHUNK, BC_DATE, BC_DATE_MINUTE, BC_DOUBLE_BYTE, BC_DOUBLE_MILL,
+                                     BC_DOUBLE_ONE, BC_DOUBLE_SHORT, BC_DOUBLE_ZERO, BC_INT_BYTE_ZERO,
+                                     BC_INT_SHORT_ZERO, BC_INT_ZERO, BC_LIST_FIXED, BC_LIST_FIXED_UNTYPED,
+                                     BC_LIST_VARIABLE, BC_LIST_VARIABLE_UNTYPED, BC_LONG_BYTE_ZERO, BC_LONG_INT,
+                                     BC_LONG_SHORT_ZERO, BC_LONG_ZERO, BC_REF, BC_STRING_CHUNK)
+
+_UINT16 = struct.Struct(">H")
+_INT16 = struct.Struct(">h")
+_INT32 = struct.Struct(">i")
+_INT64 = struct.Struct(">q")
+_DOUBLE = struct.Struct(">d")
+
+_INT32_MIN = -0x80000000
+_INT32_MAX = 0x7fffffff
+
+# units of the string and bytes of the binary chunks written before the last one
+_CHUNK_SIZE = 0x8000
+
+_SUPPLEMENTARY = re.compile("[\U00010000-\U0010ffff]")
+
+# the list type of the numeric arrays `Hessian2Input` decodes with `numeric_arrays`
+_ARRAY_TYPES = {"i": "[int", "l": "[long", "q": "[long", "d": "[double"}
+
+
+def _surrogate_pair(match: re.Match) -> str:
+    code = ord(match.group()) - 0x10000
+    return chr(0xd800 + (code >> 10)) + chr(0xdc00 + (code & 0x3ff))
+
+
+class Hessian2Output:
+    """
+    hessian encoder writing the bytes the java `Hessian2Output` writes, in its compact forms.
+
+    lists, maps and instances are registered as they start, in the order `Hessian2Input` counts them, so writing
+    the same python list or dict again writes a back reference, which also ends cycles. type names and class
+    definitions are written once and referred to by index after that.
+    """
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._types = dict[str, int]()
+        # (type, field names) to the index of its class definition
+        self._class_defs = dict[tuple[str, tuple[str, ...]], int]()
+        # id of each registered container to its reference index, the containers are kept so ids are not reused.
+        self._refs = dict[int, int]()
+        self._ref_objects = list[typing.Any]()
+
+    def to_bytes(self) -> bytes:
+        return bytes(self._buffer)
+
+    def __len__(self):
+        return len(self._buffer)
+
+    def write_object(self, value: typing.Any):
+        """
+        write a python value the way `Hessian2Input` decodes it: None, bool, int as int or long, float, str, bytes,
+        datetime, list and tuple as untyped lists, dict as untyped maps and `array.array` as java primitive arrays.
+        """
+        match value:
+            case None:
+                self.write_null()
+            case bool():
+                self.write_boolean(value)
+            case int():
+                if _INT32_MIN <= value <= _INT32_MAX:
+                    self.write_int(value)
+                else:
+                    self.write_long(value)
+            case float():
+                self.write_double(value)
+            case str():
+                self.write_string(value)
+            case bytes() | bytearray() | memoryview():
+                self.write_bytes(value)
+            case datetime.datetime():
+                self.write_date(value)
+            case list() | tuple():
+                if self._write_shared(value):
+                    return
+                self.write_list_begin(len(value))
+                for item in value:
+                    self.write_object(item)
+            case array.array() if value.typecode in _ARRAY_TYPES:
+                if self._write_shared(value):
+                    return
+                self.write_list_begin(len(value), _ARRAY_TYPES[value.typecode])
+                write = self.write_double if value.typecode == "d" else self.write_int if value.typecode == "i" \
+                    else self.write_long
+                for item in value:
+                    write(item)
+            case dict():
+                if self._write_shared(value):
+                    return
+                self.write_map_begin()
+                for key, item in value.items():
+                    self.write_object(key)
+                    self.write_object(item)
+                self.write_end()
+            case _:
+                raise Exception(f"can not write {value.__class__.__name__}")
+
+    def _write_shared(self, value: typing.Any) -> bool:
+        """
+        write a back reference if `value` has been written before, otherwise register it and return False.
+        """
+        ref = self._refs.get(id(value))
+        if ref is not None:
+            self.write_ref(ref)
+            return True
+        self.add_ref(value)
+        return False
+
+    def add_ref(self, value: typing.Any) -> int:
+        """
+        count a list, map or instance written without `write_object`, returns its reference index.
+        """
+        ref = len(self._ref_objects)
+        self._ref_objects.append(value)
+        if value is not None:
+            self._refs[id(value)] = ref
+        return ref
+
+    def write_null(self):
+        self._buffer.append(ord('N'))
+
+    def write_boolean(self, value: bool):
+        self._buffer.append(ord('T') if value else ord('F'))
+
+    def write_int(self, value: int):
+        buffer = self._buffer
+        if -0x10 <= value <= 0x2f:
+            buffer.append(BC_INT_ZERO + value)
+        elif -0x800 <= value <= 0x7ff:
+            buffer.append(BC_INT_BYTE_ZERO + (value >> 8))
+            buffer.append(value & 0xff)
+        elif -0x40000 <= value <= 0x3ffff:
+            buffer.append(BC_INT_SHORT_ZERO + (value >> 16))
+            buffer += _UINT16.pack(value & 0xffff)
+        else:
+            buffer.append(ord('I'))
+            buffer += _INT32.pack(value)
+
+    def write_long(self, value: int):
+        buffer = self._buffer
+        if -0x08 <= value <= 0x0f:
+            buffer.append(BC_LONG_ZERO + value)
+        elif -0x800 <= value <= 0x7ff:
+            buffer.append(BC_LONG_BYTE_ZERO + (value >> 8))
+            buffer.append(value & 0xff)
+        elif -0x40000 <= value <= 0x3ffff:
+            buffer.append(BC_LONG_SHORT_ZERO + (value >> 16))
+            buffer += _UINT16.pack(value & 0xffff)
+        elif _INT32_MIN <= value <= _INT32_MAX:
+            buffer.append(BC_LONG_INT)
+            buffer += _INT32.pack(value)
+        else:
+            buffer.append(ord('L'))
+            buffer += _INT64.pack(value)
+
+    def write_double(self, value: float):
+        buffer = self._buffer
+        # as java, -0.0 is written as 0.0
+        if value == 0.0:
+            buffer.append(BC_DOUBLE_ZERO)
+            return
+        if value == 1.0:
+            buffer.append(BC_DOUBLE_ONE)
+            return
+        if math.isfinite(value) and value == int(value):
+            if -0x80 <= value <= 0x7f:
+                buffer.append(BC_DOUBLE_BYTE)
+                buffer.append(int(value) & 0xff)
+                return
+            if -0x8000 <= value <= 0x7fff:
+                buffer.append(BC_DOUBLE_SHORT)
+                buffer += _INT16.pack(int(value))
+                return
+        if math.isfinite(value) and _INT32_MIN <= value * 1000 <= _INT32_MAX:
+            mills = int(value * 1000)
+            if 0.001 * mills == value:
+                buffer.append(BC_DOUBLE_MILL)
+                buffer += _INT32.pack(mills)
+                return
+        buffer.append(ord('D'))
+        buffer += _DOUBLE.pack(value)
+
+    def write_date(self, value: datetime.datetime | int):
+        """
+        write a date, or a number of milliseconds since the epoch.
+        """
+        millis = value if isinstance(value, int) else round(value.timestamp() * 1000)
+        if millis % 60000 == 0 and _INT32_MIN <= millis // 60000 <= _INT32_MAX:
+            self._buffer.append(BC_DATE_MINUTE)
+            self._buffer += _INT32.pack(millis // 60000)
+        else:
+            self._buffer.append(BC_DATE)
+            self._buffer += _INT64.pack(millis)
+
+    def write_string(self, value: str):
+        """
+        write a string in chunks of at most 0x8000 utf-16 units, characters outside the bmp are written as two 3 byte
+        surrogates like java does, a chunk never ends between the two.
+        """
+        if _SUPPLEMENTARY.search(value) is not None:
+            value = _SUPPLEMENTARY.sub(_surrogate_pair, value)
+        buffer = self._buffer
+        while len(value) > _CHUNK_SIZE:
+            length = _CHUNK_SIZE
+            if 0xd800 <= ord(value[length - 1]) <= 0xdbff:
+                length = length - 1
+            buffer.append(ord(BC_STRING_CHUNK))
+            buffer += _UINT16.pack(length)
+            buffer += value[:length].encode("utf-8", "surrogatepass")
+            value = value[length:]
+        length = len(value)
+        if length <= 0x1f:
+            buffer.append(length)
+        elif length <= 0x3ff:
+            buffer.append(0x30 + (length >> 8))
+            buffer.append(length & 0xff)
+        else:
+            buffer.append(ord('S'))
+            buffer += _UINT16.pack(length)
+        buffer += value.encode("utf-8", "surrogatepass")
+
+    def write_bytes(self, value: bytes):
+        """
+        write a binary in chunks of at most 0x8000 bytes.
+        """
+        buffer = self._buffer
+        offset = 0
+        length = len(value)
+        while length - offset > _CHUNK_SIZE:
+            buffer.append(ord(BC_BINARY_CHUNK))
+            buffer += _UINT16.pack(_CHUNK_SIZE)
+            buffer += value[offset:offset + _CHUNK_SIZE]
+            offset = offset + _CHUNK_SIZE
+        length = length - offset
+        if length <= 0x0f:
+            buffer.append(0x20 + length)
+        elif length <= 0x3ff:
+            buffer.append(0x34 + (length >> 8))
+            buffer.append(length & 0xff)
+        else:
+            buffer.append(ord('B'))
+            buffer += _UINT16.pack(length)
+        buffer += value[offset:]
+
+    def write_type(self, tp: str):
+        """
+        write a type name, or the index of the same name written before.
+        """
+        ref = self._types.get(tp)
+        if ref is not None:
+            self.write_int(ref)
+            return
+        self._types[tp] = len(self._types)
+        self.write_string(tp)
+
+    def write_list_begin(self, length: int, tp: str = None):
+        """
+        start a list of `length` values, or a variable length list ended by `write_end` when `length` is negative.
+        the list is not registered, `write_object` and `write_list` do that, `add_ref` counts it otherwise.
+        """
+        buffer = self._buffer
+        if length < 0:
+            if tp is None:
+                buffer.append(BC_LIST_VARIABLE_UNTYPED)
+            else:
+                buffer.append(BC_LIST_VARIABLE)
+                self.write_type(tp)
+        elif length <= 7:
+            if tp is None:
+                buffer.append(0x78 + length)
+            else:
+                buffer.append(0x70 + length)
+                self.write_type(tp)
+        elif tp is None:
+            buffer.append(BC_LIST_FIXED_UNTYPED)
+            self.write_int(length)
+        else:
+            buffer.append(ord(BC_LIST_FIXED))
+            self.write_type(tp)
+            self.write_int(length)
+
+    def write_list(self, values: list | tuple, tp: str = None):
+        """
+        write a typed list.
+        """
+        if self._write_shared(values):
+            return
+        self.write_list_begin(len(values), tp)
+        for value in values:
+            self.write_object(value)
+
+    def write_map_begin(self, tp: str = None):
+        """
+        start a map of key and value pairs ended by `write_end`, not registered.
+        """
+        if tp is None:
+            self._buffer.append(ord('H'))
+        else:
+            self._buffer.append(ord('M'))
+            self.write_type(tp)
+
+    def write_map(self, value: dict, tp: str = None):
+        """
+        write a typed map.
+        """
+        if self._write_shared(value):
+            return
+        self.write_map_begin(tp)
+        for key, item in value.items():
+            self.write_object(key)
+            self.write_object(item)
+        self.write_end()
+
+    def write_end(self):
+        self._buffer.append(ord('Z'))
+
+    def write_instance(self, tp: str, fields: dict[str, typing.Any]):
+        """
+        write an instance of the java class `tp` with the field values of `fields`, which `Hessian2Input` decodes
+        to the same dict. the class definition is written before the first instance of each class and field names.
+        """
+        if self._write_shared(fields):
+            return
+        key = (tp, tuple(fields))
+        ref = self._class_defs.get(key)
+        if ref is None:
+            ref = len(self._class_defs)
+            self._class_defs[key] = ref
+            self._buffer.append(ord('C'))
+            self.write_string(tp)
+            self.write_int(len(fields))
+            for name in fields:
+                self.write_string(name)
+        if ref <= 0x0f:
+            self._buffer.append(0x60 + ref)
+        else:
+            self._buffer.append(ord('O'))
+            self.write_int(ref)
+        for value in fields.values():
+            self.write_object(value)
+
+    def write_ref(self, ref: int):
+        self._buffer.append(BC_REF)
+        self.write_int(ref)
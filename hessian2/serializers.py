@@ -1,8 +1,17 @@
 #!/bin/python
 # -- coding: utf-8 --
+import sys
 import typing
+from collections import OrderedDict
 
-from hessian2.common import AbstractHessian2Input
+from hessian2.common import AbstractHessian2Input, ObjectDefinition
+
+# definitions seen so far keyed by (type, field names), shared by every decoder of the process, least recently used
+# first
+_DEFINITIONS = OrderedDict[tuple[str, tuple[str, ...]], ObjectDefinition]()
+MAX_CACHED_DEFINITIONS = 4096
+# classes with more fields are read by a loop instead of generated code
+MAX_COMPILED_FIELDS = 256
 
 
 class ListDeserializer:
@@ -12,6 +21,7 @@ class ListDeserializer:
 
     def read_length_list(self, input_stream: AbstractHessian2Input) -> typing.List:
         result_list = []
+        input_stream.add_ref(result_list)
         if self.length >= 0:
             for i in range(0, self.length):
                 result_list.append(input_stream.read_object())
@@ -30,8 +40,9 @@ class MapDeserializer:
 
     def read_map(self, input_stream: AbstractHessian2Input):
         result = {}
+        input_stream.add_ref(result)
         while not input_stream.is_end():
-            key = input_stream.read_object()
+            key = input_stream.read_key()
             value = input_stream.read_object()
             result[key] = value
         input_stream.read_end()
@@ -40,11 +51,53 @@ class MapDeserializer:
 
 class ObjectDeserializer:
 
-    def __init__(self, field_names: list[str]):
+    def __init__(self, field_names: tuple[str, ...]):
         self.field_names = field_names
+        self._read_fields = _compile_fields(field_names)
 
     def read_object(self, input_stream: AbstractHessian2Input):
+        # registered before the fields are read, so they can refer back to it.
         result = {}
-        for field_name in self.field_names:
-            result[field_name] = input_stream.read_object()
+        input_stream.add_ref(result)
+        self._read_fields(result, input_stream.read_object)
+        return result
+
+
+def _read_fields_loop(field_names: tuple[str, ...]) -> typing.Callable:
+    def read_fields(result: dict, read: typing.Callable):
+        for name in field_names:
+            result[name] = read()
         return result
+    return read_fields
+
+
+def _compile_fields(field_names: tuple[str, ...]) -> typing.Callable:
+    """
+    build a function that reads one value per field into the registered dict, as one unrolled store per field
+    when the class is small enough.
+    """
+    if len(field_names) > MAX_COMPILED_FIELDS:
+        return _read_fields_loop(field_names)
+    keys = {f"_k{i}": name for i, name in enumerate(field_names)}
+    stores = "".join(f"    result[{key}] = read()\n" for key in keys)
+    namespace = dict(keys)
+    exec(f"def read_fields(result, read):\n{stores}    return result\n", namespace)
+    return namespace["read_fields"]
+
+
+def object_definition(tp: str, field_names: list[str]) -> ObjectDefinition:
+    """
+    the definition of a class signature, reused across payloads so its field names are interned and its reader is
+    compiled once per process. past `MAX_CACHED_DEFINITIONS` signatures the least recently used one is dropped.
+    """
+    key = (tp, tuple(field_names))
+    class_def = _DEFINITIONS.get(key)
+    if class_def is not None:
+        _DEFINITIONS.move_to_end(key)
+        return class_def
+    fields = tuple(sys.intern(name) if type(name) is str else name for name in field_names)
+    class_def = ObjectDefinition(type=tp, fields=fields, deserializer=ObjectDeserializer(fields))
+    _DEFINITIONS[key] = class_def
+    if len(_DEFINITIONS) > MAX_CACHED_DEFINITIONS:
+        _DEFINITIONS.popitem(last=False)
+    return class_def
@@ -0,0 +1,282 @@
+#!/bin/python
+# -- coding: utf-8 --
+import base64
+import datetime
+import hashlib
+import struct
+
+from hessian2.common import ValuePolicy
+from hessian2 import serializers
+from hessian2.hessian2_input import DecodedValues, Hessian2Input, Hessian2StreamInput
+from hessian2.serializers import object_definition
+
+
+def decode(payload: bytes):
+    return Hessian2Input(payload).read_object()
+
+
+def encode_int(value: int) -> bytes:
+    if -16 <= value <= 47:
+        return bytes([0x90 + value])
+    if -2048 <= value <= 2047:
+        return bytes([0xc8 + (value >> 8), value & 0xff])
+    if -262144 <= value <= 262143:
+        return bytes([0xd4 + (value >> 16)]) + struct.pack(">H", value & 0xffff)
+    return b"I" + struct.pack(">i", value)
+
+
+class TestHessian2Input:
+    """
+    test class for the tag dispatch of the decoder, on hand encoded payloads.
+    """
+
+    def test_scalars(self):
+        assert decode(b"N") is None
+        assert decode(b"T") is True
+        assert decode(b"F") is False
+        assert decode(b"\x90") == 0
+        assert decode(b"\x80") == -16
+        assert decode(b"\xc7\x00") == -256
+        assert decode(b"\xd0\x00\x00") == -262144
+        assert decode(b"I" + struct.pack(">i", -7)) == -7
+        assert decode(b"\xe0") == 0
+        assert decode(b"\xf0\x00") == -2048
+        assert decode(b"\x38\x00\x00") == -262144
+        assert decode(b"\x59" + struct.pack(">i", 300000)) == 300000
+        assert decode(b"L" + struct.pack(">q", -(1 << 40))) == -(1 << 40)
+        assert decode(b"\x5b") == 0.0
+        assert decode(b"\x5c") == 1.0
+        assert decode(b"\x5f" + struct.pack(">i", 1500)) == 1.5
+        assert decode(b"D" + struct.pack(">d", 3.25)) == 3.25
+        assert decode(b"\x5d\xff") == -1.0
+        assert decode(b"\x5e\x80\x00") == -32768.0
+        assert decode(b"L" + struct.pack(">q", -1)) == -1
+        assert decode(b"I\x80\x00\x00\x00") == -(1 << 31)
+        try:
+            decode(b"L\x00\x00")
+            assert False
+        except Exception as e:
+            assert "exceed" in str(e)
+
+    def test_dates(self):
+        assert decode(b"\x4a" + struct.pack(">q", 894621091000)) == datetime.datetime.fromtimestamp(894621091)
+        assert decode(b"\x4b" + struct.pack(">i", 14910351)) == datetime.datetime.fromtimestamp(14910351 * 60)
+
+    def test_strings_and_binaries(self):
+        assert decode(b"\x05hello") == "hello"
+        assert decode(b"\x30\x03abc") == "abc"
+        assert decode(b"R\x00\x02abS\x00\x01c") == "abc"
+        assert decode(b"\x02\xc3\xa9\xe4\xb8\xad") == "é中"
+        assert decode(b"\x23\x01\x02\x03") == b"\x01\x02\x03"
+        assert decode(b"\x34\x02ab") == b"ab"
+        assert decode(b"A\x00\x01aB\x00\x02bc") == b"abc"
+        blob = bytes(range(256)) * 300
+        payload = b"A\x80\x00" + blob[:0x8000] + b"B" + struct.pack(">H", len(blob) - 0x8000) + blob[0x8000:]
+        assert decode(memoryview(payload)) == blob
+
+    def test_multi_byte_strings(self):
+        assert decode(b"\x00") == ""
+        text = "中文ab" * 20
+        encoded = text.encode("utf-8")
+        assert decode(b"\x30\x50" + encoded) == text
+        # split into chunks of 30 and 50 characters, the second one as a memoryview like parser frames.
+        assert decode(memoryview(b"R\x00\x1e" + text[:30].encode() + b"S\x00\x32" + text[30:].encode())) == text
+        # java encodes a supplementary character as two 3 byte surrogates, counted as two characters.
+        cesu = "\ud83d\ude00".encode("utf-8", "surrogatepass")
+        assert decode(b"\x03a" + cesu) == "a\U0001F600"
+        # the surrogates of one character may even be split across chunks.
+        assert decode(b"R\x00\x01" + cesu[:3] + b"\x01" + cesu[3:]) == "\U0001F600"
+        assert decode(b"\x03" + "é\U0001F600".encode("utf-8")) == "é\U0001F600"
+        for broken in (b"\x02\xe4\xb8", b"\x05abc"):
+            try:
+                decode(broken)
+                assert False
+            except Exception as e:
+                assert "exceed" in str(e)
+
+    def test_read_int_and_read_string(self):
+        decoder = Hessian2Input(b"\x5e\x01\x00\xd0\x00\x01S\x01\x01" + b"x" * 257)
+        assert decoder.read_int() == 256
+        assert decoder.read_string() == "-262143"
+        assert decoder.read_string() == "x" * 257
+        assert decoder.read_string() is None
+
+    def test_containers(self):
+        assert decode(b"\x79\x91") == [1]
+        assert decode(b"\x72\x04[int\x91\x92") == [1, 2]
+        assert decode(b"\x57\x91\x92Z") == [1, 2]
+        assert decode(b"V\x04[int\x92\x91\x92") == [1, 2]
+        assert decode(b"H\x01a\x91Z") == {"a": 1}
+        assert decode(b"M\x07java.Ma\x01b\x92Z") == {"b": 2}
+        payload = b"C\x04Bean\x92\x01a\x01b" + b"\x79\x60\x91\x01x"
+        assert decode(payload) == [{"a": 1, "b": "x"}]
+        assert decode(b"\x7a\x43\x04Bean\x91\x01a\x60\x91\x4f\x90\x92") == [{"a": 1}, {"a": 2}]
+
+    def test_class_definitions_are_shared(self):
+        payload = b"C\x04Bean\x92\x01a\x01b\x60\x91\x01x"
+        first, second = Hessian2Input(payload), Hessian2Input(bytearray(payload))
+        assert first.read_object() == second.read_object() == {"a": 1, "b": "x"}
+        assert first._class_def_list[0] is second._class_def_list[0]
+        assert first._class_def_list[0].fields == ("a", "b")
+        fields = [f"f{i}" for i in range(300)]
+        payload = b"C\x04Wide\x5e\x01\x2c" + b"".join(bytes([len(f)]) + f.encode() for f in fields) + b"\x60"
+        values = bytes(0x90 + i % 40 for i in range(300))
+        assert decode(payload + values) == {f: i % 40 for i, f in enumerate(fields)}
+
+    def test_definition_cache_drops_least_recently_used(self, monkeypatch):
+        monkeypatch.setattr(serializers, "MAX_CACHED_DEFINITIONS", 2)
+        monkeypatch.setattr(serializers, "_DEFINITIONS", type(serializers._DEFINITIONS)())
+        a, b = object_definition("A", ["x"]), object_definition("B", ["x"])
+        assert object_definition("A", ["x"]) is a
+        # past the limit the signature used least recently makes room, new ones are still cached.
+        c = object_definition("C", ["x"])
+        assert object_definition("C", ["x"]) is c and object_definition("A", ["x"]) is a
+        assert object_definition("B", ["x"]) is not b
+
+    def test_skip_object_registers_definitions(self):
+        bean = b"C\x04Bean\x92\x01a\x01b"
+        values = [
+            b"N", b"\xd0\x00\x01", b"L" + struct.pack(">q", 5), b"\x5e\x00\x01", b"\x4b\x00\x00\x00\x01",
+            b"\x03a\xc3\xa9" + "\ud83d\ude00".encode("utf-8", "surrogatepass")[:3],
+            b"R\x00\x01\xe4\xb8\xad\x02" + "\U0001F600".encode("utf-8"), b"\x30\x02ab", b"\x02hi", b"\x91",
+            b"\x01\xc3\xa9", b"\xbf",
+            b"\x22ab", b"A\x00\x01aB\x00\x01b", b"\x72\x04[int\x91\x92", b"\x57\x91Z", b"V\x90\x91\x93",
+            b"H\x01a\x91Z", b"M\x07java.Ma\x01b\x92Z", bean + b"\x60\x91\x01x", b"\x4f\x90\x92\x93", b"\x51\x90",
+        ]
+        payload = b"".join(values) + b"\x60\x95\x01y"
+        decoder = Hessian2Input(payload)
+        for value in values:
+            start = decoder._offset
+            decoder.skip_object()
+            assert payload[start:decoder._offset] == value
+        # the class definition, the list type and every list, map and object were registered while skipping.
+        assert decoder.read_object() == {"a": 5, "b": "y"}
+        assert decoder._types == ["[int", "java.Ma"]
+        assert len(decoder._refs) == 8
+
+    def test_back_references(self):
+        # a list holding a map twice and an object whose field refers back to the object itself.
+        payload = b"\x7b" + b"H\x01a\x91Z" + b"\x51\x91" + b"\x79C\x04Node\x91\x04next\x60\x51\x93"
+        value = decode(payload)
+        assert value[0] == {"a": 1} and value[1] is value[0]
+        node = value[2][0]
+        assert node["next"] is node
+        for reader in (Hessian2Input(payload, ref_markers=True), Hessian2StreamInput(ref_markers=True)):
+            if isinstance(reader, Hessian2StreamInput):
+                value = reader.feed(payload)[0]
+            else:
+                value = reader.read_object()
+            assert value == [{"a": 1}, {"$ref": 1}, [{"next": {"$ref": 3}}]]
+        decoder = Hessian2Input(payload)
+        decoder.skip_object()
+        assert len(decoder._refs) == 4
+        try:
+            decode(b"\x79\x51\x91")
+            assert False
+        except Exception as e:
+            assert "no object defined at reference 1" in str(e)
+
+    def test_stream_input_resumes_at_any_byte(self):
+        text = "中文ab" * 40
+        values = [
+            b"\xd0\x00\x01", b"L" + struct.pack(">q", -5), b"\x5e\x80\x00", b"\x4a" + struct.pack(">q", 1000),
+            b"R\x00\x01" + "\ud83d\ude00".encode("utf-8", "surrogatepass")[:3] + b"\x01"
+            + "\ud83d\ude00".encode("utf-8", "surrogatepass")[3:],
+            b"\x30\xa0" + text.encode(), b"\x03" + "é\U0001F600".encode(), b"\x00",
+            b"A\x00\x02abB\x00\x01c", b"\x72\x04[int\x91\x92", b"V\x90\x91\x93", b"\x57\x91Z",
+            b"H\x01a\x91Z", b"M\x07java.Ma\x01b\x92Z", b"C\x04Bean\x92\x01a\x01b\x60\x91\x01x", b"\x4f\x90N\x90",
+        ]
+        payload = b"".join(values)
+        decoder = Hessian2Input(payload)
+        expected = [decoder.read_object() for _ in values]
+        for step in (1, 2, 3, 5, len(payload)):
+            stream = Hessian2StreamInput()
+            decoded = []
+            for i in range(0, len(payload), step):
+                decoded.extend(stream.feed(payload[i:i + step]))
+                assert len(stream._buffer) - stream._offset < max(step, 8)
+            stream.close()
+            assert decoded == expected
+        stream = Hessian2StreamInput()
+        assert stream.feed(b"\x72\x04[int\x91") == [] and stream.pending
+        try:
+            stream.close()
+            assert False
+        except Exception as e:
+            assert "unexpected end of file" in str(e)
+        reader = DecodedValues(["2.0.2", 1, [1]])
+        assert reader.read_utf() == "2.0.2" and reader.read_int() == 1
+        reader.skip_object()
+
+    def test_numeric_arrays(self):
+        ints = [5, -3, 1000, -2000, 100000, 1 << 30, -(1 << 31)] + list(range(-16, 48))
+        ints = ints + [300 * i for i in range(-6, 7)]
+        longs = [1 << 40, -1] * 8 + [1700000000000 + i for i in range(10)]
+        doubles = [0.0, 1.0, -5.0, 300.0, 1.5] + [i / 7 for i in range(12)]
+        payload = b"".join([
+            b"V\x04[int" + encode_int(len(ints)) + b"".join(encode_int(v) for v in ints),
+            b"V\x05[long" + encode_int(len(longs))
+            + b"".join((b"\xdf" if v == -1 else b"L" + struct.pack(">q", v)) for v in longs),
+            b"\x58" + bytes([0x90 + len(doubles)]) + b"\x5b\x5c\x5d\xfb\x5e\x01\x2c\x5f\x00\x00\x05\xdc"
+            + b"".join(b"D" + struct.pack(">d", v) for v in doubles[5:]),
+            b"\x7b\x91\x01a\x92", b"\x51\x93", b"\x72\x90\x91\x92",
+        ])
+        expected = Hessian2Input(payload)
+        expected = [expected.read_object() for _ in range(6)]
+        assert expected[0] == ints and expected[1] == longs and expected[2] == doubles
+        decoder = Hessian2Input(payload, numeric_arrays="array")
+        values = [decoder.read_object() for _ in range(6)]
+        assert [v.typecode for v in values[:3]] == ["i", "q", "d"] and values[5].typecode == "i"
+        assert [list(v) for v in values[:3]] == expected[:3] and values[3:5] == expected[3:5]
+        # a list of mixed values stays a list, and is the one its reference resolves to.
+        assert values[3] is values[4]
+        values = Hessian2Input(b"\x7a\x91\x51\x90", numeric_arrays="array").read_object()
+        assert values[0] == 1 and values[1] is values
+        try:
+            Hessian2Input(b"V\x04[int\x92\x91", numeric_arrays="array").read_object()
+            assert False
+        except Exception as e:
+            assert "unexpected end of file" in str(e)
+
+    def test_value_policy(self):
+        data = bytes(range(256)) * 3
+        payload = b"".join([
+            b"\x4a" + struct.pack(">q", 894621091000), b"\x4b" + struct.pack(">i", 14910351),
+            b"A\x01\x00" + data[:256] + b"\x36\x00" + data[256:], b"\x23\x01\x02\x03",
+            b"R\x00\x02ab\x05cdefg", b"\x02ab",
+            # the type and field names are never cut.
+            b"C\x06Sample\x91\x04name\x60\x04text",
+        ])
+        expected = [894621091000, 14910351 * 60000, None, None, "abc", "ab", {"name": "tex"}]
+        for binaries, values in (("base64", [base64.b64encode(data).decode("ascii"), "AQID"]),
+                                 ("digest", [{"length": 768, "sha256": hashlib.sha256(data).hexdigest()},
+                                             {"length": 3, "sha256": hashlib.sha256(data[1:4]).hexdigest()}]),
+                                 ("drop", [None, None])):
+            policy = ValuePolicy("epoch_ms", binaries, 3)
+            expected[2:4] = values
+            decoder = Hessian2Input(payload, value_policy=policy)
+            assert [decoder.read_object() for _ in expected] == expected
+            assert Hessian2StreamInput(value_policy=policy).feed(payload) == expected
+        assert decode(b"\x4a" + struct.pack(">q", 894621091000)) == datetime.datetime.fromtimestamp(894621091)
+        # the cap counts utf-16 units on both paths and never keeps half of a surrogate pair, java's 3 byte
+        # surrogates or a 4 byte character alike.
+        for text in ("a\ud83d\ude00b".encode("utf-8", "surrogatepass"), "a😀b".encode()):
+            payload = b"\x04" + text + b"\x95"
+            for cap, expected in ((1, "a"), (2, "a"), (3, "a😀")):
+                policy = ValuePolicy(max_string_length=cap)
+                decoder = Hessian2Input(payload, value_policy=policy)
+                assert [decoder.read_object(), decoder.read_object()] == [expected, 5]
+                stream = Hessian2StreamInput(value_policy=policy)
+                assert [value for byte in payload for value in stream.feed(bytes([byte]))] == [expected, 5]
+        try:
+            ValuePolicy(binaries="hex")
+            assert False
+        except Exception as e:
+            assert "unknown binaries policy hex" in str(e)
+
+    def test_unknown_tag(self):
+        try:
+            decode(b"\x40")
+            assert False
+        except Exception as e:
+            assert "unknown code 64" in str(e)
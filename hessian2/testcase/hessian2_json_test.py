@@ -0,0 +1,117 @@
+#!/bin/python
+# -- coding: utf-8 --
+import json
+import struct
+
+from hessian2.common import ValuePolicy
+from hessian2.hessian2_input import Hessian2Input, Hessian2StreamInput
+from hessian2.hessian2_json import (DecodeBudget, DecodedJsonValues, Hessian2JsonStreamInput, Hessian2JsonTranscoder,
+                                    json_default)
+
+VALUES = [
+    b"N", b"T", b"F", b"\x90", b"\xc7\x00", b"\xd0\x00\x00", b"I" + struct.pack(">i", -7), b"\xe0", b"\xf0\x00",
+    b"L" + struct.pack(">q", 1 << 40), b"\x5b", b"\x5c", b"\x5d\xff", b"\x5f" + struct.pack(">i", 1500),
+    b"D" + struct.pack(">d", float("nan")), b"D" + struct.pack(">d", float("-inf")),
+    b"\x4a" + struct.pack(">q", 894621091000), b"\x05he\"l\n", b"\x02\xc3\xa9\xe4\xb8\xad", b"\x23\x01\x02\x03",
+    b"\x78", b"\x72\x04[int\x91\x92", b"\x57\x91\x02abZ", b"V\x90\x91\x93", b"H\x01a\x91\x91\x92NTZ",
+    b"M\x07java.Ma\x5c\x01bZ", b"C\x04Bean\x92\x01a\x01b\x60\x91\x79\x51\x93", b"\x4f\x90\x92\x93",
+    b"C\x05Empty\x90\x61",
+    # numbers runs long enough to be read in one go
+    b"\x58\x9c" + bytes(range(0x90, 0x9c)), b"\x58\x9a" + b"D" + struct.pack(">d", float("nan")) + b"".join(
+        b"D" + struct.pack(">d", i / 3) for i in range(9)), b"V\x05[long\x99" + (b"L" + struct.pack(">q", -1)) * 9,
+]
+
+
+def dumps(payload: bytes, ensure_ascii: bool = False, value_policy: ValuePolicy = None) -> list[str]:
+    decoder = Hessian2Input(payload, ref_markers=True, value_policy=value_policy)
+    texts = []
+    while decoder._offset < len(payload):
+        texts.append(json.dumps(decoder.read_object(), ensure_ascii=ensure_ascii, default=json_default))
+    return texts
+
+
+class TestHessian2JsonTranscoder:
+    """
+    test class for the json transcoder, whose text must match json.dumps of the decoded values.
+    """
+
+    def test_matches_json_dumps(self):
+        payload = b"".join(VALUES)
+        for ensure_ascii in (False, True):
+            transcoder = Hessian2JsonTranscoder(payload, ensure_ascii=ensure_ascii)
+            texts = [transcoder.read_json() for _ in VALUES]
+            assert texts == dumps(payload, ensure_ascii)
+        texts = dumps(payload)
+        assert texts[18] == '"é中"' and texts[19] == '"AQID"' and texts[28] == '{}'
+        # a list key, which python can not decode, is written as the string of its json text.
+        assert Hessian2JsonTranscoder(b"H\x79\x91\x01aZ").read_json() == '{"[1]": "a"}'
+
+    def test_values_share_one_buffer(self):
+        out = []
+        payload = b"\x91\x01a\x79\x91"
+        transcoder = Hessian2JsonTranscoder(payload, out)
+        assert transcoder.read_json_values(3) == '[1, "a", [1]]'
+        assert out == ["[", "1", ", ", '"a"', ", ", "[", "1", "]", "]"]
+        transcoder = Hessian2JsonTranscoder(b"\x92", out)
+        assert transcoder.read_json() == "2" and out == ["2"]
+        assert Hessian2JsonTranscoder(b"").read_json_values(0) == "[]"
+
+    def test_value_policy(self):
+        payload = b"".join(VALUES)
+        for policy in (ValuePolicy("epoch_ms", "digest", 2), ValuePolicy("datetime", "drop"),
+                       ValuePolicy("epoch_ms", "base64")):
+            transcoder = Hessian2JsonTranscoder(payload, value_policy=policy)
+            assert [transcoder.read_json() for _ in VALUES] == dumps(payload, value_policy=policy)
+        transcoder = Hessian2JsonTranscoder(payload, value_policy=ValuePolicy("epoch_ms", "drop"))
+        assert [transcoder.read_json() for _ in VALUES][16:20] == ["894621091000", '"he\\"l\\n"', '"é中"', "null"]
+        # a budget marks the strings it cuts, the policy's cap still applies.
+        transcoder = Hessian2JsonTranscoder(b"\x05abcde", budget=DecodeBudget(max_string_length=4),
+                                            value_policy=ValuePolicy(max_string_length=2))
+        assert transcoder.read_json() == '{"$truncated": 3, "prefix": "ab"}'
+        # map keys are never cut, a cap would make distinct keys the same.
+        payload = b"H\x02ka\x03xyz\x02kb\x03xyzZ"
+        for policy, budget in ((ValuePolicy(max_string_length=1), None), (None, DecodeBudget(max_string_length=1))):
+            transcoder = Hessian2JsonTranscoder(payload, budget=budget, value_policy=policy)
+            stream = Hessian2JsonStreamInput(ref_markers=True, value_policy=policy, budget=budget)
+            streamed = [value for i in range(0, len(payload)) for value in stream.feed(payload[i:i + 1])]
+            assert transcoder.read_json() == DecodedJsonValues(streamed).read_json()
+            assert list(json.loads(DecodedJsonValues(streamed).read_json())) == ["ka", "kb"]
+        policy = ValuePolicy(max_string_length=1)
+        assert Hessian2Input(payload, value_policy=policy).read_object() == {"ka": "x", "kb": "x"}
+        assert Hessian2StreamInput(value_policy=policy).feed(payload) == [{"ka": "x", "kb": "x"}]
+
+    def test_decoded_values(self):
+        payload = b"".join(VALUES)
+        stream = Hessian2StreamInput(ref_markers=True)
+        reader = DecodedJsonValues(stream.feed(payload))
+        texts = dumps(payload)
+        assert [reader.read_json() for _ in range(0, 10)] == texts[:10]
+        assert reader.read_json_values(len(VALUES) - 10) == "[" + ", ".join(texts[10:]) + "]"
+
+    def test_budget(self):
+        payload = b"".join(VALUES)
+        # a budget with room for everything writes the same text.
+        transcoder = Hessian2JsonTranscoder(payload, budget=DecodeBudget(len(payload), 100, 10, 100))
+        assert [transcoder.read_json() for _ in VALUES] == dumps(payload)
+        budget = DecodeBudget(max_elements=2, max_depth=1, max_string_length=3)
+        payload = b"\x7c\x91\x92\x93\x94" + b"H\x01a\x91\x01b\x92\x01c\x93Z" + b"\x7a\x91\x79\x92" + b"\x05abcde" \
+            + b"R\x00\x02ab\x03cde" + b"\x03abc" + b"\x58\x9c" + bytes(range(0x90, 0x9c))
+        expected = ['[1, 2, {"$truncated": 2}]', '{"a": 1, "b": 2, "$truncated": 1}', '[1, {"$truncated": "depth"}]',
+                    '{"$truncated": 2, "prefix": "abc"}', '{"$truncated": 2, "prefix": "abc"}', '"abc"',
+                    '[0, 1, {"$truncated": 10}]']
+        transcoder = Hessian2JsonTranscoder(payload, budget=budget)
+        assert [transcoder.read_json() for _ in expected] == expected
+        # the stream decoder cuts the values down as they arrive, fed a byte at a time.
+        stream = Hessian2JsonStreamInput(ref_markers=True, budget=budget)
+        reader = DecodedJsonValues([value for i in range(0, len(payload)) for value in stream.feed(payload[i:i + 1])])
+        assert [reader.read_json() for _ in expected] == expected
+        # values starting past the bytes of the call are skipped, each call starts with a fresh budget.
+        payload = b"\x01a\x01b\x01c\x91\x7c\x01a\x01b\x01c\x01d"
+        transcoder = Hessian2JsonTranscoder(payload, budget=DecodeBudget(max_bytes=2))
+        assert transcoder.read_json_values(4) == '["a", {"$truncated": "bytes"}, {"$truncated": "bytes"}, 1]'
+        assert transcoder.read_json() == '["a", {"$truncated": 3}]'
+        # a streamed value gets its own bytes, values past them are skipped without being built.
+        payload = b"\x05hello\x7c\x01a\x01b\x01c\x01d" + b"\x79H\x01k\x7c\x92\x93\x94\x95Z"
+        stream = Hessian2JsonStreamInput(ref_markers=True, budget=DecodeBudget(max_bytes=2, max_depth=1), unbounded=1)
+        values = [value for i in range(0, len(payload)) for value in stream.feed(payload[i:i + 1])]
+        assert json.dumps(values) == '["hello", ["a", {"$truncated": 3}], [{"$truncated": "depth"}]]'
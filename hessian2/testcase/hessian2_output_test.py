@@ -0,0 +1,139 @@
+#!/bin/python
+# -- coding: utf-8 --
+import array
+import datetime
+import json
+import random
+import struct
+
+from hessian2.hessian2_input import Hessian2Input, Hessian2StreamInput
+from hessian2.hessian2_json import Hessian2JsonTranscoder, json_default
+from hessian2.hessian2_output import Hessian2Output
+
+
+def encode(*values) -> bytes:
+    output = Hessian2Output()
+    for value in values:
+        output.write_object(value)
+    return output.to_bytes()
+
+
+def random_value(rng: random.Random, depth: int = 0):
+    """
+    a random value of any type `Hessian2Output.write_object` writes, nested up to 3 levels.
+    """
+    match rng.randrange(0, 10 if depth < 3 else 7):
+        case 0:
+            return rng.choice([None, True, False])
+        case 1:
+            return rng.choice([rng.randint(-300, 300), rng.randint(-(1 << 31), (1 << 31) - 1),
+                               rng.randint(-(1 << 63), (1 << 63) - 1)])
+        case 2:
+            return rng.choice([rng.randint(-40000, 40000) / rng.choice([1, 1000]), rng.uniform(-1e12, 1e12)])
+        case 3:
+            return "".join(chr(rng.choice([rng.randint(0x20, 0x7e), rng.randint(0xa0, 0xd7ff),
+                                           rng.randint(0x10000, 0x10ffff)])) for _ in range(rng.randint(0, 40)))
+        case 4:
+            return rng.randbytes(rng.choice([0, 15, 16, 1023, 1024, 70000]))
+        case 5:
+            return datetime.datetime.fromtimestamp(rng.randint(0, 4000000000) * rng.choice([1, 60]))
+        case 6:
+            return "x" * rng.choice([31, 32, 1023, 1024, 0x8000, 0x8001])
+        case 7:
+            return [random_value(rng, depth + 1) for _ in range(rng.randint(0, 12))]
+        case 8:
+            return {f"k{i}": random_value(rng, depth + 1) for i in range(rng.randint(0, 6))}
+        case _:
+            return array.array(rng.choice("iqd"), [rng.randint(-1000, 1000) for _ in range(rng.randint(0, 20))])
+
+
+def plain(value):
+    """
+    the value `Hessian2Input` decodes, with its numeric arrays as lists.
+    """
+    if isinstance(value, array.array):
+        return list(value)
+    if isinstance(value, list):
+        return [plain(item) for item in value]
+    if isinstance(value, dict):
+        return {key: plain(item) for key, item in value.items()}
+    return value
+
+
+class TestHessian2Output:
+    """
+    test class for the encoder, its bytes must decode back to the values written.
+    """
+
+    def test_compact_forms(self):
+        assert encode(None, True, False) == b"NTF"
+        assert encode(0, -16, 47, 48, -2048, 2047, -262144, 262143, 262144) == \
+            b"\x90\x80\xbf\xc8\x30\xc0\x00\xcf\xff\xd0\x00\x00\xd7\xff\xff" + b"I" + struct.pack(">i", 262144)
+        output = Hessian2Output()
+        for value in (0, 15, -2048, 262143, 1 << 30, 1 << 40):
+            output.write_long(value)
+        assert output.to_bytes() == b"\xe0\xef\xf0\x00\x3f\xff\xff\x59\x40\x00\x00\x00" \
+            + b"L" + struct.pack(">q", 1 << 40)
+        assert encode(0.0, 1.0, -128.0, 300.0, 1.5, 0.0001) == \
+            b"\x5b\x5c\x5d\x80\x5e\x01\x2c\x5f\x00\x00\x05\xdc" + b"D" + struct.pack(">d", 0.0001)
+        output = Hessian2Output()
+        output.write_date(894621060000)
+        output.write_date(894621091000)
+        assert output.to_bytes() == b"\x4b" + struct.pack(">i", 14910351) + b"\x4a" + struct.pack(">q", 894621091000)
+        assert encode("", "a" * 32, b"abc", b"a" * 16) == b"\x00\x30\x20" + b"a" * 32 + b"\x23abc\x34\x10" + b"a" * 16
+
+    def test_chunks(self):
+        text = "中" * 0x7fff + "\U0001F600" + "ab"
+        payload = encode(text, b"\x01" * 0x10001)
+        # the chunk ends before the surrogate pair, which is written as two 3 byte surrogates.
+        assert payload[:3] == b"R\x7f\xff" and payload[3 + 3 * 0x7fff:3 + 3 * 0x7fff + 2] == b"\x04\xed"
+        decoder = Hessian2Input(payload)
+        assert decoder.read_object() == text and decoder.read_object() == b"\x01" * 0x10001
+        assert decoder._offset == len(payload)
+
+    def test_references_and_instances(self):
+        shared = [1, 2]
+        cyclic = {"name": "a"}
+        cyclic["self"] = cyclic
+        output = Hessian2Output()
+        output.write_list([shared, shared, cyclic], "java.util.ArrayList")
+        output.write_instance("org.example.Bean", {"id": 1, "items": shared})
+        output.write_instance("org.example.Bean", {"id": 2, "items": None})
+        output.write_map({"a": 1}, "java.util.HashMap")
+        output.write_list(array.array("d", [0.5, 2.0]), "[double")
+        output.write_object(array.array("i", [3]))
+        payload = output.to_bytes()
+        assert payload.count(b"org.example.Bean") == 1 and payload.count(b"java.util.ArrayList") == 1
+        decoder = Hessian2Input(payload)
+        values = [decoder.read_object() for _ in range(6)]
+        assert values[0][0] is values[0][1] and values[0][2]["self"] is values[0][2]
+        assert values[1] == {"id": 1, "items": [1, 2]} and values[1]["items"] is values[0][0]
+        assert values[2] == {"id": 2, "items": None} and values[3] == {"a": 1}
+        assert values[4] == [0.5, 2.0] and values[5] == [3]
+        decoder = Hessian2Input(payload, ref_markers=True)
+        assert decoder.read_object() == [[1, 2], {"$ref": 1}, {"name": "a", "self": {"$ref": 2}}]
+
+    def test_random_corpus(self):
+        rng = random.Random(20261018)
+        values = [random_value(rng) for _ in range(300)]
+        payload = encode(*values)
+        expected = [plain(value) for value in values]
+        decoder = Hessian2Input(payload)
+        assert [decoder.read_object() for _ in values] == expected and decoder._offset == len(payload)
+        decoder = Hessian2Input(payload)
+        for _ in values:
+            decoder.skip_object()
+        assert decoder._offset == len(payload)
+        stream = Hessian2StreamInput()
+        decoded = []
+        offset = 0
+        while offset < len(payload):
+            step = rng.randint(1, 4096)
+            decoded.extend(stream.feed(payload[offset:offset + step]))
+            offset = offset + step
+        stream.close()
+        assert decoded == expected
+        decoder = Hessian2Input(payload, ref_markers=True)
+        transcoder = Hessian2JsonTranscoder(payload)
+        for _ in values:
+            assert transcoder.read_json() == json.dumps(decoder.read_object(), ensure_ascii=False, default=json_default)
@@ -1,36 +1,46 @@
+import bisect
+import struct
+from array import array
 from enum import Enum
-from collections import deque
 from dataclasses import dataclass, field
-from dataclasses_json import dataclass_json
+
+from hessian2.common import ValuePolicy
+from hessian2.hessian2_input import Hessian2StreamInput
+from hessian2.hessian2_json import DecodeBudget, Hessian2JsonStreamInput
+from parser.tcp_reassembler import TcpReassembler
 
 
 class ParserState(Enum):
     NONE = 0
     STATE_PARSE_HEADER = 1
     STATE_PARSE_BODY = 2
+    STATE_SKIP_BODY = 3
+    STATE_STREAM_BODY = 4
 
 
-@dataclass_json
-@dataclass
+@dataclass(slots=True)
 class CommonState:
     """
-    dubbo request common state
+    dubbo request common state, one instance per channel direction is reused for every frame.
     """
     state: ParserState = field(init=False, default=ParserState.STATE_PARSE_HEADER)
     is_event: bool = field(init=False, default=False)
     request_id: int = field(init=False, default=-1)
     request_len: int = field(init=False, default=0)
     status: int = field(init=False, default=0)
+    # stream position of the first header byte of the frame being parsed
+    frame_start: int = field(init=False, default=0)
+    # body of a large frame decoded while it arrives, and the values decoded so far
+    decoder: Hessian2StreamInput = field(init=False, default=None)
+    values: list = field(init=False, default=None)
 
 
-@dataclass_json
-@dataclass
+@dataclass(slots=True)
 class ResponseState(CommonState):
     is_heartbeat: bool = field(init=False, default=False)
 
 
-@dataclass_json
-@dataclass
+@dataclass(slots=True)
 class RequestState(CommonState):
     """
     dubbo RequestState class.
@@ -38,45 +48,144 @@ class RequestState(CommonState):
     is_two_way: bool = field(init=False, default=False)
 
 
-@dataclass_json
-@dataclass
+@dataclass(slots=True)
 class DubboResponse:
     """
     dubbo response class.
     """
-    src_host: str
+    src_host: int
     src_port: int
-    dest_host: str
+    dest_host: int
     dest_port: int
-    state: ResponseState = field(init=False, default=None)
-    content: bytes = field(init=False, default=None)
-    end_time: float = field(init=False, default=0)
-
-
-@dataclass_json
-@dataclass
+    start_time: float = 0
+    end_time: float = 0
+    # a view into the receive buffer, copied to bytes once the request waits for its response
+    content: memoryview | bytes = None
+    request_id: int = -1
+    status: int = 0
+    is_event: bool = False
+    is_heartbeat: bool = False
+    # top level values of a streamed body, content is None then
+    values: list = None
+
+
+@dataclass(slots=True)
 class DubboRequest:
     """
     dubbo request class.
     """
-    src_host: str
+    src_host: int
     src_port: int
-    dest_host: str
+    dest_host: int
     dest_port: int
-    start_time: float = field(init=False, default=0)
-    content: bytes = field(
-        init=False, default=None
-    )
-    state: RequestState = field(
-        init=False, default=None
-    )
+    start_time: float = 0
+    end_time: float = 0
+    content: memoryview = None
+    request_id: int = -1
+    is_two_way: bool = False
+    is_event: bool = False
+    # top level values of a streamed body, content is None then
+    values: list = None
 
 
-class PacketTime:
+class PacketIndex:
+    """
+    capture timestamps of one direction, indexed by the stream offset at the end of each packet.
 
-    def __init__(self, ts: float, size: int):
-        self.ts = ts
-        self.size = size
+    the timestamp of any byte is found by bisection, entries are only dropped in bulk once most of them have
+    been released.
+    """
+    COMPACT_THRESHOLD = 4096
+
+    def __init__(self):
+        self._ends = array("q")
+        self._times = array("d")
+        self._first = 0
+        self._total = 0
+
+    def __len__(self) -> int:
+        return len(self._ends) - self._first
+
+    def append(self, ts: float, size: int):
+        self._total = self._total + size
+        self._ends.append(self._total)
+        self._times.append(ts)
+
+    def ts_at(self, position: int) -> float:
+        """
+        timestamp of the packet carrying the byte at stream `position`.
+        """
+        return self._times[bisect.bisect_right(self._ends, position, self._first)]
+
+    def release(self, position: int):
+        """
+        forget the packets that end at or before stream `position`.
+        """
+        first = bisect.bisect_right(self._ends, position, self._first)
+        if first >= PacketIndex.COMPACT_THRESHOLD and first * 2 >= len(self._ends):
+            del self._ends[:first]
+            del self._times[:first]
+            first = 0
+        self._first = first
+
+
+class ReceiveBuffer:
+    """
+    per-direction receive buffer with a read cursor.
+
+    consumed bytes are left in place and only dropped once the cursor passes COMPACT_THRESHOLD, frames are
+    handed out as memoryview slices of the buffer, so reassembly cost stays linear in the captured bytes.
+    """
+    COMPACT_THRESHOLD = 1 << 20
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._offset = 0
+        # stream offset of the read cursor
+        self.position = 0
+
+    def __len__(self) -> int:
+        return len(self._buffer) - self._offset
+
+    def append(self, packet: bytes):
+        if self._offset > 0 and self._offset == len(self._buffer):
+            # everything has been consumed, start a fresh buffer instead of moving bytes around.
+            self._buffer = bytearray(packet)
+            self._offset = 0
+            return
+        if self._offset >= ReceiveBuffer.COMPACT_THRESHOLD and self._offset * 2 >= len(self._buffer):
+            self._compact()
+        try:
+            self._buffer.extend(packet)
+        except BufferError:
+            # frames handed out still export the buffer, so it can not be resized in place.
+            self._compact()
+            self._buffer.extend(packet)
+
+    def unpack_from(self, fmt: struct.Struct) -> tuple:
+        return fmt.unpack_from(self._buffer, self._offset)
+
+    def skip(self, size: int):
+        self._offset = self._offset + size
+        self.position = self.position + size
+
+    def find(self, sub: bytes, start: int = 0) -> int:
+        """
+        position of `sub` relative to the read cursor, or -1.
+        """
+        index = self._buffer.find(sub, self._offset + start)
+        return index - self._offset if index >= 0 else -1
+
+    def consume(self, size: int) -> memoryview:
+        view = memoryview(self._buffer)[self._offset:self._offset + size]
+        self._offset = self._offset + size
+        self.position = self.position + size
+        return view
+
+    def _compact(self):
+        # slicing copies the unread bytes into a new bytearray, views already handed out keep the old one alive.
+        self._buffer = self._buffer[self._offset:]
+        self._offset = 0
 
 
 class DubboChannel:
@@ -84,121 +193,325 @@ class DubboChannel:
 
     MAGIC = [0xda, 0xbb]
 
+    MAGIC_SHORT = 0xdabb
+
+    # magic(2) | flag(1) | status(1) | request id(8) | body length(4)
+    HEADER = struct.Struct(">HBBQI")
+
     FLAG_REQUEST = 0x80
 
     FLAG_TWO_WAY = 0x40
 
     FLAG_EVENT = 0x20
 
-    def __init__(self, src_host: str, src_port: int, dest_host: str, dest_port: int):
+    SERIALIZATION_MASK = 0x1f
+
+    MAGIC_BYTES = b"\xda\xbb"
+
+    # headers claiming a larger body are treated as garbage while resynchronising, dubbo's own default payload limit.
+    DEFAULT_MAX_BODY_LEN = 8 * 1024 * 1024
+
+    RESPONSE_STATUS = frozenset([20, 30, 31, 35, 40, 50, 60, 70, 80, 90, 100])
+
+    STATUS_OK = 20
+
+    # dubbo version, service, service version, method and parameter types lead a request body
+    REQUEST_HEADER_VALUES = 5
+
+    # bytes held back per direction while waiting for a lost or reordered segment.
+    DEFAULT_REORDER_BUDGET = 4 * 1024 * 1024
+
+    def __init__(self, src_host: int, src_port: int, dest_host: int, dest_port: int,
+                 reorder_budget: int = DEFAULT_REORDER_BUDGET, stream_threshold: int | None = None,
+                 value_policy: ValuePolicy | None = None, hole_timeout: float = TcpReassembler.DEFAULT_HOLE_TIMEOUT,
+                 max_body_len: int = DEFAULT_MAX_BODY_LEN, decode_budget: DecodeBudget | None = None):
         self.src_host = src_host
         self.src_port = src_port
         self.dest_host = dest_host
         self.dest_port = dest_port
-        self._request_packets = bytearray()
-        self._request_packets_ts = deque[(float, int)]()
-        self._response_packets = bytearray()
-        self._response_packets_ts = deque[(float, int)]()
+        self._request_packets = ReceiveBuffer()
+        self._request_index = PacketIndex()
+        self._response_packets = ReceiveBuffer()
+        self._response_index = PacketIndex()
         self._current_request_state = RequestState()
         self._current_response_state = ResponseState()
+        self.skipped_request_bytes = 0
+        self.skipped_response_bytes = 0
+        self.request_stream = TcpReassembler(reorder_budget, hole_timeout)
+        self.response_stream = TcpReassembler(reorder_budget, hole_timeout)
+        # bodies of at least this many bytes are decoded as they arrive instead of being buffered whole.
+        self.stream_threshold = stream_threshold
+        self.value_policy = value_policy
+        self.max_body_len = max_body_len
+        # limits streamed bodies are cut down to while they decode.
+        self.decode_budget = decode_budget
+
+    @property
+    def buffered_bytes(self) -> int:
+        """
+        bytes held by this channel, unread frame bytes and out of order segments.
+        """
+        return len(self._request_packets) + len(self._response_packets) + self.request_stream.buffered_bytes \
+            + self.response_stream.buffered_bytes
+
+    def append_and_parse_requests(self, packet: bytes, ts: float, seq: int | None = None) -> list[DubboRequest]:
+        """
+        append a client->server segment and return every request frame it completes.
+
+        when `seq` is given the segment goes through the reassembler first, so retransmitted and reordered
+        segments reach the buffer exactly once and in order. the frames completed by each released piece are
+        parsed before the next piece, so a gap only discards the frame it cuts.
+        """
+        if seq is None:
+            self._append_request_packet(packet, ts)
+            requests = []
+            self._parse_requests(requests)
+            return requests
+        return self._requests_of(self.request_stream.push(seq, packet, ts))
+
+    def skip_request_hole(self, ts: float) -> list[DubboRequest]:
+        """
+        give up on the hole the request stream is waiting on and return the requests held behind it. a response
+        to a request that has not been parsed shows the missing bytes reached the server and will not be captured.
+        """
+        return self._requests_of(self.request_stream.give_up(ts))
+
+    def _requests_of(self, pieces: list[tuple[float, bytes | None]]) -> list[DubboRequest]:
+        requests = []
+        for packet_ts, data in pieces:
+            if data is None:
+                self.skipped_request_bytes = self.skipped_request_bytes + self._discard_partial_frame(
+                    self._request_packets, self._request_index
+                )
+                self._current_request_state.state = ParserState.STATE_PARSE_HEADER
+            else:
+                self._append_request_packet(data, packet_ts)
+                self._parse_requests(requests)
+        return requests
+
+    def append_and_parse_responses(self, packet: bytes, ts: float, seq: int | None = None) -> list[DubboResponse]:
+        """
+        append a server->client segment and return every response frame it completes.
+        """
+        responses = []
+        if seq is None:
+            self._append_response_packet(packet, ts)
+            self._parse_responses(responses)
+            return responses
+        for packet_ts, data in self.response_stream.push(seq, packet, ts):
+            if data is None:
+                self.skipped_response_bytes = self.skipped_response_bytes + self._discard_partial_frame(
+                    self._response_packets, self._response_index
+                )
+                self._current_response_state.state = ParserState.STATE_PARSE_HEADER
+            else:
+                self._append_response_packet(data, packet_ts)
+                self._parse_responses(responses)
+        return responses
 
-    def append_and_try_parse_request(self, packet: bytes, ts: float) -> DubboRequest:
-        self._append_request_packet(packet, ts)
-        return self._try_parse_request()
+    def _parse_requests(self, requests: list[DubboRequest]):
+        while True:
+            request = self._try_parse_request()
+            if request is None:
+                return
+            requests.append(request)
 
-    def append_and_try_parse_response(self, packet: bytes, ts: float) -> DubboResponse:
-        self._append_response_packet(packet, ts)
-        return self._try_parse_response()
+    def _parse_responses(self, responses: list[DubboResponse]):
+        while True:
+            response = self._try_parse_response()
+            if response is None:
+                return
+            responses.append(response)
 
     def _append_request_packet(self, packet: bytes, ts: float):
-        self._request_packets.extend(packet)
-        self._request_packets_ts.append(PacketTime(ts, len(packet)))
+        self._request_packets.append(packet)
+        self._request_index.append(ts, len(packet))
 
     def _append_response_packet(self, packet: bytes, ts: float):
-        self._response_packets.extend(packet)
-        self._response_packets_ts.append(PacketTime(ts, len(packet)))
+        self._response_packets.append(packet)
+        self._response_index.append(ts, len(packet))
 
     def _try_parse_request(self) -> DubboRequest | None:
-        if self._current_request_state.state == ParserState.STATE_PARSE_HEADER:
-            if len(self._request_packets) >= DubboChannel.HEADER_LEN:
-                if not DubboChannel._is_match_magic(self._request_packets[0:2]):
-                    raise Exception("dubbo network packet is illegal. magic mismatch 0xdabb.")
-                type_byte = self._request_packets[2]
-                if type_byte & DubboChannel.FLAG_REQUEST == 0:
-                    raise Exception("packet is not dubbo request.")
-                type_byte = type_byte & ~DubboChannel.FLAG_REQUEST
-                self._current_request_state.is_two_way = (type_byte & DubboChannel.FLAG_TWO_WAY) != 0
-                self._current_request_state.is_event = (type_byte & DubboChannel.FLAG_EVENT) != 0
-                self._current_request_state.request_id = DubboChannel.get_request_id(self._request_packets[4:12])
-                self._current_request_state.request_len = DubboChannel.get_request_len(self._request_packets[12:16])
-                self._request_packets = self._request_packets[16:]
-                self._current_request_state.state = ParserState.STATE_PARSE_BODY
-        if self._current_request_state.state == ParserState.STATE_PARSE_BODY:
-            if len(self._request_packets) >= self._current_request_state.request_len:
+        state = self._current_request_state
+        if state.state == ParserState.STATE_PARSE_HEADER or state.state == ParserState.STATE_SKIP_BODY:
+            header = self._read_header(self._request_packets, self._request_index, state, True)
+            if header is None:
+                return None
+            type_byte, _, request_id, request_len = header
+            state.is_two_way = (type_byte & DubboChannel.FLAG_TWO_WAY) != 0
+            state.is_event = (type_byte & DubboChannel.FLAG_EVENT) != 0
+            state.request_id = request_id
+            state.request_len = request_len
+            state.state = self._body_state(state)
+        if state.state == ParserState.STATE_STREAM_BODY:
+            if self._stream_body(self._request_packets, state):
+                end = self._request_packets.position
+                index = self._request_index
+                state.state = ParserState.STATE_PARSE_HEADER
                 request = DubboRequest(
-                    src_host=self.src_host, src_port=self.src_port, dest_host=self.dest_host, dest_port=self.dest_port
+                    self.src_host, self.src_port, self.dest_host, self.dest_port, index.ts_at(state.frame_start),
+                    index.ts_at(end - 1), None, state.request_id, state.is_two_way, state.is_event, state.values
                 )
-                request.content = self._request_packets[0:self._current_request_state.request_len]
-                self._request_packets = self._request_packets[self._current_request_state.request_len:]
-                self._current_request_state.state = ParserState.STATE_PARSE_HEADER
-                request.state = self._current_request_state
-                self._current_request_state = RequestState()
-                first_ts = DubboChannel._remove_packet_from_queue(
-                    self._request_packets_ts, self._current_request_state.request_len + DubboChannel.HEADER_LEN
+                index.release(end)
+                return request
+        elif state.state == ParserState.STATE_PARSE_BODY:
+            if len(self._request_packets) >= state.request_len:
+                content = self._request_packets.consume(state.request_len)
+                end = self._request_packets.position
+                index = self._request_index
+                state.state = ParserState.STATE_PARSE_HEADER
+                request = DubboRequest(
+                    self.src_host, self.src_port, self.dest_host, self.dest_port, index.ts_at(state.frame_start),
+                    index.ts_at(end - 1), content, state.request_id, state.is_two_way, state.is_event
                 )
-                request.start_time = first_ts
+                index.release(end)
                 return request
         return None
 
     def _try_parse_response(self) -> DubboResponse | None:
-        if self._current_response_state.state == ParserState.STATE_PARSE_HEADER:
-            if len(self._response_packets) >= DubboChannel.HEADER_LEN:
-                if not DubboChannel._is_match_magic(self._response_packets[0:2]):
-                    raise Exception("dubbo network packet is illegal. magic mismatch 0xdabb.")
-                type_byte = self._response_packets[2]
-                self._current_response_state.is_heartbeat = (type_byte & DubboChannel.FLAG_EVENT) != 0
-                self._current_response_state.is_event = (type_byte & DubboChannel.FLAG_EVENT) != 0
-                self._current_response_state.status = self._response_packets[3]
-                self._current_response_state.request_id = DubboChannel.get_request_id(self._response_packets[4:12])
-                self._current_response_state.request_len = DubboChannel.get_request_len(self._response_packets[12:16])
-                self._response_packets = self._response_packets[DubboChannel.HEADER_LEN:]
-                self._current_response_state.state = ParserState.STATE_PARSE_BODY
-        if self._current_response_state.state == ParserState.STATE_PARSE_BODY:
-            if len(self._response_packets) >= self._current_response_state.request_len:
-                response = DubboResponse(self.src_host, self.src_port, self.dest_host, self.dest_port)
-                response.content = self._response_packets[0:self._current_response_state.request_len]
-                self._response_packets = self._response_packets[self._current_response_state.request_len:]
-                self._current_response_state.state = ParserState.STATE_PARSE_HEADER
-                response.state = self._current_response_state
-                self._current_response_state = ResponseState()
-                last_ts = DubboChannel._remove_packet_from_queue(
-                    self._response_packets_ts, self._current_response_state.request_len + DubboChannel.HEADER_LEN, True
+        state = self._current_response_state
+        if state.state == ParserState.STATE_PARSE_HEADER or state.state == ParserState.STATE_SKIP_BODY:
+            header = self._read_header(self._response_packets, self._response_index, state, False)
+            if header is None:
+                return None
+            type_byte, status, request_id, request_len = header
+            state.is_heartbeat = (type_byte & DubboChannel.FLAG_EVENT) != 0
+            state.is_event = (type_byte & DubboChannel.FLAG_EVENT) != 0
+            state.status = status
+            state.request_id = request_id
+            state.request_len = request_len
+            state.state = self._body_state(state)
+        if state.state == ParserState.STATE_STREAM_BODY:
+            if self._stream_body(self._response_packets, state):
+                end = self._response_packets.position
+                index = self._response_index
+                state.state = ParserState.STATE_PARSE_HEADER
+                response = DubboResponse(
+                    self.src_host, self.src_port, self.dest_host, self.dest_port, index.ts_at(state.frame_start),
+                    index.ts_at(end - 1), None, state.request_id, state.status, state.is_event, state.is_heartbeat,
+                    state.values
                 )
-                response.end_time = last_ts
+                index.release(end)
+                return response
+        elif state.state == ParserState.STATE_PARSE_BODY:
+            if len(self._response_packets) >= state.request_len:
+                content = self._response_packets.consume(state.request_len)
+                end = self._response_packets.position
+                index = self._response_index
+                state.state = ParserState.STATE_PARSE_HEADER
+                response = DubboResponse(
+                    self.src_host, self.src_port, self.dest_host, self.dest_port, index.ts_at(state.frame_start),
+                    index.ts_at(end - 1), content, state.request_id, state.status, state.is_event,
+                    state.is_heartbeat
+                )
+                index.release(end)
                 return response
         return None
 
+    def _body_state(self, state: CommonState) -> ParserState:
+        if self.stream_threshold is None or state.request_len < self.stream_threshold or state.is_event:
+            return ParserState.STATE_PARSE_BODY
+        if self.decode_budget is None or isinstance(state, ResponseState) and state.status != DubboChannel.STATUS_OK:
+            # an error response is a single message read whole.
+            state.decoder = Hessian2StreamInput(ref_markers=True, value_policy=self.value_policy)
+        else:
+            # the header strings of a request, or the result flag of a response, are not json values.
+            unbounded = DubboChannel.REQUEST_HEADER_VALUES if isinstance(state, RequestState) else 1
+            state.decoder = Hessian2JsonStreamInput(ref_markers=True, value_policy=self.value_policy,
+                                                    budget=self.decode_budget, unbounded=unbounded)
+        state.values = []
+        return ParserState.STATE_STREAM_BODY
+
     @staticmethod
-    def _remove_packet_from_queue(queue: deque[PacketTime], size: int, last_packet: bool = False) -> float:
-        left = size
-        if len(queue) <= 0:
-            raise Exception("parse packet error")
-        ts = queue[0].ts
+    def _stream_body(buffer: ReceiveBuffer, state: CommonState) -> bool:
+        """
+        feed the body bytes received so far to the frame's stream decoder, returns True once the body is complete.
+
+        a body that fails to decode is still consumed to the end, its values are then None.
+        """
+        size = min(state.request_len, len(buffer))
+        if size > 0:
+            chunk = buffer.consume(size)
+            state.request_len = state.request_len - size
+            if state.decoder is not None:
+                try:
+                    state.values.extend(state.decoder.feed(chunk))
+                except Exception:
+                    state.decoder = None
+                    state.values = None
+            chunk.release()
+        if state.request_len > 0:
+            return False
+        if state.decoder is not None and state.decoder.pending:
+            state.values = None
+        state.decoder = None
+        return True
+
+    @staticmethod
+    def _discard_partial_frame(buffer: ReceiveBuffer, index: PacketIndex) -> int:
+        """
+        drop the unread bytes of a direction after a hole in the stream, the next header is found by resync.
+        """
+        size = len(buffer)
+        buffer.skip(size)
+        index.release(buffer.position)
+        return size
+
+    def _read_header(self, buffer: ReceiveBuffer, index: PacketIndex, state: CommonState,
+                     is_request: bool) -> tuple[int, int, int, int] | None:
+        """
+        consume the next frame header of this direction and return (flag, status, request id, body length).
+
+        bytes that can not start a frame are skipped up to the next 0xdabb magic, event frames travelling the
+        other way (heartbeats sent by the server, and their replies) are dropped as they arrive.
+        """
         while True:
-            if len(queue) <= 0:
-                raise Exception("parse packet error")
-            item = queue[0]
-            if last_packet:
-                ts = item.ts
-            if item.size > left:
-                item.size = item.size - left
-                break
+            if state.state == ParserState.STATE_SKIP_BODY:
+                size = min(state.request_len, len(buffer))
+                buffer.skip(size)
+                index.release(buffer.position)
+                state.request_len = state.request_len - size
+                if state.request_len > 0:
+                    return None
+                state.state = ParserState.STATE_PARSE_HEADER
+            if len(buffer) < DubboChannel.HEADER_LEN:
+                return None
+            magic, type_byte, status, request_id, body_len = buffer.unpack_from(DubboChannel.HEADER)
+            if magic == DubboChannel.MAGIC_SHORT and type_byte & DubboChannel.SERIALIZATION_MASK != 0 \
+                    and body_len <= self.max_body_len:
+                if (type_byte & DubboChannel.FLAG_REQUEST != 0) == is_request:
+                    if is_request or status in DubboChannel.RESPONSE_STATUS:
+                        state.frame_start = buffer.position
+                        buffer.skip(DubboChannel.HEADER_LEN)
+                        return type_byte, status, request_id, body_len
+                elif type_byte & DubboChannel.FLAG_EVENT != 0:
+                    buffer.skip(DubboChannel.HEADER_LEN)
+                    state.request_len = body_len
+                    state.state = ParserState.STATE_SKIP_BODY
+                    continue
+            # not a frame header, resynchronise on the next magic (keep a trailing 0xda, it may be half of one).
+            magic_at = buffer.find(DubboChannel.MAGIC_BYTES, 1)
+            size = magic_at if magic_at > 0 else len(buffer) - 1
+            buffer.skip(size)
+            index.release(buffer.position)
+            if is_request:
+                self.skipped_request_bytes = self.skipped_request_bytes + size
             else:
-                left = left - item.size
-                queue.popleft()
-                if left <= 0:
-                    break
-        return ts
+                self.skipped_response_bytes = self.skipped_response_bytes + size
+
+    @staticmethod
+    def detect_server_port(src_port: int, dst_port: int, payload: bytes) -> int | None:
+        """
+        returns the dubbo server port when `payload` starts a dubbo frame, or None.
+
+        event frames are ignored because heartbeats are also sent from the server to the client.
+        """
+        if len(payload) < 3 or payload[0] != DubboChannel.MAGIC[0] or payload[1] != DubboChannel.MAGIC[1]:
+            return None
+        type_byte = payload[2]
+        if type_byte & DubboChannel.FLAG_EVENT != 0 or type_byte & DubboChannel.SERIALIZATION_MASK == 0:
+            return None
+        return dst_port if type_byte & DubboChannel.FLAG_REQUEST != 0 else src_port
 
     @staticmethod
     def _is_match_magic(buffer: bytes) -> bool:
@@ -1,11 +1,14 @@
 import json
+from collections import deque
 
-import dpkt
-import socket
 from parser.dubbo_common import (DubboChannel, DubboRequest, DubboResponse)
+from parser.flow_table import Flow, FlowTable, flow_key, format_flow_key, ip_to_str
+from parser.pcap_reader import open_pcap, PcapFollower, TcpSegment, TH_FIN, TH_RST, TH_SYN
+from parser.tcp_reassembler import TcpReassembler
 from loguru import logger
-import time
-from hessian2.hessian2_input import Hessian2Input
+import typing
+from hessian2.common import ValuePolicy
+from hessian2.hessian2_json import DecodeBudget, DecodedJsonValues, Hessian2JsonTranscoder
 from elasticsearch7 import Elasticsearch
 
 RESPONSE_VALUE = 1
@@ -16,133 +19,364 @@ RESPONSE_VALUE_WITH_ATTACHMENTS = 4
 
 OK = 20
 
+# json text of the results and errors that are not stored, the values python treats as false
+_FALSY_JSON = frozenset(("null", "false", "0", "0.0", "-0.0", '""', "[]", "{}"))
+
+
+def discover_ports(file: str, max_segments: int = 100000) -> set[int]:
+    """
+    cheap pre-pass over the first `max_segments` tcp segments with payload, returns the dubbo server ports seen.
+    """
+    ports = set[int]()
+    count = 0
+    for segment in open_pcap(file, None):
+        if len(segment.payload) == 0:
+            continue
+        port = DubboChannel.detect_server_port(segment.src_port, segment.dst_port, segment.payload)
+        if port is not None:
+            ports.add(port)
+        count = count + 1
+        if count >= max_segments:
+            break
+    return ports
+
 
 class DubboPacketParser:
     """
     dubbo packets parser class.
     """
 
-    def __init__(self, file: str, port: int, elastic_client: Elasticsearch):
+    # how often, in capture seconds, idle connections are looked for
+    EVICTION_INTERVAL = 10.0
+
+    DEFAULT_IDLE_TIMEOUT = 600.0
+
+    DEFAULT_MAX_BUFFERED_BYTES = 1024 * 1024 * 1024
+
+    DEFAULT_REQUEST_TIMEOUT = 60.0
+
+    def __init__(self, file: str, ports: typing.Iterable[int] | None, elastic_client: Elasticsearch,
+                 reorder_budget: int = DubboChannel.DEFAULT_REORDER_BUDGET,
+                 idle_timeout: float = DEFAULT_IDLE_TIMEOUT, max_buffered_bytes: int = DEFAULT_MAX_BUFFERED_BYTES,
+                 request_timeout: float = DEFAULT_REQUEST_TIMEOUT, headers_only: bool = False,
+                 stream_threshold: int | None = None, decode_budget: DecodeBudget | None = None,
+                 value_policy: ValuePolicy | None = None, hole_timeout: float = TcpReassembler.DEFAULT_HOLE_TIMEOUT,
+                 max_body_len: int = DubboChannel.DEFAULT_MAX_BODY_LEN, discover: bool | None = None):
         self.file = file
-        self.port = port
-        self._channels = dict[str, DubboChannel]()
-        self._requests = dict[str, dict[int, DubboRequest]]()
+        self.ports = set(ports) if ports else set()
+        # learn more server ports from the first packet of each dubbo frame, by default only without configured
+        # ports, `discover` keeps it on when `ports` is just a seed, e.g. the result of `discover_ports`.
+        self.discover_ports = len(self.ports) == 0 if discover is None else discover
+        self.reorder_budget = reorder_budget
+        # capture seconds a hole in a tcp stream is waited on before the stream skips past it.
+        self.hole_timeout = hole_timeout
+        # frame headers claiming a larger body are not trusted, so a false magic can not hold a flow's buffer.
+        self.max_body_len = max_body_len
+        self.idle_timeout = idle_timeout
+        self.max_buffered_bytes = max_buffered_bytes
+        self.request_timeout = request_timeout
+        # skip parameters, results and exceptions, only the call header and the attachments are decoded.
+        self.headers_only = headers_only
+        self.stream_threshold = stream_threshold
+        # limits on the json of each parameter list, attachment map, result and exception, values past them are
+        # skipped and marked as truncated.
+        self.decode_budget = decode_budget
+        # what dates and binaries are stored as
+        self.value_policy = value_policy
+        self._flows = FlowTable()
+        # (start time, flow key, request id) of the two way requests in parse order, to expire unanswered ones.
+        self._request_deadlines = deque[tuple[float, int, int]]()
+        self._buffered_bytes = 0
+        self._next_eviction = 0.0
         self._elastic_client = elastic_client
         self._batch_queue = []
+        # text pieces of the json being written, reused for every body
+        self._json_out = list[str]()
+        # calls whose request or response body failed to decode, stored with a decode_error
+        self.decode_errors = 0
         self._index_name = "dubbo_packets"
 
     def parse(self):
-        with open(self.file, mode="rb") as f:
-            pcap = dpkt.pcap.Reader(f)
-            try:
-                for ts, pkt in pcap:
-                    eth = dpkt.ethernet.Ethernet(pkt)
-                    ip = eth.data
-                    tcp = ip.data
-                    src_ip = socket.inet_ntoa(ip.src)
-                    dst_ip = socket.inet_ntoa(ip.dst)
-                    src_port = tcp.sport
-                    dst_port = tcp.dport
-                    if dst_port == self.port:
-                        key = f"{src_ip}:{src_port}->{dst_ip}:{dst_port}"
-                        if key not in self._channels:
-                            self._channels[key] = DubboChannel(src_ip, src_port, dst_ip, dst_port)
-                        if len(tcp.data) > 0:
-                            request = self._channels[key].append_and_try_parse_request(tcp.data, ts)
-                            if request:
-                                if key not in self._requests:
-                                    self._requests[key] = dict[int, DubboRequest]()
-                                self._requests[key][request.state.request_id] = request
-                    else:
-                        key = f"{dst_ip}:{dst_port}->{src_ip}:{src_port}"
-                        if key not in self._channels:
-                            self._channels[key] = DubboChannel(dst_ip, dst_port, src_ip, src_port)
-                        if len(tcp.data) > 0:
-                            response = self._channels[key].append_and_try_parse_response(tcp.data, ts)
-                            if response:
-                                try:
-                                    if response.state.request_id in self._requests[key]:
-                                        request = self._requests[key][response.state.request_id]
-                                        self.on_dubbo_call_parsed(
-                                            dst_ip, dst_port, src_ip, src_port, request, response
-                                        )
-                                    else:
-                                        logger.warning(f"not found request {response.state.request_id}")
-                                finally:
-                                    del self._requests[key][response.state.request_id]
-                    if (tcp.flags & dpkt.tcp.TH_RST) != 0 or (tcp.flags & dpkt.tcp.TH_FIN) != 0:
-                        if key in self._requests:
-                            for k, v in self._requests[key].items():
-                                if dst_port == self.port:
-                                    self.on_dubbo_call_parsed(src_ip, src_port, dst_ip, dst_port, v)
-                                else:
-                                    self.on_dubbo_call_parsed(dst_ip, dst_port, src_ip, src_port, v)
-                            del self._requests[key]
-            except Exception as e:
-                raise e
+        try:
+            self._parse_segments(open_pcap(self.file, self._port_filter()))
+        except Exception as e:
+            raise e
         print("******* parse dubbo packets success *******")
 
-    def on_dubbo_call_parsed(self, src_ip, src_port, dest_ip, dest_port, request: DubboRequest,
-                             response: DubboResponse = None):
+    def follow(self, watch_dir: str | None = None, pattern: str = "*.pcap", poll_interval: float = 1.0,
+               idle_timeout: float | None = None):
+        """
+        parse a capture that is still being written, and the files tcpdump rotates into `watch_dir` after it.
+
+        channel state is kept across file boundaries, pending documents are flushed whenever the reader catches up.
+        """
+        follower = PcapFollower(
+            self.file, watch_dir, pattern, self._port_filter(), poll_interval, idle_timeout, on_idle=self.flush
+        )
+        self._parse_segments(follower)
+
+    def _parse_segments(self, segments: typing.Iterable[TcpSegment]):
+        for segment in segments:
+            self.on_packet(
+                segment.ts, segment.src_ip, segment.src_port, segment.dst_ip, segment.dst_port, segment.flags,
+                segment.payload, segment.seq
+            )
+
+    def on_packet(self, ts: float, src_ip: int, src_port: int, dst_ip: int, dst_port: int, flags: int,
+                  payload: bytes, seq: int | None = None):
+        is_request = dst_port in self.ports
+        if not is_request and src_port not in self.ports:
+            if not self.discover_ports:
+                return
+            server_port = DubboChannel.detect_server_port(src_port, dst_port, payload)
+            if server_port is None:
+                return
+            logger.info(f"discovered dubbo server port {server_port}")
+            self.ports.add(server_port)
+            is_request = dst_port == server_port
+        if is_request:
+            key = flow_key(src_ip, src_port, dst_ip, dst_port)
+        else:
+            key = flow_key(dst_ip, dst_port, src_ip, src_port)
+        flow = self._flows.lookup(key)
+        if flow is None:
+            if is_request:
+                flow = Flow(DubboChannel(src_ip, src_port, dst_ip, dst_port, self.reorder_budget, self.stream_threshold,
+                                         self.value_policy, self.hole_timeout, self.max_body_len,
+                                         self.decode_budget))
+            else:
+                flow = Flow(DubboChannel(dst_ip, dst_port, src_ip, src_port, self.reorder_budget, self.stream_threshold,
+                                         self.value_policy, self.hole_timeout, self.max_body_len,
+                                         self.decode_budget))
+            self._flows.add(key, flow)
+        flow.last_seen = ts
+        channel = flow.channel
+        buffered_bytes = flow.buffered_bytes
+        if is_request:
+            if (flags & TH_SYN) != 0 and seq is not None:
+                channel.request_stream.open(seq)
+            if len(payload) > 0:
+                for request in channel.append_and_parse_requests(payload, ts, seq):
+                    self._on_request(key, flow, request)
+        else:
+            if (flags & TH_SYN) != 0 and seq is not None:
+                channel.response_stream.open(seq)
+            if len(payload) > 0:
+                for response in channel.append_and_parse_responses(payload, ts, seq):
+                    if response.is_event:
+                        continue
+                    request = flow.requests.pop(response.request_id, None)
+                    if request is None and channel.request_stream.holding:
+                        # the request is held behind a hole the server has already seen past.
+                        for held in channel.skip_request_hole(ts):
+                            self._on_request(key, flow, held)
+                        request = flow.requests.pop(response.request_id, None)
+                    if request:
+                        flow.pending_bytes = flow.pending_bytes - self._held_bytes(request)
+                        self.on_dubbo_call_parsed(request, response)
+                    else:
+                        logger.warning(f"not found request {response.request_id}")
+        self._buffered_bytes = self._buffered_bytes + flow.buffered_bytes - buffered_bytes
+        if (flags & TH_RST) != 0 or (flags & TH_FIN) != 0:
+            # the connection is closing, nothing left unanswered will be answered any more.
+            for request in flow.requests.values():
+                self.on_dubbo_call_parsed(request, timeout_at=ts)
+            flow.requests.clear()
+            self._buffered_bytes = self._buffered_bytes - flow.pending_bytes
+            flow.pending_bytes = 0
+            if is_request:
+                flow.request_closed = True
+            else:
+                flow.response_closed = True
+            if (flags & TH_RST) != 0 or (flow.request_closed and flow.response_closed):
+                self._remove_flow(key, ts, False)
+        if ts >= self._next_eviction or self._buffered_bytes > self.max_buffered_bytes:
+            self._evict(ts)
+
+    def _on_request(self, key: int, flow: Flow, request: DubboRequest):
+        if request.is_event:
+            return
+        if not request.is_two_way:
+            self.on_dubbo_call_parsed(request)
+            return
+        if request.content is not None:
+            # a view would keep the whole receive buffer alive while the request waits for its response.
+            view = request.content
+            request.content = bytes(view)
+            view.release()
+        flow.requests[request.request_id] = request
+        flow.pending_bytes = flow.pending_bytes + self._held_bytes(request)
+        self._request_deadlines.append((request.start_time, key, request.request_id))
+
+    def _evict(self, now: float):
+        """
+        time out requests unanswered for `request_timeout` of capture time, drop connections idle for longer than
+        `idle_timeout`, then the least recently active ones until the buffered bytes fit in `max_buffered_bytes`.
+        """
+        self._next_eviction = now + min(self.idle_timeout, self.request_timeout, DubboPacketParser.EVICTION_INTERVAL)
+        self._expire_requests(now)
+        deadline = now - self.idle_timeout
+        while len(self._flows) > 0:
+            key, flow = self._flows.oldest()
+            if flow.last_seen > deadline and self._buffered_bytes <= self.max_buffered_bytes:
+                break
+            self._remove_flow(key, now, True)
+
+    def _expire_requests(self, now: float):
+        deadline = now - self.request_timeout
+        deadlines = self._request_deadlines
+        while len(deadlines) > 0 and deadlines[0][0] <= deadline:
+            _, key, request_id = deadlines.popleft()
+            flow = self._flows.get(key)
+            if flow is None:
+                continue
+            request = flow.requests.pop(request_id, None)
+            if request is None:
+                continue
+            flow.pending_bytes = flow.pending_bytes - self._held_bytes(request)
+            self._buffered_bytes = self._buffered_bytes - self._held_bytes(request)
+            self.on_dubbo_call_parsed(request, timeout_at=now)
+
+    def _remove_flow(self, key: int, now: float, evicted: bool):
+        flow = self._flows.pop(key)
+        channel = flow.channel
+        for request in flow.requests.values():
+            self.on_dubbo_call_parsed(request, timeout_at=now)
+        self._buffered_bytes = self._buffered_bytes - flow.buffered_bytes
+        if evicted and (len(flow.requests) > 0 or flow.buffered_bytes > 0):
+            logger.info(
+                f"evicted {format_flow_key(key)} idle since {flow.last_seen}, {len(flow.requests)} pending requests "
+                f"timed out, {flow.buffered_bytes} buffered bytes dropped"
+            )
+        if channel.skipped_request_bytes > 0 or channel.skipped_response_bytes > 0:
+            logger.warning(
+                f"{format_flow_key(key)} skipped {channel.skipped_request_bytes} request bytes and "
+                f"{channel.skipped_response_bytes} response bytes while resynchronising, "
+                f"{channel.request_stream.missing_bytes + channel.response_stream.missing_bytes} bytes "
+                f"were never captured"
+            )
+
+    def _port_filter(self) -> set[int] | None:
+        # the readers keep the set they are given, hand out a copy so discovered ports do not narrow the filter.
+        return None if self.discover_ports else set(self.ports)
+
+    def on_dubbo_call_parsed(self, request: DubboRequest, response: DubboResponse = None, timeout_at: float = None):
+        """
+        store a call, answered by `response`, given up on at capture time `timeout_at`, or one way when neither is
+        given, in which case the call ends with the last packet of the request.
+        """
         if request:
             start_time = request.start_time
-            end_time = response.end_time if response is not None else time.time()
+            if response is not None:
+                end_time = response.end_time
+            elif timeout_at is not None:
+                end_time = timeout_at
+            else:
+                end_time = request.end_time
             cost_time = end_time - start_time
-            if request and request.state and not request.state.is_event:
+            if request and not request.is_event:
                 document = {
                     "@timestamp": int(request.start_time * 1000),
                     "start_time": request.start_time,
                     "end_time": end_time,
-                    "src_addr": src_ip,
-                    "src_port": src_port,
-                    "dst_addr": dest_ip,
-                    "dst_port": dest_port,
+                    "src_addr": ip_to_str(request.src_host),
+                    "src_port": request.src_port,
+                    "dst_addr": ip_to_str(request.dest_host),
+                    "dst_port": request.dest_port,
                     "cost_time_ms": cost_time * 1000
                 }
-                hessianInput = Hessian2Input(request.content)
-                hessianInput.read_utf()
-                service_name = hessianInput.read_utf()
-                service_version = hessianInput.read_utf()
-                method_name = hessianInput.read_utf()
-                desc = hessianInput.read_utf()
-                parameters = []
-                if len(desc) > 0:
-                    parts = [p for p in desc.split(";") if len(p) > 0]
-                    for _ in range(0, len(parts)):
-                        param = hessianInput.read_object()
-                        parameters.append(param)
-                attachments = hessianInput.read_object()
-                document.update(
-                    {
-                        "service_name": service_name,
-                        "service_version": service_version,
-                        "method_name": method_name,
-                        "parameters": json.dumps(parameters, ensure_ascii=False),
-                        "request_attachments": json.dumps(attachments, ensure_ascii=False),
-                    }
-                )
-                if response:
-                    hessianInput = Hessian2Input(response.content)
-                    if response.state.status == OK:
-                        if not response.state.is_heartbeat:
-                            b = hessianInput.read_int()
-                            if b == RESPONSE_VALUE_WITH_ATTACHMENTS or b == RESPONSE_VALUE:
-                                result = hessianInput.read_object()
-                                if result:
-                                    document["result"] = json.dumps(result)
-                                elif b == RESPONSE_WITH_EXCEPTION_WITH_ATTACHMENTS or b == RESPONSE_WITH_EXCEPTION:
-                                    error = hessianInput.read_object()
-                                    if error:
-                                        document["error"] = json.dumps(error)
-                                if b == RESPONSE_NULL_VALUE_WITH_ATTACHMENTS or b == RESPONSE_VALUE_WITH_ATTACHMENTS \
-                                        or b == RESPONSE_WITH_EXCEPTION_WITH_ATTACHMENTS:
-                                    res_attach = hessianInput.read_object()
-                                    document["response_attachments"] = json.dumps(res_attach)
-                    else:
-                        document["error"] = hessianInput.read_utf()
+                if timeout_at is not None:
+                    document["timeout"] = True
+                if not request.is_two_way:
+                    document["one_way"] = True
+                self._decode_body(self._decode_request, request, document)
+                if response is not None:
+                    self._decode_body(self._decode_response, response, document)
                 if len(document) > 0:
                     self._try_append_flush(document)
 
+    def _decode_body(self, decode: typing.Callable, frame: DubboRequest | DubboResponse, document: dict):
+        """
+        decode the body of one side of a call into `document`. a body that does not decode, often a false frame
+        found while resynchronising, only costs the fields not read yet and is recorded in `decode_error`.
+        """
+        try:
+            decode(frame, document)
+        except Exception as e:
+            self.decode_errors = self.decode_errors + 1
+            side = "request" if isinstance(frame, DubboRequest) else "response"
+            document["decode_error"] = f"{side}: {e}"
+            logger.warning(
+                f"failed to decode {side} {frame.request_id} of {document['src_addr']}:{document['src_port']}: {e}"
+            )
+
+    def _decode_request(self, request: DubboRequest, document: dict):
+        hessianInput = self._body_reader(request)
+        if hessianInput is not None:
+            hessianInput.read_utf()
+            service_name = hessianInput.read_utf()
+            service_version = hessianInput.read_utf()
+            method_name = hessianInput.read_utf()
+            desc = hessianInput.read_utf()
+            count = len([p for p in desc.split(";") if len(p) > 0])
+            if self.headers_only:
+                for _ in range(0, count):
+                    hessianInput.skip_object()
+            else:
+                document["parameters"] = hessianInput.read_json_values(count)
+            document.update(
+                {
+                    "service_name": service_name,
+                    "service_version": service_version,
+                    "method_name": method_name,
+                    "request_attachments": hessianInput.read_json(),
+                }
+            )
+
+    def _decode_response(self, response: DubboResponse, document: dict):
+        hessianInput = self._body_reader(response)
+        if hessianInput is not None:
+            if response.status == OK:
+                if not response.is_heartbeat:
+                    b = hessianInput.read_int()
+                    if (b == RESPONSE_VALUE_WITH_ATTACHMENTS or b == RESPONSE_VALUE) and self.headers_only:
+                        hessianInput.skip_object()
+                        if b == RESPONSE_VALUE_WITH_ATTACHMENTS:
+                            document["response_attachments"] = hessianInput.read_json()
+                    elif b == RESPONSE_VALUE_WITH_ATTACHMENTS or b == RESPONSE_VALUE:
+                        result = hessianInput.read_json()
+                        if result not in _FALSY_JSON:
+                            document["result"] = result
+                        elif b == RESPONSE_WITH_EXCEPTION_WITH_ATTACHMENTS or b == RESPONSE_WITH_EXCEPTION:
+                            error = hessianInput.read_json()
+                            if error not in _FALSY_JSON:
+                                document["error"] = error
+                        if b == RESPONSE_NULL_VALUE_WITH_ATTACHMENTS or b == RESPONSE_VALUE_WITH_ATTACHMENTS \
+                                or b == RESPONSE_WITH_EXCEPTION_WITH_ATTACHMENTS:
+                            document["response_attachments"] = hessianInput.read_json()
+            else:
+                document["error"] = hessianInput.read_utf()
+
+    @staticmethod
+    def _held_bytes(request: DubboRequest) -> int:
+        """
+        raw body bytes kept for a parked request, copied out of the receive buffer when it was parked. a streamed
+        body only holds its decoded values.
+        """
+        return 0 if request.content is None else len(request.content)
+
+    def _body_reader(self, frame: DubboRequest | DubboResponse) -> Hessian2JsonTranscoder | DecodedJsonValues | None:
+        """
+        json reader over the body of a frame, streamed bodies are read back from their decoded values, None when a
+        streamed body failed to decode.
+        """
+        if frame.content is not None:
+            return Hessian2JsonTranscoder(frame.content, self._json_out, budget=self.decode_budget,
+                                          value_policy=self.value_policy)
+        if frame.values is not None:
+            return DecodedJsonValues(frame.values)
+        return None
+
     def _try_append_flush(self, document: dict):
         if not self._elastic_client:
             return
@@ -151,7 +385,7 @@ class DubboPacketParser:
             self.flush()
 
     def flush(self):
-        if not self._elastic_client:
+        if not self._elastic_client or len(self._batch_queue) == 0:
             return
         actions = []
         for doc in self._batch_queue:
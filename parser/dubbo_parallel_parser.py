@@ -0,0 +1,172 @@
+import multiprocessing
+import queue
+import traceback
+import typing
+import zlib
+
+from elasticsearch7 import Elasticsearch
+from loguru import logger
+
+from parser.dubbo_packet_parser import DubboPacketParser
+from parser.pcap_reader import open_pcap, TcpSegment
+
+DOCUMENTS_BATCH_SIZE = 256
+SEGMENTS_BATCH_SIZE = 512
+# segment batches queued per worker before the reading process waits for it
+SEGMENT_QUEUE_BATCHES = 16
+
+MESSAGE_DOCUMENTS = 0
+MESSAGE_DONE = 1
+MESSAGE_ERROR = 2
+
+
+def shard_of(src_ip: int, src_port: int, dst_ip: int, dst_port: int, shards: int) -> int:
+    """
+    stable shard of a connection, the same for both directions so segments are routed before the server port is
+    known. crc32 spreads connections that only differ in the client port.
+    """
+    src = (src_ip << 16) | src_port
+    dst = (dst_ip << 16) | dst_port
+    low, high = (src, dst) if src < dst else (dst, src)
+    return zlib.crc32(((low << 48) | high).to_bytes(12, "big")) % shards
+
+
+class ShardDubboPacketParser(DubboPacketParser):
+    """
+    dubbo packets parser running in a worker process.
+
+    the worker parses the segments of the connections routed to its shard, parsed documents are sent back to the
+    coordinating process in batches.
+    """
+
+    def __init__(self, ports: typing.Iterable[int] | None, shard: int, result_queue: multiprocessing.Queue,
+                 **options):
+        super().__init__(None, ports, None, **options)
+        self.shard = shard
+        self._result_queue = result_queue
+
+    def _try_append_flush(self, document: dict):
+        self._batch_queue.append(document)
+        if len(self._batch_queue) >= DOCUMENTS_BATCH_SIZE:
+            self.flush()
+
+    def flush(self):
+        if len(self._batch_queue) > 0:
+            # the queue pickles in a feeder thread, so hand over the list and start a new one.
+            self._result_queue.put((MESSAGE_DOCUMENTS, self.shard, self._batch_queue))
+            self._batch_queue = []
+
+
+def _received_segments(segment_queue: multiprocessing.Queue) -> typing.Iterator[TcpSegment]:
+    while True:
+        batch = segment_queue.get()
+        if batch is None:
+            return
+        yield from batch
+
+
+def _run_shard(ports: set[int], shard: int, segment_queue: multiprocessing.Queue,
+               result_queue: multiprocessing.Queue, options: dict):
+    try:
+        parser = ShardDubboPacketParser(ports, shard, result_queue, **options)
+        parser._parse_segments(_received_segments(segment_queue))
+        parser.flush()
+        result_queue.put((MESSAGE_DONE, shard, None))
+    except BaseException:
+        result_queue.put((MESSAGE_ERROR, shard, traceback.format_exc()))
+
+
+class ParallelDubboPacketParser(DubboPacketParser):
+    """
+    dubbo packets parser sharding the connections of a single capture across worker processes.
+
+    this process reads and decodes the capture once and routes every segment by its connection, so one connection
+    is always parsed by one worker and keeps its ordering, while reassembly and body decoding are split across
+    the workers. the documents of all workers are merged into this parser's sink. `options` are the
+    `DubboPacketParser` keyword options handed to every worker.
+    """
+
+    def __init__(self, file: str, ports: typing.Iterable[int] | None, elastic_client: Elasticsearch, workers: int,
+                 **options):
+        super().__init__(file, ports, elastic_client, **options)
+        self.workers = workers
+        self._options = options
+        self._processes = list[multiprocessing.Process]()
+        self._running = 0
+
+    def parse(self):
+        result_queue = multiprocessing.Queue(maxsize=self.workers * 16)
+        segment_queues = [multiprocessing.Queue(maxsize=SEGMENT_QUEUE_BATCHES) for _ in range(0, self.workers)]
+        self._processes = [
+            multiprocessing.Process(
+                target=_run_shard,
+                args=(self.ports, shard, segment_queues[shard], result_queue, self._options),
+                daemon=True
+            )
+            for shard in range(0, self.workers)
+        ]
+        for process in self._processes:
+            process.start()
+        self._running = self.workers
+        try:
+            batches = [list[TcpSegment]() for _ in range(0, self.workers)]
+            workers = self.workers
+            for segment in open_pcap(self.file, self._port_filter()):
+                shard = shard_of(segment.src_ip, segment.src_port, segment.dst_ip, segment.dst_port, workers)
+                batch = batches[shard]
+                batch.append(segment)
+                if len(batch) >= SEGMENTS_BATCH_SIZE:
+                    self._send(segment_queues[shard], batch, result_queue)
+                    batches[shard] = []
+            for shard in range(0, workers):
+                if len(batches[shard]) > 0:
+                    self._send(segment_queues[shard], batches[shard], result_queue)
+                self._send(segment_queues[shard], None, result_queue)
+            while self._running > 0:
+                self._receive(result_queue, 1)
+        finally:
+            for process in self._processes:
+                if process.is_alive():
+                    process.terminate()
+                process.join()
+        print("******* parse dubbo packets success *******")
+
+    def _send(self, segment_queue: multiprocessing.Queue, batch: list[TcpSegment] | None,
+              result_queue: multiprocessing.Queue):
+        """
+        hand a batch of segments, or the end of the capture, to a worker. documents are taken in while the worker's
+        queue is full, so a worker waiting to send its documents never blocks the reading.
+        """
+        while True:
+            try:
+                segment_queue.put(batch, timeout=0.01)
+                break
+            except queue.Full:
+                self._receive(result_queue, 0.01)
+        while self._receive(result_queue, None):
+            pass
+
+    def _receive(self, result_queue: multiprocessing.Queue, timeout: float | None) -> bool:
+        """
+        take in one message of the workers, waiting up to `timeout` seconds or not at all when it is None. returns
+        False when there was none.
+        """
+        try:
+            if timeout is None:
+                kind, shard, payload = result_queue.get_nowait()
+            else:
+                kind, shard, payload = result_queue.get(timeout=timeout)
+        except queue.Empty:
+            for process in self._processes:
+                if process.exitcode is not None and process.exitcode != 0:
+                    raise Exception(f"dubbo parser worker exited with code {process.exitcode}")
+            return False
+        if kind == MESSAGE_DOCUMENTS:
+            for document in payload:
+                self._try_append_flush(document)
+        elif kind == MESSAGE_DONE:
+            logger.info(f"dubbo parser worker {shard} finished")
+            self._running = self._running - 1
+        else:
+            raise Exception(f"dubbo parser worker {shard} failed:\n{payload}")
+        return True
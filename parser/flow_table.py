@@ -0,0 +1,84 @@
+import socket
+from collections import OrderedDict
+
+from parser.dubbo_common import DubboChannel, DubboRequest
+
+
+def flow_key(client_ip: int, client_port: int, server_ip: int, server_port: int) -> int:
+    """
+    pack the ipv4 addresses and ports of a connection, as read from the ip/tcp headers, into one integer.
+    """
+    return (client_ip << 64) | (client_port << 48) | (server_ip << 16) | server_port
+
+
+def ip_to_str(ip: int) -> str:
+    return socket.inet_ntoa(ip.to_bytes(4, "big"))
+
+
+def format_flow_key(key: int) -> str:
+    return f"{ip_to_str(key >> 64)}:{(key >> 48) & 0xffff}->{ip_to_str((key >> 16) & 0xffffffff)}:{key & 0xffff}"
+
+
+class Flow:
+    """
+    everything kept for one client->server connection, the frame parser and the requests waiting for a response.
+    """
+    __slots__ = ("channel", "requests", "last_seen", "pending_bytes", "request_closed", "response_closed")
+
+    def __init__(self, channel: DubboChannel):
+        self.channel = channel
+        self.requests = dict[int, DubboRequest]()
+        # capture time of the last segment in either direction
+        self.last_seen = 0.0
+        # body bytes of the requests in `requests`
+        self.pending_bytes = 0
+        self.request_closed = False
+        self.response_closed = False
+
+    @property
+    def buffered_bytes(self) -> int:
+        return self.channel.buffered_bytes + self.pending_bytes
+
+
+class FlowTable:
+    """
+    connections keyed by `flow_key`, in least recently active order.
+    """
+
+    def __init__(self):
+        self._flows = OrderedDict[int, Flow]()
+
+    def __len__(self) -> int:
+        return len(self._flows)
+
+    def __contains__(self, key: int) -> bool:
+        return key in self._flows
+
+    def __iter__(self):
+        return iter(self._flows)
+
+    def lookup(self, key: int) -> Flow | None:
+        """
+        return the flow of `key` and mark it as the most recently active one.
+        """
+        flow = self._flows.get(key)
+        if flow is not None:
+            self._flows.move_to_end(key)
+        return flow
+
+    def get(self, key: int) -> Flow | None:
+        """
+        return the flow of `key` without touching the activity order.
+        """
+        return self._flows.get(key)
+
+    def add(self, key: int, flow: Flow):
+        self._flows[key] = flow
+
+    def oldest(self) -> tuple[int, Flow] | None:
+        for item in self._flows.items():
+            return item
+        return None
+
+    def pop(self, key: int) -> Flow:
+        return self._flows.pop(key)
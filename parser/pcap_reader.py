@@ -0,0 +1,296 @@
+import glob
+import mmap
+import os
+import struct
+import time
+import typing
+
+import dpkt
+
+PCAP_MAGIC_MICRO = 0xa1b2c3d4
+PCAP_MAGIC_NANO = 0xa1b23c4d
+
+LINKTYPE_ETHERNET = 1
+LINKTYPE_RAW = 101
+LINKTYPE_LINUX_SLL = 113
+
+ETH_TYPE_IP = 0x0800
+ETH_TYPE_8021Q = 0x8100
+
+IP_PROTO_TCP = 6
+
+TH_FIN = 0x01
+TH_SYN = 0x02
+TH_RST = 0x04
+
+# segments without payload are only interesting when they open or close a connection.
+CONTROL_FLAGS = TH_FIN | TH_SYN | TH_RST
+
+PCAP_FILE_HEADER_LEN = 24
+PCAP_RECORD_HEADER_LEN = 16
+
+_UINT16 = struct.Struct(">H")
+# version/ihl, total length, fragment flags/offset, protocol, src, dst
+_IPV4 = struct.Struct(">BxH2xHxB2xII")
+# src port, dst port, sequence number, data offset, flags
+_TCP = struct.Struct(">HHI4xBB")
+
+
+class TcpSegment(typing.NamedTuple):
+    ts: float
+    src_ip: int
+    src_port: int
+    dst_ip: int
+    dst_port: int
+    flags: int
+    seq: int
+    payload: bytes
+
+
+def decode_segment(buffer, offset: int, caplen: int, linktype: int, ports: set[int] | None):
+    """
+    decode the ipv4/tcp headers of one captured frame straight from `buffer`.
+
+    returns (src_ip, src_port, dst_ip, dst_port, flags, seq, payload offset, payload length), or None when the
+    frame is not a tcp segment worth handing to the parser (other protocols, fragments, other ports, bare acks).
+    """
+    end = offset + caplen
+    if linktype == LINKTYPE_ETHERNET:
+        if caplen < 14:
+            return None
+        eth_type = _UINT16.unpack_from(buffer, offset + 12)[0]
+        offset = offset + 14
+        while eth_type == ETH_TYPE_8021Q and offset + 4 <= end:
+            eth_type = _UINT16.unpack_from(buffer, offset + 2)[0]
+            offset = offset + 4
+        if eth_type != ETH_TYPE_IP:
+            return None
+    elif linktype == LINKTYPE_LINUX_SLL:
+        if caplen < 16 or _UINT16.unpack_from(buffer, offset + 14)[0] != ETH_TYPE_IP:
+            return None
+        offset = offset + 16
+    elif linktype != LINKTYPE_RAW:
+        return None
+    if offset + 20 > end:
+        return None
+    ver_ihl, total_len, frag, proto, src_ip, dst_ip = _IPV4.unpack_from(buffer, offset)
+    if ver_ihl >> 4 != 4 or proto != IP_PROTO_TCP or frag & 0x1fff != 0:
+        return None
+    ip_end = min(offset + total_len, end)
+    offset = offset + ((ver_ihl & 0x0f) << 2)
+    if offset + 20 > ip_end:
+        return None
+    src_port, dst_port, seq, data_offset, flags = _TCP.unpack_from(buffer, offset)
+    if ports is not None and src_port not in ports and dst_port not in ports:
+        return None
+    offset = offset + ((data_offset >> 4) << 2)
+    payload_len = ip_end - offset
+    if payload_len <= 0:
+        if flags & CONTROL_FLAGS == 0:
+            return None
+        payload_len = 0
+    return src_ip, src_port, dst_ip, dst_port, flags, seq, offset, payload_len
+
+
+def parse_file_header(header: bytes) -> tuple[str, float, int]:
+    """
+    returns the struct byte order, the timestamp fraction scale and the link type of a classic pcap file header.
+    """
+    for order in ("<", ">"):
+        magic = struct.unpack_from(f"{order}I", header)[0]
+        if magic == PCAP_MAGIC_MICRO:
+            return order, 1e-6, struct.unpack_from(f"{order}I", header, 20)[0]
+        if magic == PCAP_MAGIC_NANO:
+            return order, 1e-9, struct.unpack_from(f"{order}I", header, 20)[0]
+    raise ValueError("not a classic pcap file")
+
+
+def is_classic_pcap(file: str) -> bool:
+    with open(file, mode="rb") as f:
+        header = f.read(PCAP_FILE_HEADER_LEN)
+    if len(header) < PCAP_FILE_HEADER_LEN:
+        return False
+    try:
+        parse_file_header(header)
+        return True
+    except ValueError:
+        return False
+
+
+class MmapPcapReader:
+    """
+    memory mapped reader for classic pcap files.
+
+    record headers and ethernet/ipv4/tcp headers are unpacked in place with `struct.unpack_from`, only segments on
+    `ports` that carry payload (or open/close the connection) are materialised as `TcpSegment`.
+    """
+
+    def __init__(self, file: str, ports: set[int] | None = None):
+        self.file = file
+        self.ports = ports
+
+    def __iter__(self) -> typing.Iterator[TcpSegment]:
+        with open(self.file, mode="rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            if size < PCAP_FILE_HEADER_LEN:
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+                order, ts_scale, linktype = parse_file_header(buffer[0:PCAP_FILE_HEADER_LEN])
+                record = struct.Struct(f"{order}IIII")
+                ports = self.ports
+                offset = PCAP_FILE_HEADER_LEN
+                while offset + PCAP_RECORD_HEADER_LEN <= size:
+                    sec, frac, caplen, _ = record.unpack_from(buffer, offset)
+                    offset = offset + PCAP_RECORD_HEADER_LEN
+                    if offset + caplen > size:
+                        # truncated trailing record
+                        break
+                    segment = decode_segment(buffer, offset, caplen, linktype, ports)
+                    if segment is not None:
+                        src_ip, src_port, dst_ip, dst_port, flags, seq, start, length = segment
+                        yield TcpSegment(
+                            sec + frac * ts_scale, src_ip, src_port, dst_ip, dst_port, flags, seq,
+                            buffer[start:start + length]
+                        )
+                    offset = offset + caplen
+
+
+class DpktPcapReader:
+    """
+    fallback reader for capture formats the mmap reader does not understand (pcapng).
+    """
+
+    def __init__(self, file: str, ports: set[int] | None = None):
+        self.file = file
+        self.ports = ports
+
+    def __iter__(self) -> typing.Iterator[TcpSegment]:
+        with open(self.file, mode="rb") as f:
+            reader = dpkt.pcapng.Reader(f)
+            linktype = reader.datalink()
+            for ts, pkt in reader:
+                segment = decode_segment(pkt, 0, len(pkt), linktype, self.ports)
+                if segment is not None:
+                    src_ip, src_port, dst_ip, dst_port, flags, seq, start, length = segment
+                    yield TcpSegment(ts, src_ip, src_port, dst_ip, dst_port, flags, seq, pkt[start:start + length])
+
+
+def open_pcap(file: str, ports: set[int] | None = None) -> typing.Iterable[TcpSegment]:
+    if is_classic_pcap(file):
+        return MmapPcapReader(file, ports)
+    return DpktPcapReader(file, ports)
+
+
+class PcapFollower:
+    """
+    reader for pcap files that are still being written.
+
+    the current file is tailed record by record, when `watch_dir` is given the files matching `pattern` are read in
+    rotation order (modification time, then name) and the follower moves on once a newer file shows up and the
+    current one has been drained. iteration stops after `idle_timeout` seconds without new records, or never when
+    it is None, `on_idle` is called every time the follower catches up with the writer.
+    """
+
+    def __init__(self, file: str | None, watch_dir: str | None = None, pattern: str = "*.pcap",
+                 ports: set[int] | None = None, poll_interval: float = 1.0, idle_timeout: float | None = None,
+                 on_idle: typing.Callable[[], None] | None = None):
+        if file is None and watch_dir is None:
+            raise ValueError("either file or watch_dir is required")
+        self.file = file
+        self.watch_dir = watch_dir
+        self.pattern = pattern
+        self.ports = ports
+        self.poll_interval = poll_interval
+        self.idle_timeout = idle_timeout
+        self.on_idle = on_idle
+
+    def _rotated_files(self) -> list[str]:
+        if self.watch_dir is None:
+            return []
+        files = []
+        for path in glob.glob(os.path.join(self.watch_dir, self.pattern)):
+            try:
+                files.append((os.stat(path).st_mtime, os.path.basename(path), path))
+            except FileNotFoundError:
+                continue
+        return [path for _, _, path in sorted(files)]
+
+    def _next_file(self, current: str | None) -> str | None:
+        files = self._rotated_files()
+        if current is None:
+            return files[0] if len(files) > 0 else None
+        current = os.path.abspath(current)
+        paths = [os.path.abspath(f) for f in files]
+        if current not in paths:
+            return None
+        index = paths.index(current)
+        return files[index + 1] if index + 1 < len(files) else None
+
+    def _wait(self, idle_since: float) -> bool:
+        if self.on_idle is not None:
+            self.on_idle()
+        if self.idle_timeout is not None and time.monotonic() - idle_since >= self.idle_timeout:
+            return False
+        time.sleep(self.poll_interval)
+        return True
+
+    def __iter__(self) -> typing.Iterator[TcpSegment]:
+        current = self.file
+        idle_since = time.monotonic()
+        while current is None:
+            current = self._next_file(None)
+            if current is None and not self._wait(idle_since):
+                return
+        while True:
+            yield from self._follow_file(current)
+            idle_since = time.monotonic()
+            while True:
+                next_file = self._next_file(current)
+                if next_file is not None:
+                    current = next_file
+                    break
+                if not self._wait(idle_since):
+                    return
+
+    def _follow_file(self, file: str) -> typing.Iterator[TcpSegment]:
+        """
+        yield the records of `file` until it stops growing and a newer rotated file exists, or the idle timeout.
+        """
+        with open(file, mode="rb") as f:
+            idle_since = time.monotonic()
+            header = b""
+            while len(header) < PCAP_FILE_HEADER_LEN:
+                header = header + f.read(PCAP_FILE_HEADER_LEN - len(header))
+                if len(header) < PCAP_FILE_HEADER_LEN:
+                    if self._next_file(file) is not None or not self._wait(idle_since):
+                        return
+            order, ts_scale, linktype = parse_file_header(header)
+            record = struct.Struct(f"{order}IIII")
+            drained = False
+            while True:
+                position = f.tell()
+                data = f.read(PCAP_RECORD_HEADER_LEN)
+                if len(data) == PCAP_RECORD_HEADER_LEN:
+                    sec, frac, caplen, _ = record.unpack_from(data)
+                    data = f.read(caplen)
+                    if len(data) == caplen:
+                        drained = False
+                        idle_since = time.monotonic()
+                        segment = decode_segment(data, 0, caplen, linktype, self.ports)
+                        if segment is not None:
+                            src_ip, src_port, dst_ip, dst_port, flags, seq, start, length = segment
+                            yield TcpSegment(
+                                sec + frac * ts_scale, src_ip, src_port, dst_ip, dst_port, flags, seq,
+                                data[start:start + length]
+                            )
+                        continue
+                # the writer has not finished this record yet, rewind and wait for it.
+                f.seek(position)
+                if self._next_file(file) is not None:
+                    # tcpdump closes the old file before opening the next one, read it once more and move on.
+                    if drained:
+                        return
+                    drained = True
+                    continue
+                if not self._wait(idle_since):
+                    return
@@ -0,0 +1,137 @@
+import heapq
+
+SEQ_MOD = 1 << 32
+
+SEQ_HALF = 1 << 31
+
+
+def seq_diff(seq: int, base: int) -> int:
+    """
+    signed distance from `base` to `seq` in 32 bit sequence number space.
+    """
+    diff = (seq - base) % SEQ_MOD
+    return diff - SEQ_MOD if diff >= SEQ_HALF else diff
+
+
+class TcpReassembler:
+    """
+    per-direction tcp stream reassembler.
+
+    segments are released in sequence order, retransmitted bytes are dropped and segments arriving ahead of a
+    hole are held back until the hole is filled. the hole is given up on once more than `max_buffered_bytes` or
+    `max_held_segments` are held back, or once a segment arrives `hole_timeout` capture seconds after the hole
+    opened, so a quiet connection recovers with its next segment. the stream then jumps to the first held segment
+    and a gap marker (payload None) is emitted so the consumer can resynchronise.
+
+    held segments are keyed by their position in the stream, counted from where reassembly started so it keeps
+    growing across sequence number wraparound, and a heap of those positions finds the first one.
+    """
+
+    DEFAULT_HOLE_TIMEOUT = 3.0
+
+    DEFAULT_MAX_HELD_SEGMENTS = 1024
+
+    def __init__(self, max_buffered_bytes: int, hole_timeout: float = DEFAULT_HOLE_TIMEOUT,
+                 max_held_segments: int = DEFAULT_MAX_HELD_SEGMENTS):
+        self.max_buffered_bytes = max_buffered_bytes
+        self.hole_timeout = hole_timeout
+        self.max_held_segments = max_held_segments
+        self.next_seq = None
+        self.buffered_bytes = 0
+        self.duplicate_bytes = 0
+        self.missing_bytes = 0
+        # stream position of next_seq
+        self._position = 0
+        self._pending = dict[int, tuple[float, bytes]]()
+        self._positions = list[int]()
+        # capture time the current hole opened at
+        self._hole_since = 0.0
+
+    def open(self, isn: int):
+        """
+        start the stream from a SYN carrying the initial sequence number `isn`.
+        """
+        self.next_seq = (isn + 1) % SEQ_MOD
+        self._position = 0
+        self._pending.clear()
+        self._positions.clear()
+        self.buffered_bytes = 0
+
+    def push(self, seq: int, payload: bytes, ts: float) -> list[tuple[float, bytes | None]]:
+        """
+        add a segment and return the (ts, payload) pieces that are now in order, payload None marks a gap.
+        """
+        if self.next_seq is None:
+            # capture started mid-connection, trust the first segment seen.
+            self.next_seq = seq
+        ready = []
+        position = self._position + seq_diff(seq, self.next_seq)
+        if self._release(position, payload, ts, ready):
+            self._drain(ready)
+            return ready
+        held = self._pending.get(position)
+        if held is None or len(held[1]) < len(payload):
+            if len(self._pending) == 0:
+                self._hole_since = ts
+            self.buffered_bytes = self.buffered_bytes + len(payload) - (len(held[1]) if held else 0)
+            self._pending[position] = (ts, payload)
+            if held is None:
+                heapq.heappush(self._positions, position)
+        while len(self._pending) > 0 and (self.buffered_bytes > self.max_buffered_bytes
+                                          or len(self._pending) > self.max_held_segments
+                                          or ts - self._hole_since > self.hole_timeout):
+            self._skip_hole(ts, ready)
+        return ready
+
+    @property
+    def holding(self) -> bool:
+        """
+        True while segments are held back behind a hole.
+        """
+        return len(self._pending) > 0
+
+    def give_up(self, ts: float) -> list[tuple[float, bytes | None]]:
+        """
+        give up on the current hole, for when the other direction shows its bytes were delivered uncaptured.
+        returns the pieces released, starting with the gap marker.
+        """
+        ready = []
+        if len(self._pending) > 0:
+            self._skip_hole(ts, ready)
+        return ready
+
+    def _skip_hole(self, ts: float, ready: list):
+        first = self._positions[0]
+        self.missing_bytes = self.missing_bytes + first - self._position
+        self.next_seq = (self.next_seq + first - self._position) % SEQ_MOD
+        self._position = first
+        ready.append((ts, None))
+        self._drain(ready)
+        # the segments still held wait for the next hole afresh.
+        self._hole_since = ts
+
+    def _release(self, position: int, payload: bytes, ts: float, ready: list) -> bool:
+        """
+        release the part of a segment at or after `next_seq`, returns False when the segment is still ahead.
+        """
+        offset = position - self._position
+        if offset > 0:
+            return False
+        if offset + len(payload) <= 0:
+            self.duplicate_bytes = self.duplicate_bytes + len(payload)
+            return True
+        if offset < 0:
+            self.duplicate_bytes = self.duplicate_bytes - offset
+            payload = payload[-offset:]
+        ready.append((ts, payload))
+        self.next_seq = (self.next_seq + len(payload)) % SEQ_MOD
+        self._position = self._position + len(payload)
+        return True
+
+    def _drain(self, ready: list):
+        positions = self._positions
+        while len(positions) > 0 and positions[0] <= self._position:
+            position = heapq.heappop(positions)
+            ts, payload = self._pending.pop(position)
+            self.buffered_bytes = self.buffered_bytes - len(payload)
+            self._release(position, payload, ts, ready)
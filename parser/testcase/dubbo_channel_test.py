@@ -0,0 +1,119 @@
+#!/bin/python
+# -- coding: utf-8 --
+import struct
+
+from parser.dubbo_common import DubboChannel, PacketIndex
+from parser.testcase.packets import build_frame
+
+
+class TestDubboChannel:
+    """
+    test class for dubbo channel reassembly.
+    """
+
+    def test_request_split_across_packets(self):
+        channel = DubboChannel(0x7f000001, 50000, 0x7f000001, 20880)
+        frame = build_frame(7, b"x" * 100)
+        assert channel.append_and_parse_requests(frame[:10], 1.0) == []
+        assert channel.append_and_parse_requests(frame[10:60], 2.0) == []
+        requests = channel.append_and_parse_requests(frame[60:], 3.0)
+        assert len(requests) == 1
+        request = requests[0]
+        assert request.request_id == 7
+        assert request.is_two_way
+        assert request.start_time == 1.0
+        assert request.end_time == 3.0
+        assert isinstance(request.content, memoryview)
+        assert bytes(request.content) == b"x" * 100
+
+    def test_response_keeps_frame_after_buffer_grows(self):
+        channel = DubboChannel(0x7f000001, 50000, 0x7f000001, 20880)
+        first = build_frame(1, b"a" * 32, flag=0x02, status=20)
+        second = build_frame(2, b"b" * 32, flag=0x02, status=20)
+        response, = channel.append_and_parse_responses(first + second[:20], 1.0)
+        assert response.request_id == 1
+        assert response.status == 20
+        # the next packet must not disturb the frame already handed out.
+        response2, = channel.append_and_parse_responses(second[20:], 2.0)
+        assert bytes(response.content) == b"a" * 32
+        assert response2.request_id == 2
+        assert response2.start_time == 1.0
+        assert response2.end_time == 2.0
+        assert bytes(response2.content) == b"b" * 32
+
+    def test_pipelined_requests_in_one_packet(self):
+        channel = DubboChannel(0x7f000001, 50000, 0x7f000001, 20880)
+        frames = b"".join(build_frame(i, bytes([i]) * (i + 1)) for i in range(5))
+        requests = channel.append_and_parse_requests(frames + build_frame(5, b"tail")[:8], 1.0)
+        assert [r.request_id for r in requests] == [0, 1, 2, 3, 4]
+        assert [bytes(r.content) for r in requests] == [bytes([i]) * (i + 1) for i in range(5)]
+        requests = channel.append_and_parse_requests(build_frame(5, b"tail")[8:], 2.0)
+        assert [r.request_id for r in requests] == [5]
+        assert requests[0].start_time == 1.0
+
+    def test_resynchronise_after_garbage(self):
+        channel = DubboChannel(0x7f000001, 50000, 0x7f000001, 20880)
+        # a capture starting in the middle of a frame, with a stray magic inside the garbage.
+        garbage = b"\x01\x02\xda\xbb\x00\x00" + b"z" * 30 + b"\xda"
+        requests = channel.append_and_parse_requests(garbage, 1.0)
+        assert requests == []
+        requests = channel.append_and_parse_requests(b"\xbb" + build_frame(3, b"body")[2:] + build_frame(4, b"x"), 2.0)
+        assert [r.request_id for r in requests] == [3, 4]
+        assert bytes(requests[0].content) == b"body"
+        assert requests[0].start_time == 1.0
+        assert requests[1].start_time == 2.0
+        assert channel.skipped_request_bytes == len(garbage) - 1
+
+    def test_header_claiming_an_oversized_body_is_garbage(self):
+        channel = DubboChannel(0x7f000001, 50000, 0x7f000001, 20880)
+        false_header = DubboChannel.HEADER.pack(DubboChannel.MAGIC_SHORT, 0xc2, 0, 9, 9 * 1024 * 1024)
+        requests = channel.append_and_parse_requests(false_header + build_frame(5, b"x"), 1.0)
+        assert [r.request_id for r in requests] == [5]
+        assert channel.skipped_request_bytes == len(false_header)
+        channel = DubboChannel(0x7f000001, 50000, 0x7f000001, 20880, max_body_len=16 * 1024 * 1024)
+        assert channel.append_and_parse_requests(false_header + build_frame(5, b"x"), 1.0) == []
+
+    def test_gap_keeps_frames_released_before_it(self):
+        channel = DubboChannel(0x7f000001, 50000, 0x7f000001, 20880, reorder_budget=100)
+        channel.request_stream.open(999)
+        frames = [build_frame(i, bytes([i]) * 20) for i in range(6)]
+        offsets = [1000 + 36 * i for i in range(6)]
+        # frames 0 and 2 are lost, 1 is complete and released only when 4 and 5 overflow the budget.
+        assert channel.append_and_parse_requests(frames[1], 1.0, offsets[1]) == []
+        assert channel.append_and_parse_requests(frames[3], 2.0, offsets[3]) == []
+        requests = channel.append_and_parse_requests(frames[4] + frames[5], 3.0, offsets[4])
+        assert [r.request_id for r in requests] == [1, 3, 4, 5]
+        assert channel.skipped_request_bytes == 0
+
+    def test_server_heartbeat_is_dropped(self):
+        channel = DubboChannel(0x7f000001, 50000, 0x7f000001, 20880)
+        heartbeat = build_frame(100, b"N", 0xe2)
+        response = build_frame(1, b"ok", 0x02, 20)
+        responses = channel.append_and_parse_responses(heartbeat[:10], 1.0)
+        responses += channel.append_and_parse_responses(heartbeat[10:] + response, 2.0)
+        assert [r.request_id for r in responses] == [1]
+        assert responses[0].end_time == 2.0
+        assert channel.skipped_response_bytes == 0
+
+    def test_header_layout(self):
+        frame = build_frame(0x0102030405060708, b"")
+        assert frame[:4] == b"\xda\xbb\xc2\x00"
+        assert struct.unpack(">Q", frame[4:12])[0] == 0x0102030405060708
+
+
+class TestPacketIndex:
+    """
+    test class for the packet timestamp index.
+    """
+
+    def test_lookup_and_release(self, monkeypatch):
+        monkeypatch.setattr(PacketIndex, "COMPACT_THRESHOLD", 2)
+        index = PacketIndex()
+        for i in range(6):
+            index.append(float(i), 10)
+        assert [index.ts_at(p) for p in (0, 9, 10, 35, 59)] == [0.0, 0.0, 1.0, 3.0, 5.0]
+        index.release(30)
+        assert len(index) == 3
+        assert index.ts_at(30) == 3.0
+        index.append(6.0, 5)
+        assert index.ts_at(62) == 6.0
@@ -0,0 +1,342 @@
+#!/bin/python
+# -- coding: utf-8 --
+import json
+import os
+
+from hessian2.hessian2_json import DecodeBudget
+from parser.dubbo_packet_parser import DubboPacketParser, discover_ports
+from parser.dubbo_parallel_parser import ParallelDubboPacketParser, shard_of
+from parser.flow_table import format_flow_key
+from parser.testcase.packets import (build_frame, hessian_int, hessian_string, request_body, response_body, write_pcap,
+                                     Connection, TH_ACK, TH_FIN, TH_SYN)
+
+CLIENT = "10.0.0.1"
+SERVER = "10.0.0.2"
+PORT = 20880
+
+
+class CollectingParser(DubboPacketParser):
+
+    def __init__(self, file: str, ports: set[int] | None, **options):
+        super().__init__(file, ports, None, **options)
+        self.documents = []
+
+    def _try_append_flush(self, document: dict):
+        self.documents.append(document)
+
+
+class TestDubboPacketParser:
+    """
+    end to end test class for the pcap parser.
+    """
+
+    def test_pipelined_calls(self, tmp_path):
+        body = request_body("org.demo.EchoService", "echo", "Ljava/lang/String;", hessian_string("hi"))
+        requests = b"".join(build_frame(i, body) for i in range(3))
+        responses = b"".join(build_frame(i, response_body(hessian_string(f"r{i}")), 0x02, 20) for i in range(3))
+        connection = Connection(CLIENT, 40000, SERVER, PORT)
+        file = str(tmp_path / "dubbo.pcap")
+        write_pcap(file, [
+            (1.0, connection.request(requests)),
+            (1.5, connection.response(responses)),
+            (2.0, connection.request(flags=TH_ACK | TH_FIN)),
+        ])
+        parser = CollectingParser(file, {PORT})
+        parser.parse()
+        assert len(parser.documents) == 3
+        for i, document in enumerate(parser.documents):
+            assert document["service_name"] == "org.demo.EchoService"
+            assert document["method_name"] == "echo"
+            assert json.loads(document["parameters"]) == ["hi"]
+            assert json.loads(document["result"]) == f"r{i}"
+            assert document["src_addr"] == CLIENT
+            assert document["dst_port"] == PORT
+            assert document["cost_time_ms"] == 500
+
+    def test_headers_only(self, tmp_path):
+        param = b"C\x04Bean\x91\x01a" + b"\x60" + hessian_string("x" * 20)
+        body = request_body("org.demo.EchoService", "echo", "Lorg/demo/Bean;", param, b"H\x07traceId\x01tZ")
+        connection = Connection(CLIENT, 40000, SERVER, PORT)
+        file = str(tmp_path / "dubbo.pcap")
+        write_pcap(file, [
+            (1.0, connection.request(build_frame(1, body))),
+            (1.5, connection.response(build_frame(1, response_body(param), 0x02, 20))),
+            (2.0, connection.request(build_frame(2, body))),
+            # a value with attachments, the result is skipped and the attachments kept.
+            (2.5, connection.response(build_frame(2, hessian_int(4) + param + b"H\x04zone\x01aZ", 0x02, 20))),
+        ])
+        parser = CollectingParser(file, {PORT}, headers_only=True)
+        parser.parse()
+        document = parser.documents[0]
+        assert document["method_name"] == "echo" and document["cost_time_ms"] == 500
+        assert json.loads(document["request_attachments"]) == {"traceId": "t"}
+        assert "parameters" not in document and "result" not in document
+        document = parser.documents[1]
+        assert json.loads(document["response_attachments"]) == {"zone": "a"} and "result" not in document
+
+    def test_back_references_are_dumped_once(self, tmp_path):
+        # the second parameter is the map of the first, the result an object referring to itself.
+        params = b"\x79H\x01a\x91Z" + b"\x51\x91"
+        body = request_body("org.demo.EchoService", "echo", "Ljava/util/List;Ljava/util/Map;", params)
+        result = b"C\x04Node\x91\x04next\x60\x51\x90"
+        connection = Connection(CLIENT, 40000, SERVER, PORT)
+        file = str(tmp_path / "dubbo.pcap")
+        write_pcap(file, [
+            (1.0, connection.request(build_frame(1, body))),
+            (1.5, connection.response(build_frame(1, response_body(result), 0x02, 20))),
+        ])
+        for options in ({}, {"stream_threshold": 1}):
+            parser = CollectingParser(file, {PORT}, **options)
+            parser.parse()
+            document = parser.documents[0]
+            assert json.loads(document["parameters"]) == [[{"a": 1}], {"$ref": 1}]
+            assert json.loads(document["result"]) == {"next": {"$ref": 0}}
+
+    def test_large_frames_are_decoded_while_arriving(self, tmp_path):
+        text = "中文ab" * 10000
+        param = b"R\x80\x00" + text[:0x8000].encode() + b"S" + (len(text) - 0x8000).to_bytes(2, "big") \
+            + text[0x8000:].encode()
+        body = request_body("org.demo.UploadService", "upload", "Ljava/lang/String;", param)
+        frame = build_frame(1, body)
+        connection = Connection(CLIENT, 40000, SERVER, PORT)
+        packets = [(1.0 + i / 1000, connection.request(frame[i:i + 1400])) for i in range(0, len(frame), 1400)]
+        packets.append((2.0, connection.response(build_frame(1, response_body(hessian_string("ok")), 0x02, 20))))
+        file = str(tmp_path / "dubbo.pcap")
+        write_pcap(file, packets)
+        buffered = []
+
+        class WatchingParser(CollectingParser):
+            def on_packet(self, *args, **kwargs):
+                super().on_packet(*args, **kwargs)
+                buffered.append(self._buffered_bytes)
+
+        parser = WatchingParser(file, {PORT}, stream_threshold=4096)
+        parser.parse()
+        streamed = parser.documents
+        assert max(buffered) < 4096
+        parser = CollectingParser(file, {PORT})
+        parser.parse()
+        assert streamed == parser.documents
+        assert streamed[0]["method_name"] == "upload" and streamed[0]["end_time"] == 2.0
+        # a budget cuts the streamed body down to the same documents while it decodes.
+        budget = DecodeBudget(max_string_length=8)
+        parser = CollectingParser(file, {PORT}, stream_threshold=4096, decode_budget=budget)
+        parser.parse()
+        streamed = parser.documents
+        parser = CollectingParser(file, {PORT}, decode_budget=budget)
+        parser.parse()
+        assert streamed == parser.documents
+        assert json.loads(streamed[0]["parameters"]) == [{"$truncated": len(text) - 8, "prefix": text[:8]}]
+
+    def test_follow_keeps_channel_across_rotated_files(self, tmp_path):
+        body = request_body("org.demo.EchoService", "echo", "Ljava/lang/String;", hessian_string("hi"))
+        request = build_frame(1, body)
+        reply = build_frame(1, response_body(hessian_string("ok")), 0x02, 20)
+        connection = Connection(CLIENT, 40000, SERVER, PORT)
+        first, second = str(tmp_path / "dubbo-1.pcap"), str(tmp_path / "dubbo-2.pcap")
+        write_pcap(first, [(1.0, connection.request(request[:30]))])
+        write_pcap(second, [
+            (2.0, connection.request(request[30:])),
+            (3.0, connection.response(reply)),
+        ])
+        os.utime(first, (1, 1))
+        os.utime(second, (2, 2))
+        parser = CollectingParser(None, {PORT})
+        parser.follow(str(tmp_path), "dubbo-*.pcap", poll_interval=0.01, idle_timeout=0.05)
+        assert len(parser.documents) == 1
+        assert parser.documents[0]["start_time"] == 1.0
+        assert parser.documents[0]["end_time"] == 3.0
+
+    def test_multiple_ports_and_discovery(self, tmp_path):
+        body = request_body("org.demo.EchoService", "echo", "Ljava/lang/String;", hessian_string("hi"))
+        packets = []
+        for index, port in enumerate([20880, 20881, 30000]):
+            connection = Connection(CLIENT, 40000 + index, SERVER, port)
+            packets.append((index + 0.1, connection.response(build_frame(99, b"N", 0xe2))))
+            packets.append((index + 0.2, connection.request(build_frame(1, body))))
+            reply = build_frame(1, response_body(hessian_string(str(port))), 0x02, 20)
+            packets.append((index + 0.3, connection.response(reply)))
+        file = str(tmp_path / "dubbo.pcap")
+        write_pcap(file, packets)
+        assert discover_ports(file) == {20880, 20881, 30000}
+        parser = CollectingParser(file, {20880, 20881})
+        parser.parse()
+        assert [json.loads(d["result"]) for d in parser.documents] == ["20880", "20881"]
+        parser = CollectingParser(file, None)
+        parser.parse()
+        assert [d["dst_port"] for d in parser.documents] == [20880, 20881, 30000]
+        assert parser.ports == {20880, 20881, 30000}
+        # a seed from the pre-pass does not stop ports seen later from being detected.
+        parser = CollectingParser(file, {20880}, discover=True)
+        parser.parse()
+        assert [d["dst_port"] for d in parser.documents] == [20880, 20881, 30000]
+
+    def test_retransmitted_and_reordered_segments(self, tmp_path):
+        body = request_body("org.demo.EchoService", "echo", "Ljava/lang/String;", hessian_string("hi"))
+        requests = build_frame(1, body) + build_frame(2, body)
+        reply = build_frame(1, response_body(hessian_string("r1")), 0x02, 20) \
+            + build_frame(2, response_body(hessian_string("r2")), 0x02, 20)
+        connection = Connection(CLIENT, 40000, SERVER, PORT)
+        syn = connection.request(flags=TH_SYN)
+        connection.client_seq = connection.client_seq + 1
+        first = connection.request(requests[:40])
+        second = connection.request(requests[40:])
+        reply_first = connection.response(reply[:25])
+        reply_second = connection.response(reply[25:])
+        file = str(tmp_path / "dubbo.pcap")
+        write_pcap(file, [
+            (0.5, syn),
+            (1.0, second),
+            (1.1, first),
+            (1.2, first),
+            (2.0, reply_first),
+            (2.1, reply_first),
+            (2.2, reply_second),
+        ])
+        parser = CollectingParser(file, {PORT})
+        parser.parse()
+        assert [json.loads(d["result"]) for d in parser.documents] == ["r1", "r2"]
+        assert parser.documents[0]["start_time"] == 1.1
+
+    def test_lost_segment_resynchronises(self, tmp_path):
+        body = request_body("org.demo.EchoService", "echo", "Ljava/lang/String;", hessian_string("hi"))
+        connection = Connection(CLIENT, 40000, SERVER, PORT)
+        packets = [(0.5, connection.request(flags=TH_SYN))]
+        connection.client_seq = connection.client_seq + 1
+        first = build_frame(1, body)
+        # the head of the first frame is never captured.
+        connection.request(first[:20])
+        packets.append((1.0, connection.request(first[20:])))
+        for i in range(2, 6):
+            packets.append((float(i), connection.request(build_frame(i, body))))
+            reply = build_frame(i, response_body(hessian_string("ok")), 0x02, 20)
+            packets.append((i + 0.5, connection.response(reply)))
+        file = str(tmp_path / "dubbo.pcap")
+        write_pcap(file, packets)
+        parser = CollectingParser(file, {PORT}, reorder_budget=len(first) * 2)
+        parser.parse()
+        # the response to request 2 shows the server got past the hole, which releases the request.
+        assert [d["start_time"] for d in parser.documents] == [2.0, 3.0, 4.0, 5.0]
+
+    def test_lost_segment_on_quiet_connection(self, tmp_path):
+        body = request_body("org.demo.EchoService", "notify", "Ljava/lang/String;", hessian_string("hi"))
+        connection = Connection(CLIENT, 40000, SERVER, PORT)
+        packets = [(0.5, connection.request(flags=TH_SYN))]
+        connection.client_seq = connection.client_seq + 1
+        connection.request(build_frame(1, body, flag=0x82)[:20])
+        # one way calls a minute apart, far below the reorder budget.
+        for i in range(2, 5):
+            packets.append((i * 60.0, connection.request(build_frame(i, body, flag=0x82))))
+        file = str(tmp_path / "dubbo.pcap")
+        write_pcap(file, packets)
+        parser = CollectingParser(file, {PORT})
+        parser.parse()
+        # the hole is given up on when the next call arrives after the hole timeout.
+        assert [d["start_time"] for d in parser.documents] == [120.0, 180.0, 240.0]
+
+    def test_idle_and_oversized_flows_are_evicted(self, tmp_path):
+        body = request_body("org.demo.EchoService", "echo", "Ljava/lang/String;", hessian_string("hi"))
+        idle = Connection(CLIENT, 40000, SERVER, PORT)
+        busy = Connection(CLIENT, 40001, SERVER, PORT)
+        packets = [(1.0, idle.request(build_frame(1, body)))]
+        for i in range(2, 8):
+            packets.append((float(i * 10), busy.request(build_frame(i, body))))
+            reply = build_frame(i, response_body(hessian_string("ok")), 0x02, 20)
+            packets.append((i * 10 + 0.5, busy.response(reply)))
+        file = str(tmp_path / "dubbo.pcap")
+        write_pcap(file, packets)
+        parser = CollectingParser(file, {PORT}, idle_timeout=30)
+        parser.parse()
+        timed_out = [d for d in parser.documents if d.get("timeout")]
+        assert len(timed_out) == 1
+        assert timed_out[0]["src_port"] == 40000
+        assert timed_out[0]["end_time"] == 40.0
+        assert len(parser.documents) == 7
+        assert [format_flow_key(key) for key in parser._flows] == [f"{CLIENT}:40001->{SERVER}:{PORT}"]
+        parser = CollectingParser(file, {PORT}, max_buffered_bytes=len(build_frame(1, body)))
+        parser.parse()
+        # the parked request of the idle connection is dropped as soon as the busy one needs room.
+        assert parser.documents[0]["timeout"] and parser.documents[0]["end_time"] == 20.0
+        assert parser._buffered_bytes == 0
+
+    def test_one_way_events_and_unanswered_requests(self, tmp_path):
+        body = request_body("org.demo.EchoService", "echo", "Ljava/lang/String;", hessian_string("hi"))
+        connection = Connection(CLIENT, 40000, SERVER, PORT)
+        file = str(tmp_path / "dubbo.pcap")
+        write_pcap(file, [
+            (1.0, connection.request(build_frame(1, body, 0x82))),
+            (1.5, connection.request(build_frame(2, b"N", 0xe2))),
+            (1.6, connection.response(build_frame(2, b"N", 0x22, 20))),
+            (2.0, connection.request(build_frame(3, body))),
+            (5.0, connection.request(build_frame(4, body))),
+            (5.5, connection.response(build_frame(4, response_body(hessian_string("ok")), 0x02, 20))),
+            (9.0, connection.request(build_frame(5, body))),
+        ])
+        parser = CollectingParser(file, {PORT}, request_timeout=4)
+        parser.parse()
+        assert [(d["start_time"], d["end_time"]) for d in parser.documents] == [(1.0, 1.0), (5.0, 5.5), (2.0, 9.0)]
+        assert parser.documents[0]["one_way"] and "timeout" not in parser.documents[0]
+        assert parser.documents[2]["timeout"]
+        flow = parser._flows.get(next(iter(parser._flows)))
+        assert [request.request_id for request in flow.requests.values()] == [5]
+        # the parked body is copied out, so it does not keep the receive buffer alive beyond what is counted.
+        assert type(flow.requests[5].content) is bytes and flow.pending_bytes == len(body)
+
+    def test_undecodable_bodies_are_stored_with_an_error(self, tmp_path):
+        body = request_body("org.demo.EchoService", "echo", "Ljava/lang/String;", hessian_string("hi"))
+        connection = Connection(CLIENT, 40000, SERVER, PORT)
+        file = str(tmp_path / "dubbo.pcap")
+        write_pcap(file, [
+            (1.0, connection.request(build_frame(1, b"\x40\x40\x40", 0x82))),
+            (2.0, connection.request(build_frame(2, body))),
+            (2.5, connection.response(build_frame(2, b"\x91\x40", 0x02, 20))),
+            (3.0, connection.request(build_frame(3, body, 0x82))),
+        ])
+        parser = CollectingParser(file, {PORT})
+        parser.parse()
+        assert [d["start_time"] for d in parser.documents] == [1.0, 2.0, 3.0]
+        assert parser.decode_errors == 2
+        assert parser.documents[0]["decode_error"] == "request: expect 64"
+        # the request side of the second call is kept.
+        assert parser.documents[1]["method_name"] == "echo" and parser.documents[1]["parameters"] == '["hi"]'
+        assert parser.documents[1]["decode_error"].startswith("response: ")
+        assert "decode_error" not in parser.documents[2]
+
+
+class CollectingParallelParser(ParallelDubboPacketParser):
+
+    def __init__(self, file: str, ports: set[int] | None, workers: int):
+        super().__init__(file, ports, None, workers)
+        self.documents = []
+
+    def _try_append_flush(self, document: dict):
+        self.documents.append(document)
+
+
+class TestParallelDubboPacketParser:
+    """
+    test class for the flow sharded parser.
+    """
+
+    def test_connections_are_merged(self, tmp_path):
+        packets = []
+        for conn in range(8):
+            connection = Connection(CLIENT, 40000 + conn, SERVER, PORT)
+            body = request_body("org.demo.EchoService", "echo", "Ljava/lang/String;", hessian_string(f"c{conn}"))
+            for i in range(4):
+                ts = conn + i * 0.1
+                packets.append((ts, connection.request(build_frame(i, body))))
+                reply = build_frame(i, response_body(hessian_string(f"c{conn}-{i}")), 0x02, 20)
+                packets.append((ts + 0.05, connection.response(reply)))
+        file = str(tmp_path / "dubbo.pcap")
+        write_pcap(file, packets)
+        # segments are routed before the server port is known, both directions go to the same worker.
+        for ports in ({PORT}, None):
+            parser = CollectingParallelParser(file, ports, 3)
+            parser.parse()
+            assert len(parser.documents) == 32
+            for conn in range(8):
+                documents = [d for d in parser.documents if d["src_port"] == 40000 + conn]
+                assert [json.loads(d["result"]) for d in documents] == [f"c{conn}-{i}" for i in range(4)]
+                assert all(json.loads(d["parameters"]) == [f"c{conn}"] for d in documents)
+        assert shard_of(1, 40000, 2, PORT, 7) == shard_of(2, PORT, 1, 40000, 7)
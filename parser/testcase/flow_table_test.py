@@ -0,0 +1,33 @@
+#!/bin/python
+# -- coding: utf-8 --
+import socket
+
+from parser.dubbo_common import DubboChannel
+from parser.flow_table import Flow, FlowTable, flow_key, format_flow_key
+
+
+def ip(address: str) -> int:
+    return int.from_bytes(socket.inet_aton(address), "big")
+
+
+class TestFlowTable:
+    """
+    test class for the integer keyed flow table.
+    """
+
+    def test_key_round_trip(self):
+        key = flow_key(ip("10.0.0.1"), 40000, ip("192.168.255.2"), 20880)
+        assert format_flow_key(key) == "10.0.0.1:40000->192.168.255.2:20880"
+        assert key != flow_key(ip("10.0.0.1"), 40001, ip("192.168.255.2"), 20880)
+
+    def test_lookup_refreshes_order(self):
+        table = FlowTable()
+        for port in range(3):
+            table.add(port, Flow(DubboChannel(1, port, 2, 20880)))
+        assert table.lookup(0) is not None
+        assert table.lookup(9) is None
+        assert list(table) == [1, 2, 0]
+        key, flow = table.oldest()
+        assert key == 1 and flow.channel.src_port == 1
+        table.pop(1)
+        assert 1 not in table and len(table) == 2
@@ -0,0 +1,84 @@
+#!/bin/python
+# -- coding: utf-8 --
+import socket
+import struct
+
+from parser.dubbo_common import DubboChannel
+
+TH_FIN = 0x01
+TH_SYN = 0x02
+TH_RST = 0x04
+TH_PUSH = 0x08
+TH_ACK = 0x10
+
+
+def hessian_string(value: str) -> bytes:
+    encoded = value.encode("utf-8")
+    assert len(value) < 32
+    return bytes([len(value)]) + encoded
+
+
+def hessian_int(value: int) -> bytes:
+    if -0x10 <= value <= 0x2f:
+        return bytes([0x90 + value])
+    return b"I" + struct.pack(">i", value)
+
+
+def request_body(service: str, method: str, desc: str, params: bytes = b"", attachments: bytes = b"HZ") -> bytes:
+    return hessian_string("2.0.2") + hessian_string(service) + hessian_string("1.0.0") \
+        + hessian_string(method) + hessian_string(desc) + params + attachments
+
+
+def response_body(value: bytes) -> bytes:
+    return hessian_int(1) + value
+
+
+def build_frame(request_id: int, body: bytes, flag: int = 0xc2, status: int = 0) -> bytes:
+    return DubboChannel.HEADER.pack(DubboChannel.MAGIC_SHORT, flag, status, request_id, len(body)) + body
+
+
+def build_packet(src: str, sport: int, dst: str, dport: int, payload: bytes = b"",
+                 flags: int = TH_ACK | TH_PUSH, seq: int = 0) -> bytes:
+    tcp = struct.pack(">HHIIBBHHH", sport, dport, seq, 0, 5 << 4, flags, 65535, 0, 0)
+    total = 20 + len(tcp) + len(payload)
+    ip = struct.pack(
+        ">BBHHHBBH4s4s", 0x45, 0, total, 0, 0, 64, socket.IPPROTO_TCP, 0, socket.inet_aton(src), socket.inet_aton(dst)
+    )
+    eth = b"\x00" * 12 + b"\x08\x00"
+    return eth + ip + tcp + payload
+
+
+def write_pcap(path: str, packets: list[tuple[float, bytes]]):
+    with open(path, "wb") as f:
+        f.write(struct.pack("<IHHiIII", 0xa1b2c3d4, 2, 4, 0, 0, 65535, 1))
+        for ts, pkt in packets:
+            sec = int(ts)
+            usec = int(round((ts - sec) * 1000000))
+            f.write(struct.pack("<IIII", sec, usec, len(pkt), len(pkt)))
+            f.write(pkt)
+
+
+class Connection:
+    """
+    builds the packets of one tcp connection with running sequence numbers.
+    """
+
+    def __init__(self, client: str, client_port: int, server: str, server_port: int):
+        self.client = client
+        self.client_port = client_port
+        self.server = server
+        self.server_port = server_port
+        self.client_seq = 1000
+        self.server_seq = 50000
+
+    def request(self, payload: bytes = b"", flags: int = TH_ACK | TH_PUSH) -> bytes:
+        packet = build_packet(self.client, self.client_port, self.server, self.server_port, payload, flags,
+                              self.client_seq)
+        self.client_seq = self.client_seq + len(payload)
+        return packet
+
+    def response(self, payload: bytes = b"", flags: int = TH_ACK | TH_PUSH) -> bytes:
+        packet = build_packet(self.server, self.server_port, self.client, self.client_port, payload, flags,
+                              self.server_seq)
+        self.server_seq = self.server_seq + len(payload)
+        return packet
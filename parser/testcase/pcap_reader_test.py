@@ -0,0 +1,75 @@
+#!/bin/python
+# -- coding: utf-8 --
+import os
+import socket
+
+from parser.pcap_reader import MmapPcapReader, PcapFollower, open_pcap
+from parser.testcase.packets import build_packet, write_pcap, TH_ACK, TH_FIN
+
+
+class TestMmapPcapReader:
+    """
+    test class for the raw header pcap reader.
+    """
+
+    def test_only_dubbo_segments_are_yielded(self, tmp_path):
+        vlan = build_packet("10.0.0.1", 40001, "10.0.0.2", 20880, b"vlan")
+        vlan = vlan[:12] + b"\x81\x00\x00\x01" + vlan[12:]
+        packets = [
+            (1.25, build_packet("10.0.0.1", 40000, "10.0.0.2", 20880, b"request")),
+            (1.5, build_packet("10.0.0.2", 20880, "10.0.0.1", 40000, flags=TH_ACK)),
+            (1.75, build_packet("10.0.0.1", 40000, "10.0.0.3", 8080, b"http")),
+            (2.0, b"\xff" * 12 + b"\x08\x06" + b"\x00" * 28),
+            (2.25, vlan),
+            (2.5, build_packet("10.0.0.2", 20880, "10.0.0.1", 40000, b"response", seq=7)),
+            (3.0, build_packet("10.0.0.1", 40000, "10.0.0.2", 20880, flags=TH_ACK | TH_FIN)),
+        ]
+        file = str(tmp_path / "dubbo.pcap")
+        write_pcap(file, packets)
+        segments = list(MmapPcapReader(file, {20880}))
+        assert [s.payload for s in segments] == [b"request", b"vlan", b"response", b""]
+        assert [s.ts for s in segments] == [1.25, 2.25, 2.5, 3.0]
+        response = segments[2]
+        assert socket.inet_ntoa(response.src_ip.to_bytes(4, "big")) == "10.0.0.2"
+        assert (response.src_port, response.dst_port, response.seq) == (20880, 40000, 7)
+        assert segments[3].flags & TH_FIN
+        assert len(list(open_pcap(file, None))) == 5
+
+    def test_truncated_file(self, tmp_path):
+        file = str(tmp_path / "dubbo.pcap")
+        write_pcap(file, [(1.0, build_packet("10.0.0.1", 40000, "10.0.0.2", 20880, b"request"))])
+        with open(file, "r+b") as f:
+            f.truncate(40 + 10)
+        assert list(MmapPcapReader(file, {20880})) == []
+
+
+class TestPcapFollower:
+    """
+    test class for following growing and rotated pcap files.
+    """
+
+    def test_growing_file(self, tmp_path):
+        file = str(tmp_path / "dubbo.pcap")
+        packets = [(float(i), build_packet("10.0.0.1", 40000, "10.0.0.2", 20880, f"p{i}".encode())) for i in range(4)]
+        write_pcap(file, packets)
+        with open(file, "rb") as f:
+            content = f.read()
+        # the last record is only half written when the follower starts.
+        with open(file, "wb") as f:
+            f.write(content[:-20])
+
+        def on_idle():
+            with open(file, "ab") as f:
+                f.write(content[-20:])
+
+        follower = PcapFollower(file, ports={20880}, poll_interval=0.01, idle_timeout=0.05, on_idle=on_idle)
+        assert [s.payload for s in follower] == [b"p0", b"p1", b"p2", b"p3"]
+
+    def test_rotated_files_in_order(self, tmp_path):
+        for index, name in enumerate(["dubbo-100.pcap", "dubbo-200.pcap", "dubbo-300.pcap"]):
+            path = str(tmp_path / name)
+            write_pcap(path, [(float(index), build_packet("10.0.0.1", 40000, "10.0.0.2", 20880, name.encode()))])
+            os.utime(path, (index + 1, index + 1))
+        write_pcap(str(tmp_path / "other.cap"), [(9.0, build_packet("10.0.0.1", 40000, "10.0.0.2", 20880, b"x"))])
+        follower = PcapFollower(None, str(tmp_path), "dubbo-*.pcap", {20880}, poll_interval=0.01, idle_timeout=0.05)
+        assert [s.payload for s in follower] == [b"dubbo-100.pcap", b"dubbo-200.pcap", b"dubbo-300.pcap"]
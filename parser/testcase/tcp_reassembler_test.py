@@ -0,0 +1,53 @@
+#!/bin/python
+# -- coding: utf-8 --
+from parser.tcp_reassembler import TcpReassembler
+
+
+class TestTcpReassembler:
+    """
+    test class for the tcp stream reassembler.
+    """
+
+    def test_reorder_and_overlap_across_wraparound(self):
+        stream = TcpReassembler(1024)
+        stream.open(0xfffffffd)
+        assert stream.push(0xfffffffe, b"abcd", 1.0) == [(1.0, b"abcd")]
+        assert stream.push(6, b"ijkl", 2.0) == []
+        assert stream.buffered_bytes == 4
+        # overlaps the first segment and fills the hole.
+        assert stream.push(0, b"cdefgh", 3.0) == [(3.0, b"efgh"), (2.0, b"ijkl")]
+        assert stream.push(0xfffffffe, b"abcd", 4.0) == []
+        assert stream.duplicate_bytes == 6
+        assert stream.buffered_bytes == 0
+
+    def test_gap_after_budget(self):
+        stream = TcpReassembler(8)
+        stream.open(99)
+        assert stream.push(110, b"12345", 1.0) == []
+        assert stream.push(115, b"6789", 2.0) == [(2.0, None), (1.0, b"12345"), (2.0, b"6789")]
+        assert stream.missing_bytes == 10
+        assert stream.next_seq == 119
+
+    def test_gap_after_timeout_and_segment_count(self):
+        stream = TcpReassembler(1024, hole_timeout=3.0, max_held_segments=2)
+        stream.open(99)
+        assert stream.push(110, b"ab", 1.0) == []
+        assert stream.push(112, b"cd", 4.0) == []
+        # a quiet stream gives up on the hole with its next segment after the timeout.
+        assert stream.push(120, b"ef", 4.5) == [(4.5, None), (1.0, b"ab"), (4.0, b"cd")]
+        assert stream.next_seq == 114 and stream.holding
+        assert stream.push(130, b"gh", 5.0) == []
+        assert stream.push(140, b"ij", 5.0) == [(5.0, None), (4.5, b"ef")]
+        assert stream.give_up(5.0) == [(5.0, None), (5.0, b"gh")]
+        assert stream.give_up(5.0) == [(5.0, None), (5.0, b"ij")] and not stream.holding
+        assert stream.missing_bytes == 10 + 6 + 8 + 8
+
+    def test_drains_many_held_segments(self):
+        stream = TcpReassembler(1 << 30, max_held_segments=1 << 20)
+        stream.open(0xffff0000)
+        segments = [(0xffff0001 + i * 4) % (1 << 32) for i in range(50000)]
+        for seq in reversed(segments[1:]):
+            assert stream.push(seq, b"abcd", 1.0) == []
+        ready = stream.push(segments[0], b"abcd", 1.0)
+        assert len(ready) == 50000 and stream.buffered_bytes == 0
+        assert stream.next_seq == (0xffff0001 + 50000 * 4) % (1 << 32)